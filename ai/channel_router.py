@@ -0,0 +1,250 @@
+"""
+Local routing for "which channel should I use for X" questions.
+
+Every channel becomes one TF-IDF centroid built from its name, category and
+topic, plus the sentences of the knowledge docs that mention it as #channel.
+A routing question is scored against all centroids with one vectorized
+product, which takes well under a millisecond. The bot answers with a
+channel mention when the best channel is a clear winner (cosine similarity
+at least ROUTER_CONFIDENCE). Otherwise it falls back to the LLM.
+"""
+
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from knowledge.search_index import tokenize
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity between a question and the best channel to answer locally
+ROUTER_CONFIDENCE = float(os.getenv("ROUTER_CONFIDENCE", "0.3"))
+# The best channel must score this many times higher than the runner-up
+MIN_MARGIN = 1.3
+# Channel name terms count this many times as much as description terms
+NAME_WEIGHT = 3
+
+# Questions asking where something belongs, e.g. "where do I post internship offers?"
+_ROUTING_QUESTION_RE = re.compile(
+    r"\b(?:which|what|right|best)\s+channel\b"
+    r"|\bwhere\b.*\b(?:post|ask|put|share|go|talk|discuss|send|advertise|find)\b",
+    re.IGNORECASE,
+)
+# Terms every routing question uses, which say nothing about the topic
+ROUTING_TERMS = frozenset(tokenize(
+    "post posting ask asking put share go talk discuss send advertise find channel question "
+    "place right best server thing stuff help thank please"
+))
+
+_CHANNEL_MENTION_RE = re.compile(r"#([a-z0-9][a-z0-9_-]*)")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n")
+
+_routed_total = REGISTRY.counter("router_routed_total", "Routing questions answered locally with a channel")
+_fallback_total = REGISTRY.counter("router_fallback_total", "Routing questions passed to the LLM (low confidence)")
+REGISTRY.gauge("router_hit_rate", "Share of routing questions answered locally",
+               fn=lambda: _routed_total.value() / max(1.0, _routed_total.value() + _fallback_total.value()))
+
+@dataclass
+class ChannelProfile:
+    """A channel the router can suggest."""
+    name: str
+    mention: str
+    topic: str = ""
+    category: str = ""
+    id: Optional[int] = None
+
+@dataclass
+class Route:
+    """A routing decision: the suggested channel and how sure the router is."""
+    channel: ChannelProfile
+    confidence: float
+    description: str = ""
+
+    def answer(self) -> str:
+        """The reply sent to the user."""
+        if self.description:
+            return f"Try posting in {self.channel.mention}: {self.description}"
+        return f"Try posting in {self.channel.mention}."
+
+def is_routing_question(question: str) -> bool:
+    """True if the question asks where something should be posted."""
+    return bool(_ROUTING_QUESTION_RE.search(question))
+
+def channel_mentions(paragraphs: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Collect the sentences of the knowledge docs that mention each #channel.
+
+    Args:
+        paragraphs: Knowledge base paragraphs
+
+    Returns:
+        Dict[str, List[str]]: Channel name to the sentences describing it
+    """
+    mentions: Dict[str, List[str]] = defaultdict(list)
+    for paragraph in paragraphs:
+        if "#" not in paragraph:
+            continue
+        for sentence in _SENTENCE_SPLIT_RE.split(paragraph):
+            for name in set(_CHANNEL_MENTION_RE.findall(sentence.lower())):
+                mentions[name].append(sentence.strip())
+    return mentions
+
+def knowledge_channels(paragraphs: Iterable[str]) -> List[ChannelProfile]:
+    """Channels the knowledge docs mention, for routing where no live channel list exists (DMs)."""
+    return [ChannelProfile(name, f"#{name}") for name in sorted(channel_mentions(paragraphs))]
+
+def _terms(text: str) -> List[str]:
+    return [term for term in tokenize(text.replace("-", " ").replace("_", " ")) if term not in ROUTING_TERMS]
+
+def _short_description(channel: ChannelProfile, lines: Sequence[str], limit: int = 200) -> str:
+    text = channel.topic or (lines[0] if lines else "")
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+class ChannelRouter:
+    """
+    Nearest-centroid classifier from questions to channels.
+
+    The centroids are L2-normalized TF-IDF vectors stored as one float32
+    matrix (channels x vocabulary), so a question's cosine similarity to
+    every channel is a sum over the columns of its terms.
+    """
+
+    def __init__(self, channels: List[ChannelProfile], descriptions: List[str], vocabulary: Dict[str, int],
+                 idf: np.ndarray, matrix: np.ndarray, threshold: float = ROUTER_CONFIDENCE):
+        self.channels = channels
+        self.descriptions = descriptions
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.matrix = matrix
+        self.threshold = threshold
+
+    @classmethod
+    def build(cls, channels: Sequence[ChannelProfile], knowledge: Iterable[str] = (),
+              threshold: float = ROUTER_CONFIDENCE) -> "ChannelRouter":
+        """
+        Build centroids for channels from their names, topics and knowledge doc mentions.
+
+        Args:
+            channels: The channels to route between
+            knowledge: Knowledge base paragraphs; sentences mentioning #channel describe it
+            threshold: Minimum confidence to answer locally
+
+        Returns:
+            ChannelRouter: The router
+        """
+        mentions = channel_mentions(knowledge)
+        channels = list(channels)
+        documents: List[Counter] = []
+        descriptions: List[str] = []
+        for channel in channels:
+            lines = mentions.get(channel.name.lower(), [])
+            terms = Counter(_terms(" ".join([channel.category, channel.topic, *lines])))
+            for term in _terms(channel.name):
+                terms[term] += NAME_WEIGHT
+            documents.append(terms)
+            descriptions.append(_short_description(channel, lines))
+
+        document_frequency = Counter(term for terms in documents for term in terms)
+        vocabulary = {term: i for i, term in enumerate(sorted(document_frequency))}
+        idf = np.zeros(len(vocabulary), dtype=np.float32)
+        for term, i in vocabulary.items():
+            idf[i] = math.log((1 + len(documents)) / (1 + document_frequency[term])) + 1
+
+        matrix = np.zeros((len(channels), len(vocabulary)), dtype=np.float32)
+        for row, terms in enumerate(documents):
+            for term, count in terms.items():
+                matrix[row, vocabulary[term]] = (1 + math.log(count)) * idf[vocabulary[term]]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return cls(channels, descriptions, vocabulary, idf, matrix, threshold)
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+    def scores(self, question: str) -> np.ndarray:
+        """Cosine similarity of the question to every channel."""
+        terms = Counter(_terms(question))
+        counts = {self.vocabulary[term]: count for term, count in terms.items() if term in self.vocabulary}
+        if not counts:
+            return np.zeros(len(self.channels), dtype=np.float32)
+        columns = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+        weights = np.fromiter((1 + math.log(count) for count in counts.values()), dtype=np.float32,
+                              count=len(counts)) * self.idf[columns]
+        # Words no channel uses still count towards the question's length (at the rarest-term
+        # weight), so a long question that shares one word with a channel is not a confident match
+        unknown = sum((1 + math.log(count)) ** 2 for term, count in terms.items() if term not in self.vocabulary)
+        norm = math.sqrt(float(weights @ weights) + unknown * float(self.idf.max()) ** 2)
+        return self.matrix[:, columns] @ (weights / norm)
+
+    def classify(self, question: str) -> Optional[Route]:
+        """
+        The best channel for a question, whatever the confidence.
+
+        Args:
+            question: The user's question
+
+        Returns:
+            Optional[Route]: The best channel, or None if no channel shares a term with the question
+        """
+        if not self.channels:
+            return None
+        scores = self.scores(question)
+        if len(scores) > 1:
+            second, best = np.argpartition(scores, -2)[-2:]
+            margin_ok = scores[best] >= MIN_MARGIN * scores[second]
+        else:
+            best, margin_ok = 0, True
+        if scores[best] <= 0:
+            return None
+        # Without a clear winner the confidence is reported as 0
+        confidence = float(scores[best]) if margin_ok else 0.0
+        return Route(self.channels[best], confidence, self.descriptions[best])
+
+    def route(self, question: str) -> Optional[Route]:
+        """
+        Answer a routing question locally if the router is confident.
+        A returned route only counts as routed once the caller calls record_routed.
+
+        Args:
+            question: The user's question
+
+        Returns:
+            Optional[Route]: The channel to suggest, or None if the LLM should answer
+        """
+        if not is_routing_question(question):
+            return None
+        start = time.perf_counter()
+        route = self.classify(question)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if route is None or route.confidence < self.threshold:
+            record_fallback()
+            return None
+        logger.debug(f"Routed to #{route.channel.name} (confidence {route.confidence:.2f}, {elapsed_ms:.3f} ms)")
+        return route
+
+def record_routed():
+    """Count a routing question that was answered with a channel."""
+    _routed_total.inc()
+
+def record_fallback():
+    """Count a routing question passed to the LLM instead (low confidence or unusable channel)."""
+    _fallback_total.inc()
+
+def get_router_stats() -> Dict[str, float]:
+    """
+    Get routing counters.
+
+    Returns:
+        Dict with questions routed locally, fallbacks to the LLM and the hit rate
+    """
+    routed, fallback = _routed_total.value(), _fallback_total.value()
+    return {"routed": routed, "fallback": fallback, "hit_rate": routed / max(1.0, routed + fallback)}
@@ -0,0 +1,155 @@
+"""
+Token-budget-aware packing of knowledge passages into the prompt.
+
+Passages arrive ranked best-first. They are added whole while they fit in
+the token budget, near-duplicates are skipped, and a passage that does not
+fit is cut at a sentence boundary rather than mid-word. Tokens are counted
+with tiktoken when it is installed, otherwise with a conservative offline
+estimate. tiktoken may download its encoding the first time it is used, so
+`warm_up` loads it from a thread at startup.
+"""
+
+import logging
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Passages sharing this fraction of their word shingles are treated as duplicates
+DUPLICATE_THRESHOLD = 0.8
+
+# Do not bother adding a trimmed passage shorter than this many tokens
+MIN_PASSAGE_TOKENS = 20
+
+# Loaded encoders by model (None where tiktoken or the encoding is unavailable)
+_encoders: Dict[str, Optional[Callable[[str], list]]] = {}
+_encoders_lock = threading.Lock()
+
+def _load_encoder(model: str) -> Optional[Callable[[str], list]]:
+    """Load the tiktoken encoder for a model, or None if tiktoken or its encoding is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(model).encode
+    except Exception as e:
+        logger.info(f"tiktoken unavailable for {model}, using approximate token counts: {e}")
+        return None
+
+def _get_encoder(model: str) -> Optional[Callable[[str], list]]:
+    if model not in _encoders:
+        with _encoders_lock:
+            if model not in _encoders:
+                _encoders[model] = _load_encoder(model)
+    return _encoders[model]
+
+def encoder_loaded(model: str) -> bool:
+    """Whether counting tokens for a model is known not to block on loading (or downloading) its encoding."""
+    return model in _encoders
+
+def warm_up(model: str = "gpt-3.5-turbo") -> bool:
+    """
+    Load a model's tokenizer ahead of the first question. Blocking: run it in a thread.
+
+    Args:
+        model: The model whose tokenizer should be loaded
+
+    Returns:
+        bool: True if tiktoken is used, False if token counts are estimated
+    """
+    return _get_encoder(model) is not None
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    Count the tokens a text will use in the prompt.
+
+    Args:
+        text: The text to count
+        model: The model whose tokenizer should be used
+
+    Returns:
+        int: The token count (an upper-leaning estimate without tiktoken)
+    """
+    encode = _get_encoder(model)
+    if encode is not None:
+        return len(encode(text))
+    # Words and punctuation are roughly one token each; long words split into ~4-char pieces
+    return max(len(_WORD_RE.findall(text)), (len(text) + 3) // 4)
+
+def _shingles(text: str, size: int = 3) -> Set[tuple]:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _is_duplicate(shingles: Set[tuple], kept: List[Set[tuple]]) -> bool:
+    """Whether a passage overlaps an already kept one by at least DUPLICATE_THRESHOLD."""
+    for other in kept:
+        overlap = len(shingles & other)
+        if overlap and overlap / min(len(shingles), len(other)) >= DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+def _trim_to_budget(passage: str, budget: int, model: str) -> str:
+    """Keep whole sentences from the start of a passage while they fit in the budget, with their original separators."""
+    used = 0
+    start = end = 0
+    for match in [*_SENTENCE_END_RE.finditer(passage), None]:
+        stop = match.start() if match is not None else len(passage)
+        cost = count_tokens(passage[start:stop], model) + 1
+        if used + cost > budget:
+            break
+        used += cost
+        end = stop
+        if match is None:
+            break
+        start = match.end()
+    # Slicing the original keeps newlines and list layout between the kept sentences
+    return passage[:end]
+
+def pack_context(passages: Sequence[str], budget: int, model: str = "gpt-3.5-turbo",
+                 separator: str = "\n\n") -> Optional[str]:
+    """
+    Pack ranked passages into at most `budget` tokens.
+
+    Args:
+        passages: Candidate passages, best first
+        budget: Maximum tokens for the packed context
+        model: The model whose tokenizer should be used
+        separator: Text placed between passages
+
+    Returns:
+        The packed context, or None if nothing fits
+    """
+    separator_tokens = count_tokens(separator, model)
+    packed: List[str] = []
+    kept_shingles: List[Set[tuple]] = []
+    used = 0
+
+    for passage in passages:
+        passage = passage.strip()
+        if not passage:
+            continue
+
+        shingles = _shingles(passage)
+        if _is_duplicate(shingles, kept_shingles):
+            continue
+
+        remaining = budget - used - (separator_tokens if packed else 0)
+        if remaining < MIN_PASSAGE_TOKENS:
+            break
+
+        cost = count_tokens(passage, model)
+        if cost > remaining:
+            passage = _trim_to_budget(passage, remaining, model)
+            if not passage or count_tokens(passage, model) < MIN_PASSAGE_TOKENS:
+                continue
+            cost = count_tokens(passage, model)
+
+        packed.append(passage)
+        kept_shingles.append(shingles)
+        used += cost + (separator_tokens if len(packed) > 1 else 0)
+
+    return separator.join(packed) if packed else None
@@ -1,15 +1,24 @@
+import asyncio
 import os
 import logging
-from openai import OpenAI
-import asyncio
-from typing import Optional
+import threading
+import time
+from functools import partial
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Hashable, List, Optional, Sequence, Union
 from dotenv import load_dotenv
 
+from ai.context_packer import encoder_loaded, pack_context, warm_up as warm_up_encoder
+from ai.resilience import BudgetExceeded, CircuitBreaker, CircuitOpen, LatencyWindow, hedged
+from ai.response_cache import ResponseCache, cache_key
+from ai.scheduler import OpenAIScheduler, SchedulerBusy
+from utils.metrics import REGISTRY, span
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
 # Load environment variables
 load_dotenv()
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Get API key from environment
@@ -17,13 +26,168 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     logger.warning("OPENAI_API_KEY not found in environment variables. OpenAI functionality will not work.")
 
-async def generate_response(question: str, knowledge: Optional[str] = None) -> str:
+# Connection pool settings for the shared HTTP client
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+REQUEST_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+
+# Chat model and completion length
+MODEL = "gpt-3.5-turbo"  # Can use gpt-4o if available in your account
+MAX_TOKENS = 500
+
+# Cheaper/faster model raced against MODEL when it is slow (e.g. gpt-4o-mini; empty disables hedging)
+HEDGE_MODEL = os.getenv("OPENAI_HEDGE_MODEL", "")
+# The hedge starts once MODEL has taken longer than this percentile of its recent latencies...
+HEDGE_PERCENTILE = float(os.getenv("OPENAI_HEDGE_PERCENTILE", "0.95"))
+# ...or this many seconds, until enough latencies have been seen
+HEDGE_DELAY = float(os.getenv("OPENAI_HEDGE_DELAY", "2"))
+
+# Seconds a question may wait for a model before the top knowledge passages are sent instead (0 = no limit)
+LATENCY_BUDGET = float(os.getenv("ASK_LATENCY_BUDGET", "0"))
+# Passages quoted in a retrieval-only answer
+FALLBACK_PASSAGES = int(os.getenv("FALLBACK_PASSAGES", "3"))
+
+# Consecutive failures (or budget overruns) that open a model's circuit, and seconds before it is retried
+BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+
+# Token budget for knowledge passages added to the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+
+# Static system preamble; kept byte-identical across requests so provider-side prompt caching applies
+SYSTEM_PROMPT = "You are StudentHub Assistant, a helpful AI that provides information about the StudentHub Discord server. Your goal is to assist users in finding the right channels for their questions and understanding server guidelines."
+
+# Answer given when too many questions are queued for OpenAI
+BUSY_MESSAGE = "I'm getting a lot of questions right now. Please try again in a minute!"
+
+# Answer given when no model answered and there are no knowledge passages to fall back on
+ERROR_MESSAGE = "I'm sorry, I couldn't generate an answer right now. Please try again in a minute!"
+
+# Heading of a retrieval-only answer
+FALLBACK_INTRO = "I couldn't put together a full answer right now, but here is what the StudentHub guide says:"
+
+# Long-lived async client, created once by init_client() (possibly from a warm-up thread)
+_client: Optional["AsyncOpenAI"] = None
+_client_lock = threading.Lock()
+
+# Cache of generated answers (ANSWER_CACHE_TTL=0 disables it)
+_response_cache = ResponseCache(
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", "5000000")),
+    path=os.getenv("ANSWER_CACHE_PATH") or None
+)
+
+# Rate-limited, per-guild fair queue in front of every OpenAI call
+_scheduler = OpenAIScheduler(
+    requests_per_minute=float(os.getenv("OPENAI_RPM", "500")),
+    tokens_per_minute=float(os.getenv("OPENAI_TPM", "60000")),
+    max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("OPENAI_QUEUE_SIZE", "100")),
+    max_queue_per_key=int(os.getenv("OPENAI_QUEUE_SIZE_PER_GUILD", "20")),
+    max_wait=float(os.getenv("OPENAI_MAX_QUEUE_WAIT", "20"))
+)
+
+# Per-model circuit breakers and recent latencies of successful calls
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyWindow] = {}
+
+# Metrics for the answer pipeline (served by utils.metrics)
+_errors_total = REGISTRY.counter("openai_errors_total", "OpenAI calls that failed after retries")
+_rejected_total = REGISTRY.counter("openai_rejected_total", "Questions rejected because the OpenAI queue was busy")
+REGISTRY.counter("openai_rate_limited_total", "429 responses from OpenAI", fn=lambda: _scheduler.rate_limited)
+REGISTRY.gauge("openai_queue_depth", "OpenAI calls waiting in the queue", fn=lambda: _scheduler.pending)
+REGISTRY.gauge("openai_in_flight", "OpenAI calls in flight", fn=lambda: _scheduler.in_flight)
+_hedged_total = REGISTRY.counter("openai_hedged_total", "Completions for which a hedge request was sent")
+_hedge_wins_total = REGISTRY.counter("openai_hedge_wins_total", "Completions answered by the hedge model")
+_fallback_total = REGISTRY.counter("answer_fallback_total", "Questions answered with retrieved passages instead of a model")
+REGISTRY.counter("answer_cache_hits_total", "Answers served from the cache", fn=lambda: _response_cache.hits)
+REGISTRY.counter("answer_cache_misses_total", "Answer cache lookups that missed", fn=lambda: _response_cache.misses)
+
+def init_client() -> "AsyncOpenAI":
+    """
+    Create the shared OpenAI client and its HTTP connection pool.
+    Safe to call more than once, from any thread; later calls return the existing client.
+    The openai and httpx packages are imported here rather than at startup.
+    
+    Returns:
+        AsyncOpenAI: The shared client
+    """
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            import httpx
+            from openai import AsyncOpenAI
+            
+            # Passing our own httpx client also avoids the proxies argument that
+            # breaks some openai/httpx version combinations
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+            )
+            # Retries are handled by the scheduler, which honors Retry-After across all calls
+            _client = AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+            logger.info(f"Created OpenAI client (max {MAX_CONNECTIONS} connections)")
+    return _client
+
+async def close_client():
+    """Close the shared OpenAI client and release its connections."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+        logger.info(f"Closed OpenAI client (answer cache: {get_cache_stats()})")
+
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Get answer cache counters.
+    
+    Returns:
+        Dict with hits, misses, hit rate, size and the latency/tokens saved
+    """
+    return _response_cache.stats()
+
+def get_resilience_stats() -> Dict[str, Any]:
+    """
+    Get hedging, fallback and circuit breaker state.
+    
+    Returns:
+        Dict with hedges sent and won, fallbacks by reason and each model's circuit state
+    """
+    return {
+        "hedged": _hedged_total.value(),
+        "hedge_wins": _hedge_wins_total.value(),
+        "fallbacks": {reason: _fallback_total.value(reason=reason) for reason in ("budget", "circuit_open", "error")},
+        "circuits": {model: breaker.state for model, breaker in _breakers.items()},
+    }
+
+def get_scheduler_stats() -> Dict[str, Any]:
+    """
+    Get OpenAI request queue counters.
+    
+    Returns:
+        Dict with queue depth, in-flight calls, wait times, rejections and 429s
+    """
+    return _scheduler.stats()
+
+async def generate_response(question: str, knowledge: Union[str, Sequence[str], None] = None,
+                            queue_key: Optional[Hashable] = None) -> str:
     """
     Generate a response to a user's question using OpenAI's API.
     
     Args:
         question: The user's question
-        knowledge: Optional knowledge context from Google Docs
+        knowledge: Optional knowledge context from Google Docs, either a string
+            or ranked passages to pack into the context token budget
+        queue_key: Fairness key for the request queue (e.g. the guild ID)
         
     Returns:
         A string response to the question
@@ -33,59 +197,316 @@ async def generate_response(question: str, knowledge: Optional[str] = None) -> s
         if not api_key:
             return "Error: OpenAI API key is not properly configured. Please check your .env file."
             
-        # Create a system prompt that explains the bot's purpose and includes knowledge if available
-        system_message = {
-            "role": "system", 
-            "content": "You are StudentHub Assistant, a helpful AI that provides information about the StudentHub Discord server. Your goal is to assist users in finding the right channels for their questions and understanding server guidelines."
-        }
+        passages = knowledge
+        with span("prompt"):
+            knowledge = await _prepare_knowledge_off_loop(knowledge)
         
-        # Add context from knowledge base if available
-        if knowledge:
-            system_message["content"] += f"\n\nHere is some relevant information about StudentHub that might help with answering:\n{knowledge}"
+        # Reuse a previous answer to the same question with the same context
+        key = cache_key(question, knowledge)
+        with span("cache"):
+            cached = await _response_cache.get(key)
+        if cached is not None:
+            return cached
         
-        # Create the user message
-        user_message = {
-            "role": "user",
-            "content": question
-        }
+        start = time.perf_counter()
+        with span("openai"):
+            completion = await _complete(_build_messages(question, knowledge), queue_key)
+        answer = completion.choices[0].message.content
+        # A blank completion is not cached, or every later identical question would get it too
+        if not answer or not answer.strip():
+            logger.warning("OpenAI returned an empty answer, answering from the knowledge base")
+            return _fallback_answer(passages, "error")
         
-        # Run the API call in a thread to avoid blocking
-        return await asyncio.to_thread(
-            _call_openai_api,
-            messages=[system_message, user_message]
-        )
+        tokens = completion.usage.total_tokens if completion.usage else 0
+        await _response_cache.set(key, answer, cost_seconds=time.perf_counter() - start, cost_tokens=tokens)
+        return answer
+    except SchedulerBusy as e:
+        logger.warning(f"Rejected question, OpenAI queue busy: {e}")
+        _rejected_total.inc()
+        return BUSY_MESSAGE
+    except BudgetExceeded:
+        logger.warning(f"No completion within the {LATENCY_BUDGET:g}s latency budget, answering from the knowledge base")
+        return _fallback_answer(passages, "budget")
+    except CircuitOpen as e:
+        logger.warning(f"{e}, answering from the knowledge base")
+        return _fallback_answer(passages, "circuit_open")
     except Exception as e:
         logger.error(f"Error generating response: {e}")
-        return f"I'm sorry, I encountered an error while generating a response: {str(e)}"
+        _errors_total.inc()
+        return _fallback_answer(passages, "error")
 
-def _call_openai_api(messages):
+async def generate_response_stream(question: str, knowledge: Union[str, Sequence[str], None] = None,
+                                   queue_key: Optional[Hashable] = None) -> AsyncIterator[str]:
     """
-    Call the OpenAI API synchronously.
+    Generate a response like generate_response, yielding text as it arrives.
+    A cached answer is yielded in one piece. LATENCY_BUDGET bounds the wait
+    for the first piece of text; streams are not hedged.
+    
+    Args:
+        question: The user's question
+        knowledge: Optional knowledge context (a string or ranked passages)
+        queue_key: Fairness key for the request queue (e.g. the guild ID)
+        
+    Yields:
+        str: Successive pieces of the response
+    """
+    if not api_key:
+        yield "Error: OpenAI API key is not properly configured. Please check your .env file."
+        return
+        
+    passages = knowledge
+    with span("prompt"):
+        knowledge = await _prepare_knowledge_off_loop(knowledge)
+    key = cache_key(question, knowledge)
+    with span("cache"):
+        cached = await _response_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+        
+    start = time.perf_counter()
+    parts: List[str] = []
+    breaker = _breaker(MODEL)
+    deadline = asyncio.get_running_loop().time() + LATENCY_BUDGET if LATENCY_BUDGET > 0 else None
+    stream = None
+    permitted = verdict = False
+    try:
+        permitted = breaker.allow()
+        if not permitted:
+            raise CircuitOpen(f"Circuit for {MODEL} is open")
+        stream = await _within(deadline, _call_openai_api(messages=_build_messages(question, knowledge),
+                                                          stream=True, queue_key=queue_key))
+        chunks = stream.__aiter__()
+        while True:
+            try:
+                # Once text is flowing the user sees progress, so only the first piece is timed
+                chunk = await (chunks.__anext__() if parts else _within(deadline, chunks.__anext__()))
+            except StopAsyncIteration:
+                break
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        breaker.record_success()
+        verdict = True
+    except SchedulerBusy as e:
+        logger.warning(f"Rejected question, OpenAI queue busy: {e}")
+        _rejected_total.inc()
+        yield BUSY_MESSAGE
+        return
+    except CircuitOpen as e:
+        logger.warning(f"{e}, answering from the knowledge base")
+        yield _fallback_answer(passages, "circuit_open")
+        return
+    except BudgetExceeded:
+        logger.warning(f"No streamed text within the {LATENCY_BUDGET:g}s latency budget, answering from the knowledge base")
+        breaker.record_failure()
+        verdict = True
+        yield _fallback_answer(passages, "budget")
+        return
+    except Exception as e:
+        logger.error(f"Error generating streamed response: {e}")
+        _errors_total.inc()
+        breaker.record_failure()
+        verdict = True
+        yield f"\n\n{ERROR_MESSAGE}" if parts else _fallback_answer(passages, "error")
+        return
+    finally:
+        # Only a call that got the breaker's permit may hand back a half-open trial slot
+        if permitted and not verdict:
+            breaker.release()
+        # Also runs when the reader stops early, so the HTTP response is closed and the slot freed
+        await _close_stream(stream)
+        
+    answer = "".join(parts)
+    if not answer.strip():
+        logger.warning("OpenAI streamed an empty answer, answering from the knowledge base")
+        yield _fallback_answer(passages, "error")
+        return
+    # Streamed completions do not report usage, so no token cost is recorded
+    await _response_cache.set(key, answer, cost_seconds=time.perf_counter() - start)
+
+def retrieval_answer(knowledge: Union[str, Sequence[str], None], limit: int = FALLBACK_PASSAGES) -> Optional[str]:
+    """
+    Answer with the top knowledge passages verbatim, for when no model can answer in time.
+    
+    Args:
+        knowledge: Ranked passages, or a knowledge string split on blank lines
+        limit: Maximum passages to quote
+        
+    Returns:
+        Optional[str]: The answer, or None if there is no knowledge to quote
+    """
+    if not knowledge:
+        return None
+    passages = knowledge.split("\n\n") if isinstance(knowledge, str) else knowledge
+    top = [passage.strip() for passage in passages if passage.strip()][:limit]
+    if not top:
+        return None
+    return FALLBACK_INTRO + "\n\n" + "\n\n".join(top)
+
+def _fallback_answer(knowledge: Union[str, Sequence[str], None], reason: str) -> str:
+    """The retrieval-only answer (never cached), or an apology when there is nothing to quote."""
+    _fallback_total.inc(reason=reason)
+    with span("fallback"):
+        return retrieval_answer(knowledge) or ERROR_MESSAGE
+
+def _breaker(model: str) -> CircuitBreaker:
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = _breakers[model] = CircuitBreaker(model, BREAKER_FAILURES, BREAKER_RESET)
+    return breaker
+
+def _latency(model: str) -> LatencyWindow:
+    window = _latencies.get(model)
+    if window is None:
+        window = _latencies[model] = LatencyWindow()
+    return window
+
+async def _within(deadline: Optional[float], awaitable):
+    """Await with the time left until a loop-time deadline, raising BudgetExceeded when it passes."""
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(0.0, deadline - asyncio.get_running_loop().time()))
+    except asyncio.TimeoutError:
+        raise BudgetExceeded("The latency budget ran out") from None
+
+async def _close_stream(stream):
+    """Close a completion stream's HTTP response so its connection returns to the pool."""
+    if stream is None:
+        return
+    try:
+        # The scheduler's stream wrapper also frees the call's slot; a bare AsyncStream has no close()
+        close = getattr(stream, "close", None)
+        if close is not None:
+            await close()
+        else:
+            await stream.response.aclose()
+    except Exception as e:
+        logger.debug(f"Error closing completion stream: {e}")
+
+async def _complete(messages: List[Dict[str, str]], queue_key: Optional[Hashable] = None):
+    """
+    Get a completion from MODEL, hedged with HEDGE_MODEL, within LATENCY_BUDGET.
+    
+    The hedge is sent once MODEL has been slower than HEDGE_PERCENTILE of its
+    recent calls, right away if MODEL fails, and instead of MODEL while its
+    circuit is open. The first completion wins and the other call is cancelled.
     
     Args:
         messages: The messages to send to the API
+        queue_key: Fairness key for the request queue
         
     Returns:
-        The generated text response
+        The chat completion
+        
+    Raises:
+        BudgetExceeded: If no model answered within LATENCY_BUDGET
+        CircuitOpen: If every model's circuit is open
+    """
+    models = [MODEL] + ([HEDGE_MODEL] if HEDGE_MODEL and HEDGE_MODEL != MODEL else [])
+    attempts = [(model, partial(_timed_call, model, messages, queue_key)) for model in models]
+    delay = _latency(MODEL).percentile(HEDGE_PERCENTILE, HEDGE_DELAY)
+    deadline = asyncio.get_running_loop().time() + LATENCY_BUDGET if LATENCY_BUDGET > 0 else None
+    model, completion = await hedged(attempts, {model: _breaker(model) for model in models}, delay, deadline,
+                                     neutral_errors=(SchedulerBusy,))
+    if model != MODEL:
+        _hedge_wins_total.inc()
+    return completion
+
+async def _timed_call(model: str, messages: List[Dict[str, str]], queue_key: Optional[Hashable]):
+    """Call one model, recording its latency for future hedge delays."""
+    if model != MODEL:
+        _hedged_total.inc()
+    start = time.perf_counter()
+    completion = await _call_openai_api(messages, queue_key=queue_key, model=model)
+    _latency(model).observe(time.perf_counter() - start)
+    return completion
+
+def warm_up_tokenizer() -> bool:
+    """Load the tokenizer used to pack the prompt (it may be downloaded on first use). Blocking: run it in a thread."""
+    return warm_up_encoder(MODEL)
+
+async def _prepare_knowledge_off_loop(knowledge: Union[str, Sequence[str], None]) -> Optional[str]:
+    """_prepare_knowledge, run in a thread while the tokenizer may still need to be loaded."""
+    if knowledge is None or isinstance(knowledge, str) or encoder_loaded(MODEL):
+        return _prepare_knowledge(knowledge)
+    return await asyncio.to_thread(_prepare_knowledge, knowledge)
+
+def _prepare_knowledge(knowledge: Union[str, Sequence[str], None]) -> Optional[str]:
+    """Pack ranked passages into the context token budget; strings pass through unchanged."""
+    if knowledge is None or isinstance(knowledge, str):
+        return knowledge or None
+    return pack_context(knowledge, CONTEXT_TOKEN_BUDGET, model=MODEL)
+
+def _build_messages(question: str, knowledge: Optional[str]) -> List[Dict[str, str]]:
+    """
+    Build the chat messages for a question.
+    
+    Args:
+        question: The user's question
+        knowledge: Optional knowledge context from Google Docs
+        
+    Returns:
+        The system and user messages
+    """
+    # The preamble comes first and never changes, so it forms a cacheable prompt prefix
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    
+    # Add context from knowledge base if available
+    if knowledge:
+        messages.append({
+            "role": "system",
+            "content": f"Here is some relevant information about StudentHub that might help with answering:\n{knowledge}"
+        })
+    
+    # Create the user message
+    messages.append({
+        "role": "user",
+        "content": question
+    })
+    
+    return messages
+
+def _estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Rough token estimate for rate limiting: ~4 characters per token plus the completion budget."""
+    return sum(len(message["content"]) for message in messages) // 4 + MAX_TOKENS
+
+async def _call_openai_api(messages, stream: bool = False, queue_key: Optional[Hashable] = None,
+                           model: str = MODEL):
+    """
+    Call the OpenAI API using the shared async client, through the rate-limited scheduler.
+    
+    Args:
+        messages: The messages to send to the API
+        stream: Whether to return an async stream of completion chunks
+        queue_key: Fairness key for the request queue
+        model: The chat model to use
+        
+    Returns:
+        The chat completion, or a stream of chunks if stream is True
     """
     try:
-        # Create a client with the API key - no additional parameters to avoid conflicts
-        # with different versions of the openai library
-        client = OpenAI(
-            api_key=api_key,
-            # No proxies or other additional parameters that might cause compatibility issues
-        )
+        client = init_client()
         
-        # Make the API call
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",  # Can use gpt-4o if available in your account
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500
+        # Make the API call once the scheduler grants a slot
+        return await _scheduler.submit(
+            queue_key,
+            _estimate_tokens(messages),
+            lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=MAX_TOKENS,
+                stream=stream
+            ),
+            stream=stream
         )
-        
-        # Extract and return the response
-        return completion.choices[0].message.content
+    except SchedulerBusy:
+        raise
     except Exception as e:
         logger.error(f"Error calling OpenAI API: {e}")
         raise 
\ No newline at end of file
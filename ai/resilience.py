@@ -0,0 +1,177 @@
+"""
+Latency and failure controls for OpenAI calls.
+
+`CircuitBreaker` stops sending traffic to a backend (a model) after
+consecutive failures, then lets a single trial call through once the
+reset timeout has passed. `LatencyWindow` keeps recent call latencies so
+a hedged request can be sent once the primary is slower than usual.
+`hedged` runs the primary, starts the hedge after a delay (or as soon as
+the primary fails), and returns whichever succeeds first within a deadline.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Type
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_circuit_state = REGISTRY.gauge("openai_circuit_open", "1 while a backend's circuit breaker is open")
+
+class CircuitOpen(Exception):
+    """Raised when every backend's circuit breaker is open."""
+
+class BudgetExceeded(Exception):
+    """Raised when no backend answered within the latency budget."""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Closed: calls pass. After `failure_threshold` failures in a row it opens
+    and rejects calls for `reset_timeout` seconds, then half-opens and lets
+    one trial call through: success closes it, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now; in half-open state only one trial call is allowed."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+            _circuit_state.set(0, backend=self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failure(s)")
+            self.opened_at = time.monotonic()
+            _circuit_state.set(1, backend=self.name)
+
+    def release(self):
+        """Give back a permit without a verdict, e.g. for a call cancelled because another one won."""
+        self._trial_running = False
+
+class LatencyWindow:
+    """Recent latencies of successful calls, for percentile hedge delays."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float, default: float) -> float:
+        """The given percentile of recent latencies, or `default` until there are enough samples."""
+        if len(self._samples) < self.min_samples:
+            return default
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def hedged(attempts: List[Tuple[str, Callable[[], Awaitable[Any]]]], breakers: Dict[str, CircuitBreaker],
+                 hedge_delay: float, deadline: Optional[float] = None,
+                 neutral_errors: Tuple[Type[BaseException], ...] = ()) -> Tuple[str, Any]:
+    """
+    Run the first attempt, adding the next one after `hedge_delay` or as soon as the previous fails.
+
+    Backends whose circuit is open are skipped. Attempts still running at the
+    deadline are counted as failures and cancelled; losers are cancelled
+    without a verdict.
+
+    Args:
+        attempts: (backend name, zero-argument coroutine factory), primary first
+        breakers: Circuit breaker for each backend name
+        hedge_delay: Seconds to wait for an attempt before starting the next one
+        deadline: Event loop time by which a result is needed, or None for no limit
+        neutral_errors: Errors that say nothing about the backend (e.g. a full local queue)
+            and do not count against its circuit
+
+    Returns:
+        Tuple[str, Any]: The backend that answered and its result
+
+    Raises:
+        CircuitOpen: If every backend's circuit is open
+        BudgetExceeded: If no attempt succeeded before the deadline
+        Exception: The last attempt's error, if every attempt failed
+    """
+    loop = asyncio.get_running_loop()
+    waiting = list(attempts)
+    running: Dict[asyncio.Task, str] = {}
+    last_error: Optional[BaseException] = None
+    next_start = loop.time()
+
+    def start_next():
+        while waiting:
+            name, factory = waiting.pop(0)
+            if breakers[name].allow():
+                running[asyncio.ensure_future(factory())] = name
+                return
+
+    try:
+        while True:
+            now = loop.time()
+            if waiting and (not running or now >= next_start):
+                start_next()
+                next_start = now + hedge_delay
+            if not running:
+                if last_error is not None:
+                    raise last_error
+                raise CircuitOpen("Every OpenAI backend's circuit breaker is open")
+
+            wake = min(next_start if waiting else float("inf"), deadline if deadline is not None else float("inf"))
+            done, _ = await asyncio.wait(running, timeout=None if wake == float("inf") else max(0.0, wake - loop.time()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                if task.exception() is None:
+                    breakers[name].record_success()
+                    return name, task.result()
+                last_error = task.exception()
+                if isinstance(last_error, neutral_errors):
+                    breakers[name].release()
+                else:
+                    breakers[name].record_failure()
+                # Start the next backend right away instead of waiting out the delay
+                next_start = loop.time()
+
+            if deadline is not None and loop.time() >= deadline and not done:
+                for name in running.values():
+                    breakers[name].record_failure()
+                raise BudgetExceeded("No OpenAI backend answered within the latency budget")
+    finally:
+        for task, name in running.items():
+            if not task.done():
+                task.cancel()
+                breakers[name].release()
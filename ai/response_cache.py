@@ -0,0 +1,224 @@
+"""
+Answer cache for generated responses.
+
+Entries are keyed on the normalized question plus a hash of the knowledge
+passages used to answer it, so editing a document automatically stops old
+answers from being served. The in-memory tier evicts by LRU, TTL and a
+byte budget; an optional SQLite file keeps answers across restarts and can
+be shared between processes.
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s#@-]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_question(question: str) -> str:
+    """
+    Reduce a question to a canonical form so trivial variations share an entry.
+
+    Args:
+        question: The user's question
+
+    Returns:
+        The lowercased question without punctuation or repeated whitespace
+    """
+    question = _PUNCTUATION_RE.sub(" ", question.lower())
+    return _WHITESPACE_RE.sub(" ", question).strip()
+
+def cache_key(question: str, knowledge: Optional[str]) -> str:
+    """
+    Build the cache key for a question and the knowledge it will be answered with.
+
+    Args:
+        question: The user's question
+        knowledge: The knowledge context passed to the model, if any
+
+    Returns:
+        str: A hex digest identifying the (question, context) pair
+    """
+    context_hash = hashlib.sha256((knowledge or "").encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{normalize_question(question)}\0{context_hash}".encode("utf-8")).hexdigest()
+
+class _DiskStore:
+    """SQLite backing store for cached answers (WAL mode, safe across processes)."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " cost_seconds REAL NOT NULL, cost_tokens INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_expires_at ON answers (expires_at)")
+
+    def get(self, key: str, now: float) -> Optional[Tuple[str, float, float, int]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT value, expires_at, cost_seconds, cost_tokens FROM answers WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+
+    def set(self, key: str, value: str, expires_at: float, cost_seconds: float, cost_tokens: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                (key, value, expires_at, cost_seconds, cost_tokens)
+            )
+
+    def purge_expired(self, now: float) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM answers WHERE expires_at <= ?", (now,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ResponseCache:
+    """
+    LRU + TTL cache of generated answers with a memory bound and optional disk tier.
+
+    Each entry remembers how long and how many tokens the original completion
+    took, so hits can be reported as latency and spend saved.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1000, max_bytes: int = 5_000_000,
+                 path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, expires_at, cost_seconds, cost_tokens)
+        self._entries: "OrderedDict[str, Tuple[str, float, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._disk = _DiskStore(path) if path else None
+        self._sets = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key) + len(value.encode("utf-8"))
+
+    def _remember(self, key: str, entry: Tuple[str, float, float, int]):
+        """Insert an entry in memory and evict until within bounds."""
+        if key in self._entries:
+            self._bytes -= self._size(key, self._entries.pop(key)[0])
+        size = self._size(key, entry[0])
+        if size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._bytes -= self._size(old_key, old_entry[0])
+            self.evictions += 1
+
+    def _record_hit(self, entry: Tuple[str, float, float, int]) -> str:
+        self.hits += 1
+        self.saved_seconds += entry[2]
+        self.saved_tokens += entry[3]
+        return entry[0]
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached answer.
+
+        Args:
+            key: A key from cache_key()
+
+        Returns:
+            The cached answer, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                return self._record_hit(entry)
+            self._bytes -= self._size(key, self._entries.pop(key)[0])
+
+        if self._disk is not None:
+            try:
+                entry = await asyncio.to_thread(self._disk.get, key, now)
+            except sqlite3.Error as e:
+                logger.error(f"Error reading answer cache: {e}")
+                entry = None
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, tuple(entry))
+                return self._record_hit(entry)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str, cost_seconds: float = 0.0, cost_tokens: int = 0):
+        """
+        Store an answer.
+
+        Args:
+            key: A key from cache_key()
+            value: The generated answer
+            cost_seconds: How long generating the answer took
+            cost_tokens: How many tokens generating the answer used
+        """
+        if not self.enabled:
+            return
+
+        entry = (value, time.time() + self.ttl, cost_seconds, cost_tokens)
+        self._remember(key, entry)
+
+        if self._disk is not None:
+            self._sets += 1
+            try:
+                await asyncio.to_thread(self._disk.set, key, *entry)
+                if self._sets % 100 == 0:
+                    await asyncio.to_thread(self._disk.purge_expired, time.time())
+            except sqlite3.Error as e:
+                logger.error(f"Error writing answer cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and the latency and tokens saved by hits."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "saved_tokens": self.saved_tokens,
+        }
+
+    def close(self):
+        """Close the disk store, if any."""
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
@@ -0,0 +1,352 @@
+"""
+Rate-limit-aware scheduler for OpenAI calls.
+
+Calls are queued per key (a guild or channel) and dispatched round-robin
+across keys, so one busy server cannot starve the others. Dispatch is
+gated by token buckets for requests-per-minute and tokens-per-minute and
+by a concurrency cap; a streaming call keeps its slot until the stream
+ends or is closed. 429 responses pause dispatch for the Retry-After
+period (with jitter) and the call is retried. When the queue is full, or a
+call has waited too long, SchedulerBusy is raised right away so the user
+gets a fast "busy" answer instead of a timeout. Each queued call has its own
+deadline timer, so it is rejected on time even while dispatch is paused.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def retryable_errors() -> Tuple[Type[Exception], ...]:
+    """Errors worth retrying; anything else is returned to the caller immediately."""
+    # Imported on first use so loading the bot does not pay for the openai package
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+class SchedulerBusy(Exception):
+    """Raised when a call is rejected because the queue is full or it waited too long."""
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """Take tokens; the balance may go negative after a usage correction."""
+        self._refill()
+        self.tokens -= amount
+
+@dataclass
+class _Job:
+    factory: Callable[[], Awaitable[Any]]
+    tokens: int
+    future: asyncio.Future
+    key: Hashable = None
+    stream: bool = False
+    started: bool = False
+    expiry: Optional[asyncio.TimerHandle] = None
+    enqueued: float = field(default_factory=time.monotonic)
+
+class _HeldStream:
+    """Streaming response that holds its concurrency slot until it is exhausted, fails or is closed."""
+
+    def __init__(self, stream: Any, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+        self._iterator = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._iterator is None:
+            self._iterator = self._stream.__aiter__()
+        try:
+            return await self._iterator.__anext__()
+        except BaseException:
+            # The end of the stream, an error or a cancelled read all end the call
+            self._done()
+            raise
+
+    async def close(self):
+        """Free the slot and close the HTTP response, returning its connection to the pool."""
+        self._done()
+        await self._stream.response.aclose()
+
+    def _done(self):
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+    def __del__(self):
+        # Last resort for a stream that was dropped without being read to the end or closed
+        self._done()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+class OpenAIScheduler:
+    """
+    Fair, rate-limited dispatcher for OpenAI calls.
+
+    Args:
+        requests_per_minute: Request budget (RPM)
+        tokens_per_minute: Token budget (TPM), charged with each call's estimate
+        max_concurrency: Maximum calls in flight at once
+        max_queue: Maximum queued calls across all keys
+        max_queue_per_key: Maximum queued calls for one key
+        max_wait: Seconds a call may wait in the queue before it is rejected
+        max_retries: Retries for rate-limited or transient failures
+    """
+
+    def __init__(self, requests_per_minute: float = 500, tokens_per_minute: float = 60000,
+                 max_concurrency: int = 8, max_queue: int = 100, max_queue_per_key: int = 20,
+                 max_wait: float = 20.0, max_retries: int = 3):
+        self.requests = TokenBucket(requests_per_minute)
+        self.token_budget = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_key = max_queue_per_key
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+
+        self._queues: "OrderedDict[Hashable, Deque[_Job]]" = OrderedDict()
+        self._pending = 0
+        self._in_flight = 0
+        self._cooldown_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self.submitted = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self._waits: Deque[float] = deque(maxlen=1000)
+
+    @property
+    def pending(self) -> int:
+        """Calls waiting in the queue."""
+        return self._pending
+
+    @property
+    def in_flight(self) -> int:
+        """Calls dispatched and not yet finished, including streams still being read."""
+        return self._in_flight
+
+    async def submit(self, key: Hashable, tokens: int, factory: Callable[[], Awaitable[Any]],
+                     stream: bool = False) -> Any:
+        """
+        Queue a call and wait for its result.
+
+        Args:
+            key: Fairness key, e.g. the guild or channel ID
+            tokens: Estimated tokens the call will use (prompt + completion)
+            factory: Zero-argument callable returning the awaitable API call
+            stream: Whether the call returns a stream; its slot is then held until
+                the stream is exhausted or closed
+
+        Returns:
+            The call's result (a stream wrapper if stream is True)
+
+        Raises:
+            SchedulerBusy: If the queue is full or the call waited longer than max_wait
+        """
+        queue = self._queues.get(key)
+        if self._pending >= self.max_queue or (queue is not None and len(queue) >= self.max_queue_per_key):
+            self.rejected += 1
+            raise SchedulerBusy("OpenAI request queue is full")
+
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        job = _Job(factory, tokens, loop.create_future(), key=key, stream=stream)
+        job.expiry = loop.call_later(self.max_wait, self._expire, job)
+        self._queues.setdefault(key, deque()).append(job)
+        self._pending += 1
+        self.submitted += 1
+        self._wakeup.set()
+        return await job.future
+
+    def _ensure_started(self):
+        """Start the dispatcher on the running loop the first time it is needed."""
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def _next_job(self) -> Optional[_Job]:
+        """Pop the next job, rotating through keys round-robin."""
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            job = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._pending -= 1
+            if not job.future.done():
+                return job
+        return None
+
+    def _expire(self, job: _Job):
+        """Reject a job that is still waiting for dispatch when its max_wait runs out."""
+        if job.started or job.future.done():
+            return
+        queue = self._queues.get(job.key)
+        if queue is not None and job in queue:
+            queue.remove(job)
+            self._pending -= 1
+            if not queue:
+                del self._queues[job.key]
+        self.rejected += 1
+        job.future.set_exception(SchedulerBusy(f"Waited {self.max_wait:.1f}s for an OpenAI slot"))
+
+    async def _dispatch(self):
+        """Dispatcher loop: take jobs fairly and start them when budget allows."""
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            await self._slots.acquire()
+            await self._wait_for_budget(job.tokens)
+
+            # Expired (or abandoned) while this dispatcher waited for a slot or budget
+            if job.future.done():
+                self._slots.release()
+                continue
+            job.started = True
+            job.expiry.cancel()
+
+            self._waits.append(time.monotonic() - job.enqueued)
+            self.requests.consume(1)
+            self.token_budget.consume(job.tokens)
+            task = asyncio.create_task(self._run(job))
+            # A caller that gives up (e.g. a hedged request that lost) aborts the call and frees its slot
+            job.future.add_done_callback(partial(self._abort_if_abandoned, task))
+
+    async def _wait_for_budget(self, tokens: int):
+        """Sleep until both buckets have capacity and any 429 cooldown has passed."""
+        while True:
+            delay = max(
+                self.requests.delay_for(1),
+                self.token_budget.delay_for(tokens),
+                self._cooldown_until - time.monotonic(),
+            )
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _run(self, job: _Job):
+        """Run a job, retrying transient failures with jittered backoff."""
+        self._in_flight += 1
+        held = False
+        try:
+            errors = retryable_errors()
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = await job.factory()
+                except errors as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._retry_delay(e, attempt)
+                    if getattr(e, "status_code", None) == 429:
+                        self.rate_limited += 1
+                        # Hold back every queued call, not just this one
+                        self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+                    logger.warning(f"OpenAI call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                self._correct_usage(job, result)
+                if not job.future.done():
+                    if job.stream:
+                        # The call goes on while the caller reads the stream
+                        result = _HeldStream(result, self._release_slot)
+                        held = True
+                    job.future.set_result(result)
+                return
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            if not held:
+                self._release_slot()
+
+    def _release_slot(self):
+        self._in_flight -= 1
+        self._slots.release()
+
+    @staticmethod
+    def _abort_if_abandoned(task: asyncio.Task, future: asyncio.Future):
+        if future.cancelled():
+            task.cancel()
+
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        """Delay before a retry: the server's Retry-After if given, else exponential backoff, plus jitter."""
+        delay = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            headers = response.headers
+            try:
+                if "retry-after-ms" in headers:
+                    delay = float(headers["retry-after-ms"]) / 1000
+                elif "retry-after" in headers:
+                    delay = float(headers["retry-after"])
+            except ValueError:
+                delay = None
+        if delay is None:
+            delay = min(30.0, 2 ** attempt)
+        return delay + random.uniform(0, delay * 0.25 + 0.1)
+
+    def _correct_usage(self, job: _Job, result: Any):
+        """Charge or refund the token bucket with the real usage when the API reports it."""
+        usage = getattr(result, "usage", None)
+        total = getattr(usage, "total_tokens", None)
+        if total is not None:
+            self.token_budget.consume(total - job.tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait times and rejection/429 counters."""
+        waits = sorted(self._waits)
+        return {
+            "queue_depth": self._pending,
+            "queued_keys": len(self._queues),
+            "in_flight": self._in_flight,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+        }
@@ -0,0 +1,210 @@
+"""
+End-to-end benchmark of `!ask` handling against local fakes.
+
+Every run builds a real StudentHubBot and drives `handle_ask` with fake
+Discord contexts. The OpenAI client and the Google Docs reader are
+replaced by the stand-ins in `benchmarks.fakes`. The grid is corpus size
+(documents) by concurrency. Each cell reports questions/sec, p50/p95/p99
+latency, peak traced memory and the per-stage p50 from utils.metrics.
+Results are printed and saved as JSON so runs can be compared.
+
+Usage:
+    python -m benchmarks.ask_benchmark --documents 10,100 --concurrency 1,8,32
+    python -m benchmarks.ask_benchmark --openai-latency 0.2 --rate-limit-ratio 0.05 --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+# The bot and clients read their settings on import
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("KNOWLEDGE_REFRESH_INTERVAL", "0")
+os.environ.setdefault("KNOWLEDGE_SNAPSHOT_PATH", os.path.join(tempfile.mkdtemp(prefix="ask-bench-"), "snapshot.bin"))
+
+from ai import openai_client
+from ai.scheduler import OpenAIScheduler
+from benchmarks.fakes import FakeContext, FakeGoogleDocs, FakeOpenAI, synthetic_questions
+from bot import discord_client
+from bot.discord_client import StudentHubBot
+from knowledge import gdocs_client
+from knowledge.search_index import SearchIndex
+from utils.metrics import STAGE_SECONDS
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def _reset_knowledge(docs: FakeGoogleDocs):
+    """Point the knowledge module at a fresh fake corpus with empty caches."""
+    os.environ["GOOGLE_DOC_IDS"] = ",".join(docs.doc_ids)
+    gdocs_client.batch_get_documents = docs.batch_get_documents
+    gdocs_client._document_cache.clear()
+    gdocs_client._document_revisions.clear()
+    gdocs_client._search_index = SearchIndex()
+    gdocs_client._embedding_index = None
+    # Start cold: no snapshot to load
+    gdocs_client._snapshot_loaded = True
+
+def _reset_openai(args) -> FakeOpenAI:
+    """Install a fresh fake OpenAI client, scheduler and (optionally) answer cache."""
+    fake = FakeOpenAI(latency=args.openai_latency, rate_limit_ratio=args.rate_limit_ratio,
+                      retry_after_ms=args.retry_after_ms, seed=args.seed)
+    openai_client._client = fake
+    openai_client._scheduler = OpenAIScheduler(
+        requests_per_minute=args.rpm, tokens_per_minute=args.tpm, max_concurrency=args.openai_concurrency,
+        max_queue=10_000, max_queue_per_key=10_000, max_wait=120,
+    )
+    openai_client._response_cache.ttl = openai_client._response_cache.ttl if args.cache else 0
+    return fake
+
+async def run_case(args, documents: int, concurrency: int) -> Dict[str, Any]:
+    """
+    Benchmark one (corpus size, concurrency) cell.
+
+    Args:
+        args: Parsed command-line options
+        documents: Number of synthetic documents
+        concurrency: Questions in flight at once
+
+    Returns:
+        Dict[str, Any]: Throughput, latency, memory and stage timings for the cell
+    """
+    docs = FakeGoogleDocs(documents, sections=args.sections, paragraphs_per_section=args.paragraphs,
+                          latency=args.docs_latency, seed=args.seed)
+    _reset_knowledge(docs)
+    fake_openai = _reset_openai(args)
+    STAGE_SECONDS.reset()
+
+    bot = StudentHubBot()
+    questions = synthetic_questions(args.questions, seed=args.seed + documents + concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    tracemalloc.start()
+    # Load and index the corpus once, as the first question would
+    start = time.perf_counter()
+    await gdocs_client._ensure_documents()
+    index_seconds = time.perf_counter() - start
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, question in enumerate(questions):
+        queue.put_nowait((i, question))
+
+    async def client():
+        nonlocal errors
+        while not queue.empty():
+            i, question = queue.get_nowait()
+            ctx = FakeContext(guild_id=i % args.guilds)
+            began = time.perf_counter()
+            await bot.handle_ask(ctx, question)
+            latencies.append(time.perf_counter() - began)
+            if not ctx.messages or ctx.messages[0].content.startswith("I'm sorry"):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "documents": documents,
+        "chunks": len(gdocs_client._search_index),
+        "concurrency": concurrency,
+        "questions": len(latencies),
+        "errors": errors,
+        "index_seconds": round(index_seconds, 4),
+        "qps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "peak_memory_mb": round(peak / 1_048_576, 2),
+        "openai_calls": fake_openai.chat.completions.calls,
+        "injected_429s": fake_openai.chat.completions.rate_limited,
+        "stage_p50_ms": {
+            stage: round(STAGE_SECONDS.quantiles(stage=stage)[0.5] * 1000, 3)
+            for stage in ("documents", "search", "knowledge", "prompt", "cache", "openai", "reply")
+        },
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+async def run(args) -> Dict[str, Any]:
+    """Run every cell of the benchmark grid."""
+    results = []
+    print(f"{'docs':>6} {'chunks':>7} {'conc':>5} {'q/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'peak MB':>8} {'errors':>6}")
+    for documents in args.documents:
+        for concurrency in args.concurrency:
+            result = await run_case(args, documents, concurrency)
+            results.append(result)
+            print(f"{documents:>6} {result['chunks']:>7} {concurrency:>5} {result['qps']:>8.1f} "
+                  f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                  f"{result['peak_memory_mb']:>8.1f} {result['errors']:>6}")
+    return {
+        "benchmark": "ask",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+
+def main(argv=None) -> int:
+    """Command-line entry point for the !ask benchmark."""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ask_benchmark", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=_int_list, default=[10, 100], help="Corpus sizes in documents (comma-separated)")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32], help="Concurrency levels (comma-separated)")
+    parser.add_argument("--questions", type=int, default=200, help="Questions per cell")
+    parser.add_argument("--sections", type=int, default=5, help="Sections per document")
+    parser.add_argument("--paragraphs", type=int, default=8, help="Paragraphs per section")
+    parser.add_argument("--guilds", type=int, default=4, help="Distinct guilds the questions come from")
+    parser.add_argument("--openai-latency", type=float, default=0.3, help="Mean fake completion latency (s)")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of calls answered with a 429")
+    parser.add_argument("--retry-after-ms", type=int, default=200, help="Retry-After sent with injected 429s")
+    parser.add_argument("--docs-latency", type=float, default=0.05, help="Fake Docs batch latency (s)")
+    parser.add_argument("--rpm", type=float, default=100_000, help="Scheduler request budget per minute")
+    parser.add_argument("--tpm", type=float, default=100_000_000, help="Scheduler token budget per minute")
+    parser.add_argument("--openai-concurrency", type=int, default=64, help="Scheduler concurrency cap")
+    parser.add_argument("--cache", action="store_true", help="Keep the answer cache enabled")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for corpora and questions")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/ask-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    # Per-question log lines would dominate the measurement
+    logging.disable(logging.WARNING)
+    discord_client.STREAM_RESPONSES = False
+
+    report = asyncio.run(run(args))
+
+    output = args.output or os.path.join(os.path.dirname(__file__), "results",
+                                         f"ask-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
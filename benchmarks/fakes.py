@@ -0,0 +1,161 @@
+"""
+In-process stand-ins for Discord, OpenAI and Google Docs.
+
+They mimic just enough of each API for `StudentHubBot.handle_ask` to run
+end to end without network access: a command context that records
+replies, an OpenAI client with configurable latency and injected 429s,
+and a Docs batch reader serving a synthetic corpus of chosen size.
+"""
+
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import openai
+
+# Words the synthetic corpus and questions are drawn from
+VOCABULARY = (
+    "internship career resume homework exam lecture assignment deadline channel server rules "
+    "moderator event club project group study notes library scholarship tuition campus housing "
+    "schedule course professor grade question answer announcement verification account profile "
+    "discord studenthub mentor workshop hackathon portfolio interview application semester"
+).split()
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+class FakeMessage:
+    """A sent Discord message that can be edited."""
+
+    def __init__(self, content: str):
+        self.content = content
+
+    async def edit(self, content: str):
+        self.content = content
+
+class FakeContext:
+    """A command context that records what the bot sends."""
+
+    def __init__(self, guild_id: int, channel_id: int = 1, author: str = "benchmark-user"):
+        # A guild with no channels, so routing questions always fall through to the LLM
+        self.guild = SimpleNamespace(id=guild_id, text_channels=[], forums=[], get_channel=lambda channel_id: None)
+        self.channel = SimpleNamespace(id=channel_id)
+        self.author = author
+        self.messages: List[FakeMessage] = []
+
+    def typing(self) -> FakeTyping:
+        return FakeTyping()
+
+    async def reply(self, content: str) -> FakeMessage:
+        message = FakeMessage(content)
+        self.messages.append(message)
+        return message
+
+    async def send(self, content: str) -> FakeMessage:
+        return await self.reply(content)
+
+class FakeCompletions:
+    """Stand-in for `client.chat.completions` with latency and 429 injection."""
+
+    def __init__(self, latency: float, rate_limit_ratio: float, retry_after_ms: int, rng: random.Random):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after_ms = retry_after_ms
+        self.rng = rng
+        self.calls = 0
+        self.rate_limited = 0
+
+    def _maybe_rate_limit(self):
+        if self.rng.random() < self.rate_limit_ratio:
+            self.rate_limited += 1
+            request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+            response = httpx.Response(429, request=request, headers={"retry-after-ms": str(self.retry_after_ms)})
+            raise openai.RateLimitError("Rate limit reached (injected)", response=response, body=None)
+
+    async def create(self, model: str, messages: List[Dict[str, str]], stream: bool = False, **kwargs) -> Any:
+        self.calls += 1
+        await asyncio.sleep(self.latency * self.rng.uniform(0.8, 1.2))
+        self._maybe_rate_limit()
+
+        question = messages[-1]["content"]
+        answer = f"For '{question[:60]}', please post in #help and check the pinned guidelines."
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        if stream:
+            return self._stream(answer)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=answer))],
+            usage=SimpleNamespace(total_tokens=prompt_tokens + len(answer) // 4),
+        )
+
+    async def _stream(self, answer: str):
+        for start in range(0, len(answer), 16):
+            await asyncio.sleep(0.001)
+            delta = SimpleNamespace(content=answer[start:start + 16])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+class FakeOpenAI:
+    """Stand-in for AsyncOpenAI exposing `chat.completions.create`."""
+
+    def __init__(self, latency: float = 0.5, rate_limit_ratio: float = 0.0, retry_after_ms: int = 200,
+                 seed: int = 0):
+        self.chat = SimpleNamespace(completions=FakeCompletions(latency, rate_limit_ratio, retry_after_ms,
+                                                                random.Random(seed)))
+
+    async def close(self):
+        pass
+
+def _paragraph(text: str, style: str = "NORMAL_TEXT") -> Dict[str, Any]:
+    return {"paragraph": {"elements": [{"textRun": {"content": text + "\n"}}],
+                          "paragraphStyle": {"namedStyleType": style}}}
+
+def synthetic_document(doc_id: str, sections: int, paragraphs_per_section: int, rng: random.Random) -> Dict[str, Any]:
+    """
+    Build a Docs API document of headings and paragraphs of vocabulary words.
+
+    Args:
+        doc_id: The document ID
+        sections: Number of HEADING_2 sections
+        paragraphs_per_section: Paragraphs under each heading
+        rng: Random source, so corpora are reproducible
+
+    Returns:
+        Dict[str, Any]: A document resource like the Docs API returns
+    """
+    content = [_paragraph(f"Guide {doc_id}", "TITLE")]
+    for section in range(sections):
+        content.append(_paragraph(f"{rng.choice(VOCABULARY).title()} section {section}", "HEADING_2"))
+        for _ in range(paragraphs_per_section):
+            words = rng.choices(VOCABULARY, k=rng.randint(20, 60))
+            content.append(_paragraph(" ".join(words).capitalize() + "."))
+    return {"documentId": doc_id, "revisionId": f"rev-{doc_id}", "body": {"content": content}}
+
+class FakeGoogleDocs:
+    """Serves a synthetic corpus through the `batch_get_documents` interface."""
+
+    def __init__(self, documents: int, sections: int = 5, paragraphs_per_section: int = 8,
+                 latency: float = 0.05, seed: int = 0):
+        rng = random.Random(seed)
+        self.doc_ids = [f"doc-{i:05d}" for i in range(documents)]
+        self.documents = {doc_id: synthetic_document(doc_id, sections, paragraphs_per_section, rng)
+                          for doc_id in self.doc_ids}
+        self.latency = latency
+        self.batches = 0
+
+    def batch_get_documents(self, doc_ids: List[str], fields: Optional[str] = None,
+                            on_error: Optional[Callable[[str, Exception], None]] = None) -> Dict[str, Dict[str, Any]]:
+        # Called from a worker thread, like the real client
+        self.batches += 1
+        time.sleep(self.latency)
+        return {doc_id: self.documents[doc_id] for doc_id in doc_ids if doc_id in self.documents}
+
+def synthetic_questions(count: int, seed: int = 0) -> List[str]:
+    """Distinct questions built from corpus vocabulary, so each one misses the answer cache."""
+    rng = random.Random(seed)
+    return [f"Where do I ask about {' '.join(rng.sample(VOCABULARY, 3))}? (#{i})" for i in range(count)]
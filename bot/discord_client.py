@@ -2,25 +2,66 @@ import discord
 from discord.ext import commands
 import logging
 import os
-import secrets
-import time
 import uuid
 import asyncio
-from typing import Dict, Tuple
 
-from ai.openai_client import generate_response
-from knowledge.gdocs_client import fetch_knowledge
+from ai.openai_client import close_client, generate_response, generate_response_stream, init_client, warm_up_tokenizer
+from ai.response_cache import normalize_question
+from bot.link_events import get_link_outbox, register_link_consumer
+from bot.startup import StartupTimer, command_fingerprint, load_sync_state, save_sync_state
+from bot.streaming import StreamingReply, send_long_reply
+from bot.token_store import get_token_store
+from knowledge import google_services
+from knowledge.gdocs_client import (current_index, fetch_knowledge_passages, run_knowledge_refresher, run_snapshot_follower,
+                                    warm_up as warm_up_knowledge)
+from utils.metrics import REGISTRY, configure_trace_log, monitor_loop_lag, request_trace, span, start_metrics_server
+from utils.singleflight import SingleFlight
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Token storage: token -> (user_id, expiration_timestamp)
-# This is in-memory storage; for production, use a database
-token_storage: Dict[str, Tuple[int, float]] = {}
 # Token expiration time in seconds (30 minutes)
 TOKEN_EXPIRATION = 1800
+# Seconds between sweeps of expired tokens (each sweep only touches expired entries)
+TOKEN_PURGE_INTERVAL = 60
+
+# Prefix for traditional commands such as !ask
+COMMAND_PREFIX = '!'
+
+# Memory-lean mode for large guilds: no member cache or member chunking at startup,
+# a small message cache, and users resolved on demand
+LEAN_CACHE = os.getenv("BOT_LEAN_CACHE", "false").lower() in ("1", "true", "yes")
+# Messages kept in the message cache (0 disables it)
+MESSAGE_CACHE_SIZE = int(os.getenv("BOT_MESSAGE_CACHE_SIZE", "100" if LEAN_CACHE else "1000"))
+
+# Link confirmations: events drained per batch, DMs in flight at once, and seconds between polls
+LINK_EVENTS_BATCH = int(os.getenv("LINK_EVENTS_BATCH", "50"))
+LINK_NOTIFY_CONCURRENCY = int(os.getenv("LINK_NOTIFY_CONCURRENCY", "5"))
+LINK_EVENTS_POLL_INTERVAL = float(os.getenv("LINK_EVENTS_POLL_INTERVAL", "2"))
+
+# Local Prometheus endpoint (0 disables it) and optional per-question trace log
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+ASK_TRACE_LOG = os.getenv("ASK_TRACE_LOG")
+
+_asks_total = REGISTRY.counter("ask_requests_total", "Questions received through !ask")
+_ask_errors_total = REGISTRY.counter("ask_errors_total", "Questions that failed with an error")
+
+# Ranked knowledge passages considered for each answer (packed into the prompt's token budget)
+KNOWLEDGE_CANDIDATES = int(os.getenv("KNOWLEDGE_CANDIDATES", "10"))
+
+# Seconds setup_hook waits for warm-up (knowledge, connection pools, command sync) before
+# connecting to the gateway anyway; unfinished steps keep running in the background
+STARTUP_WARMUP_TIMEOUT = float(os.getenv("STARTUP_WARMUP_TIMEOUT", "15"))
+# Sync slash commands on every start, even if the command tree is unchanged
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "false").lower() in ("1", "true", "yes")
+
+# Answer "which channel should I use for X" locally when the router is confident (ai/channel_router.py)
+CHANNEL_ROUTER = os.getenv("CHANNEL_ROUTER", "true").lower() in ("1", "true", "yes")
+
+# Stream !ask answers into the reply as they are generated
+STREAM_RESPONSES = os.getenv("ASK_STREAMING", "false").lower() in ("1", "true", "yes")
+# Minimum seconds between edits of a streaming reply (Discord rate-limits message edits)
+STREAM_EDIT_INTERVAL = float(os.getenv("ASK_STREAM_EDIT_INTERVAL", "1.0"))
 
 class StudentHubBot(commands.Bot):
     """
@@ -28,38 +69,140 @@ class StudentHubBot(commands.Bot):
     Handles message commands and interactions.
     """
     
-    def __init__(self):
+    def __init__(self, primary: bool = True, **options):
+        # Only the primary process runs singleton jobs: command sync, knowledge refresh
+        # and snapshot writes, and purging a shared token store
+        self.primary = primary
+        
         # Set up intents (make sure to enable these in the Discord Developer Portal)
         intents = discord.Intents.default()
         intents.message_content = True  # Privileged intent
         intents.members = True  # Needed for DM functionality
         
+        cache_options = {}
+        if LEAN_CACHE:
+            # Members are not cached or chunked; DM recipients come from the message or fetch_user
+            cache_options = {
+                "member_cache_flags": discord.MemberCacheFlags.none(),
+                "chunk_guilds_at_startup": False,
+            }
+        
         # Pass intents to the parent constructor
-        super().__init__(command_prefix='!', intents=intents)
+        super().__init__(command_prefix=COMMAND_PREFIX, intents=intents,
+                         max_messages=MESSAGE_CACHE_SIZE or None, **cache_options, **options)
         
         # Set up token cleanup task
         self.bg_task = None
         
+        # Set up knowledge refresh task
+        self.refresh_task = None
+        
+        # Set up the task that sends account-linked confirmations
+        self.link_events_task = None
+        register_link_consumer()
+        
+        # Set up metrics: event loop lag monitor and the /metrics server
+        self.loop_lag_task = None
+        self.metrics_runner = None
+        
+        # Warm-up steps still running when the bot connected
+        self.warmup_tasks = set()
+        
+        # Identical questions asked at the same time share one answer
+        self.ask_flight = SingleFlight("ask")
+        
+        # Channel routers by guild ID (None for DMs), with the search index each was built from
+        self.routers = {}
+        
+        # Boot-to-ready timing; everything before the bot is created counts as imports
+        self.startup = StartupTimer()
+        self.startup.phase("imports")
+        
     async def setup_hook(self):
-        """Set up slash commands for modern Discord interactions."""
+        """Set up slash commands and warm caches and connection pools before connecting."""
+        self.startup.phase("login")
+        
+        # Start instrumentation before any traffic arrives
+        configure_trace_log(ASK_TRACE_LOG)
+        self.loop_lag_task = asyncio.create_task(monitor_loop_lag())
+        REGISTRY.counter("ask_shared_total", "Questions answered by an identical in-flight request",
+                         fn=lambda: self.ask_flight.shared)
+        
         # Register slash commands - replace guild_id with your test server ID or remove for global commands
         guild_id = os.getenv("TEST_GUILD_ID")
-        if guild_id:
-            guild = discord.Object(id=int(guild_id))
-            self.tree.add_command(discord.app_commands.Command(
-                name="link",
-                description="Link your Discord account to your StudentHub profile",
-                callback=self.link_slash
-            ), guild=guild)
-        else:
-            # Global commands take up to an hour to propagate
-            self.tree.add_command(discord.app_commands.Command(
-                name="link",
-                description="Link your Discord account to your StudentHub profile",
-                callback=self.link_slash
-            ))
+        guild = discord.Object(id=int(guild_id)) if guild_id else None
+        # Without a test guild the command is global, and global commands take up to an hour to propagate
+        self.tree.add_command(discord.app_commands.Command(
+            name="link",
+            description="Link your Discord account to your StudentHub profile",
+            callback=self.link_slash
+        ), guild=guild)
+        
+        # Warm up concurrently: the OpenAI and Google clients are created (and their
+        # libraries imported) and the prompt tokenizer is loaded in threads while the knowledge base loads
+        steps = {
+            "openai": asyncio.to_thread(init_client),
+            "tokenizer": asyncio.to_thread(warm_up_tokenizer),
+            "google": asyncio.to_thread(google_services.warm_up),
+            "knowledge": warm_up_knowledge(),
+        }
+        if self.primary:
+            steps["commands"] = self.sync_commands(guild)
+        if METRICS_PORT:
+            steps["metrics"] = self.start_metrics()
+        tasks = [asyncio.create_task(self.startup.step(name, step), name=name) for name, step in steps.items()]
+        done, self.warmup_tasks = await asyncio.wait(tasks, timeout=STARTUP_WARMUP_TIMEOUT)
+        for task in done:
+            self._log_failed_step(task)
+        for task in self.warmup_tasks:
+            logger.warning(f"Startup step {task.get_name()} is still running after {STARTUP_WARMUP_TIMEOUT:.0f}s; "
+                           f"continuing in the background")
+            task.add_done_callback(self._log_failed_step)
+        self.startup.phase("setup")
         
-        await self.tree.sync()
+    @staticmethod
+    def _log_failed_step(task: asyncio.Task):
+        """Log a warm-up step that raised."""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Startup step {task.get_name()} failed: {task.exception()}")
+        
+    async def sync_commands(self, guild=None) -> bool:
+        """
+        Sync the slash command tree with Discord if it changed since the last sync.
+        
+        Args:
+            guild: The guild the commands are registered in, or None for global commands
+            
+        Returns:
+            bool: True if the commands were synced
+        """
+        fingerprint = command_fingerprint(self.tree, guild)
+        key = f"{self.application_id}:{guild.id if guild else 'global'}"
+        if not FORCE_COMMAND_SYNC and load_sync_state().get(key) == fingerprint:
+            self.startup.notes["commands"] = "unchanged"
+            return False
+        
+        await self.tree.sync(guild=guild)
+        await asyncio.to_thread(save_sync_state, key, fingerprint)
+        self.startup.notes["commands"] = "synced"
+        logger.info(f"Synced slash commands ({key})")
+        return True
+        
+    async def start_metrics(self):
+        """Serve Prometheus metrics on METRICS_PORT."""
+        try:
+            self.metrics_runner = await start_metrics_server(METRICS_PORT, METRICS_HOST)
+        except OSError as e:
+            logger.error(f"Could not start metrics server on port {METRICS_PORT}: {e}")
+        
+    async def close(self):
+        """Release shared connections before disconnecting from Discord."""
+        for task in self.warmup_tasks:
+            task.cancel()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await close_client()
+        await super().close()
         
     async def on_ready(self):
         """Called when the bot is ready and connected to Discord."""
@@ -69,11 +212,26 @@ class StudentHubBot(commands.Bot):
             logger.info(f'- {guild.name} (ID: {guild.id})')
         logger.info('------')
         
+        if not self.startup.finished:
+            self.startup.phase("gateway")
+            logger.info(self.startup.finish())
+        
         # Register traditional commands
         self.add_commands()
         
-        # Start background task to clean expired tokens
-        self.bg_task = self.loop.create_task(self.clean_expired_tokens())
+        # Start background task to clean expired tokens (a process-local store is cleaned by every process)
+        if self.bg_task is None and (self.primary or not os.getenv("TOKEN_STORE_PATH")):
+            self.bg_task = self.loop.create_task(self.clean_expired_tokens())
+        
+        # Start background task to confirm accounts linked on the website
+        if self.link_events_task is None:
+            self.link_events_task = self.loop.create_task(self.drain_link_events())
+        
+        # Start background task to pick up edits to the knowledge base documents; other
+        # processes follow the snapshot the primary writes instead of polling Google too
+        if self.refresh_task is None:
+            refresher = run_knowledge_refresher() if self.primary else run_snapshot_follower()
+            self.refresh_task = self.loop.create_task(refresher)
         
     def add_commands(self):
         """Add commands to the bot after it's ready."""
@@ -100,27 +258,178 @@ class StudentHubBot(commands.Bot):
             ctx: The command context
             question: The user's question
         """
-        logger.info(f"Received question from {ctx.author}: {question}")
+        logger.info(f"Received question from {ctx.author}: {question}", extra={"sample": "ask"})
+        _asks_total.inc()
+        # OpenAI capacity is shared fairly between servers (DMs queue per channel)
+        queue_key = ctx.guild.id if ctx.guild else ctx.channel.id
         
-        # Let the user know we're processing
-        async with ctx.typing():
+        # Time every stage of this question (and log it, if ASK_TRACE_LOG is set)
+        with request_trace("ask", queue_key=queue_key, streaming=STREAM_RESPONSES) as trace:
             try:
-                # First, see if we can find relevant information in our knowledge base
-                knowledge = await fetch_knowledge(question)
-                
-                # Generate a response using OpenAI
-                response = await generate_response(question, knowledge)
+                # Routing questions the local classifier is sure about are answered without OpenAI
+                if CHANNEL_ROUTER:
+                    with span("route"):
+                        route = await self.route_question(ctx, question)
+                    if route is not None:
+                        from ai.channel_router import record_routed
+                        
+                        trace["routed"] = route.channel.name
+                        with span("reply"):
+                            await ctx.reply(route.answer())
+                        record_routed()
+                        return
                 
-                # Send the response back
-                await ctx.reply(response)
+                # Let the user know we're processing
+                async with ctx.typing():
+                    key = normalize_question(question)
+                    
+                    if STREAM_RESPONSES:
+                        # The first asker streams the answer; concurrent identical askers get the final text
+                        streamed = False
+                        
+                        async def stream():
+                            nonlocal streamed
+                            streamed = True
+                            return await self.stream_answer(ctx, question, queue_key)
+                        
+                        response = await self.ask_flight.do(key, stream)
+                        if not streamed:
+                            trace["shared"] = True
+                            with span("reply"):
+                                await send_long_reply(ctx, response)
+                    else:
+                        # Concurrent identical questions wait for the same in-flight answer
+                        response = await self.ask_flight.do(key, lambda: self.answer_question(question, queue_key))
+                        
+                        # Send the response back
+                        with span("reply"):
+                            await send_long_reply(ctx, response)
             except Exception as e:
                 logger.error(f"Error processing question: {e}")
+                _ask_errors_total.inc()
+                trace["error"] = str(e)
                 await ctx.reply("I'm sorry, I encountered an error while processing your question. Please try again later.")
         
+    async def route_question(self, ctx, question: str):
+        """
+        Suggest a channel for a "where do I post X" question if the router is confident.
+        
+        Args:
+            ctx: The command context
+            question: The user's question
+            
+        Returns:
+            Optional[Route]: The suggested channel, or None to answer with the LLM
+        """
+        # numpy and the router are imported when the first question arrives, not at startup
+        from ai.channel_router import is_routing_question, record_fallback
+        
+        if not is_routing_question(question):
+            return None
+        try:
+            router = await self.get_channel_router(ctx.guild)
+            route = router.route(question)
+        except Exception as e:
+            logger.error(f"Error routing question: {e}")
+            return None
+        
+        # Only suggest channels the asker can see
+        if route is not None and ctx.guild is not None and isinstance(ctx.author, discord.Member):
+            channel = ctx.guild.get_channel(route.channel.id)
+            if channel is None or not channel.permissions_for(ctx.author).view_channel:
+                record_fallback()
+                return None
+        return route
+        
+    async def get_channel_router(self, guild):
+        """
+        Get the channel router for a guild, building it from the live channel list and the knowledge docs.
+        
+        Args:
+            guild: The guild, or None for DMs (routes to the channels the knowledge docs mention)
+            
+        Returns:
+            ChannelRouter: The router, rebuilt whenever the knowledge index has changed
+        """
+        from ai.channel_router import ChannelProfile, ChannelRouter, knowledge_channels
+        
+        index = current_index()
+        key = guild.id if guild else None
+        cached = self.routers.get(key)
+        if cached is not None and cached[0] is index:
+            return cached[1]
+        
+        if guild is not None:
+            channels = [
+                ChannelProfile(name=channel.name, mention=channel.mention, topic=channel.topic or "",
+                               category=channel.category.name if channel.category else "", id=channel.id)
+                for channel in [*guild.text_channels, *guild.forums]
+            ]
+        else:
+            channels = knowledge_channels(index.paragraphs)
+        router = await asyncio.to_thread(ChannelRouter.build, channels, index.paragraphs)
+        self.routers[key] = (index, router)
+        return router
+        
+    async def on_guild_channel_create(self, channel):
+        """Rebuild the guild's channel router on its next use."""
+        self.routers.pop(channel.guild.id, None)
+        
+    async def on_guild_channel_delete(self, channel):
+        """Rebuild the guild's channel router on its next use."""
+        self.routers.pop(channel.guild.id, None)
+        
+    async def on_guild_channel_update(self, before, after):
+        """Rebuild the guild's channel router on its next use if the name, topic or category changed."""
+        if (before.name, getattr(before, "topic", None), before.category_id) != \
+                (after.name, getattr(after, "topic", None), after.category_id):
+            self.routers.pop(after.guild.id, None)
+        
+    async def answer_question(self, question: str, queue_key=None) -> str:
+        """
+        Answer a question using the knowledge base and OpenAI.
+        
+        Args:
+            question: The user's question
+            queue_key: Fairness key for the OpenAI request queue
+            
+        Returns:
+            str: The generated answer
+        """
+        # First, see if we can find relevant information in our knowledge base
+        with span("knowledge"):
+            knowledge = await fetch_knowledge_passages(question, k=KNOWLEDGE_CANDIDATES)
+        
+        # Generate a response using OpenAI
+        return await generate_response(question, knowledge, queue_key=queue_key)
+        
+    async def stream_answer(self, ctx, question: str, queue_key=None) -> str:
+        """
+        Answer a question, posting the reply right away and editing it as text arrives.
+        
+        Args:
+            ctx: The command context to reply to
+            question: The user's question
+            queue_key: Fairness key for the OpenAI request queue
+            
+        Returns:
+            str: The full answer
+        """
+        with span("knowledge"):
+            knowledge = await fetch_knowledge_passages(question, k=KNOWLEDGE_CANDIDATES)
+        
+        reply = StreamingReply(ctx, edit_interval=STREAM_EDIT_INTERVAL)
+        # Generation and the progressive edits overlap, so they are timed together
+        with span("stream"):
+            async for piece in generate_response_stream(question, knowledge, queue_key=queue_key):
+                await reply.append(piece)
+            return await reply.finish()
+        
     async def on_message(self, message):
         """Process incoming messages."""
-        # Don't process messages from the bot itself
-        if message.author.id == self.user.id:
+        # Fast path: skip messages that cannot be commands before any parsing.
+        # Bots (including this one) are never handled as command authors anyway.
+        if message.author.bot or not message.content.startswith(COMMAND_PREFIX):
             return
             
         await self.process_commands(message)
@@ -133,7 +442,7 @@ class StudentHubBot(commands.Bot):
         Args:
             ctx: The command context
         """
-        logger.info(f"Received link request from {ctx.author}")
+        logger.info(f"Received link request from {ctx.author}", extra={"sample": "link"})
         
         try:
             # Generate a secure token
@@ -170,7 +479,7 @@ class StudentHubBot(commands.Bot):
         Args:
             interaction: The interaction object
         """
-        logger.info(f"Received slash command link request from {interaction.user}")
+        logger.info(f"Received slash command link request from {interaction.user}", extra={"sample": "link"})
         
         try:
             # Generate a secure token
@@ -215,14 +524,10 @@ class StudentHubBot(commands.Bot):
         Returns:
             str: A secure token
         """
-        # Generate a random token
-        token = secrets.token_urlsafe(16)
+        # Generate a random token and store it with the user ID and expiration timestamp
+        token, expiration = get_token_store().issue(user_id, TOKEN_EXPIRATION)
         
-        # Store the token with user ID and expiration timestamp
-        expiration = time.time() + TOKEN_EXPIRATION
-        token_storage[token] = (user_id, expiration)
-        
-        logger.info(f"Generated token for user {user_id}, expires at {expiration}")
+        logger.info(f"Generated token for user {user_id}, expires at {expiration}", extra={"sample": "link"})
         return token
     
     @staticmethod
@@ -239,80 +544,128 @@ class StudentHubBot(commands.Bot):
         Raises:
             ValueError: If the token is invalid or expired
         """
-        if token not in token_storage:
-            raise ValueError("Invalid token")
-            
-        user_id, expiration = token_storage[token]
-        
-        # Check if the token has expired
-        if time.time() > expiration:
-            # Remove expired token
-            del token_storage[token]
-            raise ValueError("Token has expired")
-            
-        # Remove the token (one-time use)
-        del token_storage[token]
-        
-        return user_id
+        # Checking and removing the token is one atomic step (one-time use)
+        return get_token_store().consume(token)
     
-    async def notify_account_linked(self, discord_user_id: int, studenthub_user_id: str):
+    async def notify_account_linked(self, discord_user_id: int, studenthub_user_id: str) -> bool:
         """
         Notifies a user that their account has been successfully linked.
         
         Args:
             discord_user_id: The Discord user ID
             studenthub_user_id: The StudentHub user ID
+            
+        Returns:
+            bool: False if sending failed in a way worth retrying
         """
         try:
-            # Get the user from the ID
-            user = await self.fetch_user(discord_user_id)
+            # Members are cached from the gateway; only unknown users cost an API call
+            user = self.get_user(discord_user_id) or await self.fetch_user(discord_user_id)
             
-            if user:
-                await user.send(
-                    f"Your Discord account has been successfully linked to your StudentHub profile!\n\n"
-                    f"StudentHub User ID: {studenthub_user_id}\n"
-                    f"Discord User ID: {discord_user_id}\n\n"
-                    f"You can now use all features that require account linking."
-                )
-                logger.info(f"Sent account linking confirmation to user {discord_user_id}")
-            else:
-                logger.error(f"Could not find user with ID {discord_user_id}")
+            await user.send(
+                f"Your Discord account has been successfully linked to your StudentHub profile!\n\n"
+                f"StudentHub User ID: {studenthub_user_id}\n"
+                f"Discord User ID: {discord_user_id}\n\n"
+                f"You can now use all features that require account linking."
+            )
+            logger.info(f"Sent account linking confirmation to user {discord_user_id}", extra={"sample": "link_notify"})
+            return True
+        except (discord.NotFound, discord.Forbidden) as e:
+            # Unknown user or DMs closed: retrying will not help
+            logger.warning(f"Could not send account linking confirmation to user {discord_user_id}: {e}")
+            return True
         except Exception as e:
             logger.error(f"Error sending account linking confirmation: {e}")
+            return False
+    
+    async def drain_link_events(self):
+        """Background task that sends confirmations for accounts linked on the website, in batches."""
+        await self.wait_until_ready()
+        logger.info("Starting link confirmation task")
+        
+        outbox = get_link_outbox()
+        # discord.py paces requests per rate-limit bucket; the cap keeps a burst from queueing behind it
+        slots = asyncio.Semaphore(LINK_NOTIFY_CONCURRENCY)
+        
+        async def notify(event) -> bool:
+            async with slots:
+                return await self.notify_account_linked(event.discord_user_id, event.studenthub_user_id)
+        
+        while not self.is_closed():
+            try:
+                events = await asyncio.to_thread(outbox.claim, LINK_EVENTS_BATCH)
+                if events:
+                    results = await asyncio.gather(*(notify(event) for event in events))
+                    done = [event.id for event, ok in zip(events, results) if ok]
+                    failed = [event.id for event, ok in zip(events, results) if not ok]
+                    if done:
+                        await asyncio.to_thread(outbox.ack, done)
+                    if failed:
+                        await asyncio.to_thread(outbox.release, failed)
+                    # A full batch means more may be waiting
+                    if len(events) == LINK_EVENTS_BATCH:
+                        continue
+            except Exception as e:
+                logger.error(f"Error draining link events: {e}")
+                
+            await asyncio.sleep(LINK_EVENTS_POLL_INTERVAL)
     
     async def clean_expired_tokens(self):
         """Background task to clean expired tokens."""
         await self.wait_until_ready()
         logger.info("Starting token cleanup task")
         
+        store = get_token_store()
         while not self.is_closed():
-            current_time = time.time()
-            
-            # Find expired tokens
-            expired_tokens = [
-                token for token, (_, expiration) in token_storage.items()
-                if current_time > expiration
-            ]
-            
-            # Remove expired tokens
-            for token in expired_tokens:
-                del token_storage[token]
-                logger.info(f"Removed expired token {token}")
+            try:
+                removed = await asyncio.to_thread(store.purge_expired)
+                if removed:
+                    logger.info(f"Removed {removed} expired token(s)", extra={"sample": "token_purge"})
+            except Exception as e:
+                logger.error(f"Error removing expired tokens: {e}")
                 
-            # Check every 10 minutes
-            await asyncio.sleep(600)
+            await asyncio.sleep(TOKEN_PURGE_INTERVAL)
 
-def get_discord_bot():
-    """Creates and returns the Discord bot instance."""
-    bot = StudentHubBot()
+def get_discord_bot(sharded: bool = False, **options):
+    """
+    Creates and returns the Discord bot instance.
+    
+    Args:
+        sharded: Run every shard in this process with an auto-sharded bot
+        **options: Extra client options, e.g. shard_count or shard_ids
+    """
+    if sharded:
+        from bot.sharding import ShardedStudentHubBot
+        return ShardedStudentHubBot(**options)
+    bot = StudentHubBot(**options)
     return bot
 
 def run_bot():
-    """Runs the Discord bot using the token from environment variables."""
+    """
+    Runs the Discord bot using the token from environment variables.
+    
+    BOT_SHARDING selects the deployment: "off" (default, one connection),
+    "auto" (all shards in this process) or "processes" (shards spread over
+    BOT_PROCESSES worker processes under a supervisor).
+    """
     token = os.getenv("DISCORD_TOKEN")
     if not token:
         raise ValueError("DISCORD_TOKEN not found in environment variables. Please set it in the .env file.")
     
+    sharding = os.getenv("BOT_SHARDING", "off").lower()
+    shard_count = int(os.getenv("BOT_SHARD_COUNT", "0")) or None
+    
+    if sharding == "processes":
+        from bot.sharding import run_supervisor
+        processes = int(os.getenv("BOT_PROCESSES", "0")) or os.cpu_count() or 1
+        logger.info("Starting Discord bot supervisor...")
+        run_supervisor(token, shard_count or processes, processes)
+        return
+    
     logger.info("Starting Discord bot...")
-    bot = get_discord_bot()
+    if sharding == "auto":
+        # Without BOT_SHARD_COUNT, Discord's recommended shard count is used
+        bot = get_discord_bot(sharded=True, shard_count=shard_count)
+    else:
+        bot = get_discord_bot()
     bot.run(token, log_handler=None)  # Disable default Discord logging handler 
\ No newline at end of file
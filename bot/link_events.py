@@ -0,0 +1,248 @@
+"""
+Outbox of "account linked" events from the web verifier to the bot.
+
+The web app publishes an event after it links an account; the bot drains
+events in batches and sends the confirmation DMs. `SQLiteLinkOutbox` keeps
+events in a WAL-mode SQLite file, so the two can run as separate
+processes. An event is leased while the bot handles it, deleted once it
+is acknowledged and offered again if the lease runs out (e.g. the bot
+restarted mid-batch) or it is released for a retry.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Attempts before an event that keeps failing is dropped
+MAX_ATTEMPTS = 3
+
+@dataclass(frozen=True)
+class LinkEvent:
+    """An account link waiting for its confirmation DM."""
+    id: int
+    discord_user_id: int
+    studenthub_user_id: str
+    attempts: int = 0
+
+class LinkOutbox(ABC):
+    """Interface for link event outboxes."""
+
+    @abstractmethod
+    def publish(self, discord_user_id: int, studenthub_user_id: str):
+        """
+        Record that an account was linked.
+
+        Args:
+            discord_user_id: The Discord user ID
+            studenthub_user_id: The StudentHub user ID it was linked to
+        """
+
+    @abstractmethod
+    def claim(self, limit: int, lease: float = 60) -> List[LinkEvent]:
+        """
+        Lease up to `limit` pending events, oldest first.
+
+        Args:
+            limit: Maximum events to return
+            lease: Seconds before unacknowledged events are offered again
+
+        Returns:
+            List[LinkEvent]: The claimed events
+        """
+
+    @abstractmethod
+    def ack(self, event_ids: List[int]):
+        """Delete handled events."""
+
+    @abstractmethod
+    def release(self, event_ids: List[int]):
+        """Return failed events for a retry, dropping those out of attempts."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """The number of pending events."""
+
+    def close(self):
+        """Release any resources held by the outbox."""
+
+class MemoryLinkOutbox(LinkOutbox):
+    """Process-local outbox, for when the web app and the bot share a process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_id = 1
+        # id -> (event, leased_until)
+        self._events: "OrderedDict[int, List]" = OrderedDict()
+
+    def publish(self, discord_user_id: int, studenthub_user_id: str):
+        with self._lock:
+            event = LinkEvent(self._next_id, discord_user_id, studenthub_user_id)
+            self._events[event.id] = [event, 0.0]
+            self._next_id += 1
+
+    def claim(self, limit: int, lease: float = 60) -> List[LinkEvent]:
+        now = time.time()
+        claimed = []
+        with self._lock:
+            for entry in self._events.values():
+                if len(claimed) >= limit:
+                    break
+                if entry[1] <= now:
+                    entry[1] = now + lease
+                    claimed.append(entry[0])
+        return claimed
+
+    def ack(self, event_ids: List[int]):
+        with self._lock:
+            for event_id in event_ids:
+                self._events.pop(event_id, None)
+
+    def release(self, event_ids: List[int]):
+        with self._lock:
+            for event_id in event_ids:
+                entry = self._events.get(event_id)
+                if entry is None:
+                    continue
+                event = entry[0]
+                if event.attempts + 1 >= MAX_ATTEMPTS:
+                    del self._events[event_id]
+                else:
+                    entry[0] = LinkEvent(event.id, event.discord_user_id, event.studenthub_user_id, event.attempts + 1)
+                    entry[1] = 0.0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+class SQLiteLinkOutbox(LinkOutbox):
+    """Outbox shared between processes through a SQLite file in WAL mode."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS link_events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, discord_user_id INTEGER NOT NULL,"
+            " studenthub_user_id TEXT NOT NULL, leased_until REAL NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS link_events_leased_until ON link_events (leased_until)")
+
+    def publish(self, discord_user_id: int, studenthub_user_id: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO link_events (discord_user_id, studenthub_user_id) VALUES (?, ?)",
+                (discord_user_id, studenthub_user_id)
+            )
+
+    def claim(self, limit: int, lease: float = 60) -> List[LinkEvent]:
+        now = time.time()
+        with self._lock:
+            # Select and lease in one write transaction so two consumers never share an event
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, discord_user_id, studenthub_user_id, attempts FROM link_events"
+                    " WHERE leased_until <= ? ORDER BY id LIMIT ?", (now, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE link_events SET leased_until = ? WHERE id = ?", [(now + lease, row[0]) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [LinkEvent(*row) for row in rows]
+
+    def ack(self, event_ids: List[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM link_events WHERE id = ?", [(event_id,) for event_id in event_ids])
+
+    def release(self, event_ids: List[int]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE link_events SET leased_until = 0, attempts = attempts + 1 WHERE id = ?",
+                    [(event_id,) for event_id in event_ids]
+                )
+                self._conn.execute("DELETE FROM link_events WHERE attempts >= ?", (MAX_ATTEMPTS,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM link_events").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_link_outbox: Optional[LinkOutbox] = None
+_link_outbox_lock = threading.Lock()
+
+# Whether this process drains the outbox (set by the bot); a process-local outbox is useless otherwise
+_has_consumer = False
+# Whether the skipped-event warning was logged; later skips are only logged at DEBUG
+_warned_no_consumer = False
+
+def register_link_consumer():
+    """Mark this process as one that drains link events, i.e. one that runs the bot."""
+    global _has_consumer
+    _has_consumer = True
+
+def publish_link_event(discord_user_id: int, studenthub_user_id: str) -> bool:
+    """
+    Publish an "account linked" event for the bot to confirm.
+
+    Without LINK_EVENTS_PATH the outbox only lives in this process. If no
+    bot runs here, nothing would ever drain it, so the event is skipped
+    instead of piling up in memory (with a warning the first time).
+
+    Args:
+        discord_user_id: The Discord user ID
+        studenthub_user_id: The StudentHub user ID it was linked to
+
+    Returns:
+        bool: True if the event was published
+    """
+    global _warned_no_consumer
+    outbox = get_link_outbox()
+    if isinstance(outbox, MemoryLinkOutbox) and not _has_consumer:
+        if not _warned_no_consumer:
+            _warned_no_consumer = True
+            logger.warning("Not queueing link confirmations: LINK_EVENTS_PATH is not set and no bot "
+                           "runs in this process (further skips are logged at DEBUG)")
+        logger.debug(f"Skipped the link confirmation for Discord user {discord_user_id}")
+        return False
+    outbox.publish(discord_user_id, studenthub_user_id)
+    return True
+
+def get_link_outbox() -> LinkOutbox:
+    """
+    Get the process-wide link event outbox, creating it on first use.
+
+    The SQLite file named by LINK_EVENTS_PATH connects the web and bot
+    processes; without it events only reach a bot in the same process.
+
+    Returns:
+        LinkOutbox: The outbox
+    """
+    global _link_outbox
+    with _link_outbox_lock:
+        if _link_outbox is None:
+            path = os.getenv("LINK_EVENTS_PATH")
+            _link_outbox = SQLiteLinkOutbox(path) if path else MemoryLinkOutbox()
+        return _link_outbox
@@ -0,0 +1,169 @@
+"""
+Sharded deployment of the bot.
+
+`ShardedStudentHubBot` is the bot on discord.py's AutoShardedBot: one
+process, one gateway connection per shard. `run_supervisor` goes further
+and spreads the shards over worker processes so event handling, command
+parsing and prompt building use several cores. Each worker owns a
+contiguous shard range, and a worker that dies is restarted with backoff.
+
+Workers only share state through process-safe backends: the SQLite token
+store or signed tokens, the SQLite answer cache and link outbox, and the
+atomically replaced knowledge snapshot. OpenAI rate budgets are divided
+between workers. Singleton jobs run in worker 0 only: it syncs slash
+commands, polls Google for edited documents, writes the snapshot and
+purges the shared token store. The other workers reload the snapshot when
+it changes.
+"""
+
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import time
+from typing import Dict, List, Optional
+
+from discord.ext import commands
+
+from bot import discord_client
+from bot.discord_client import StudentHubBot
+from utils.logging_config import DEFAULT_LOG_FILE, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Worker restarts back off exponentially up to this many seconds
+MAX_RESTART_DELAY = 60.0
+# A worker that stayed up this long is considered healthy again
+HEALTHY_UPTIME = 60.0
+
+# Per-process OpenAI budgets that are split evenly between workers, with their defaults
+_SPLIT_BUDGETS = {"OPENAI_RPM": 500, "OPENAI_TPM": 60000, "OPENAI_MAX_CONCURRENCY": 8}
+
+# Settings whose default keeps state inside one process
+_SHARED_STATE_SETTINGS = {
+    "TOKEN_STORE_PATH": "link tokens",
+    "LINK_EVENTS_PATH": "account-linked events",
+    "ANSWER_CACHE_PATH": "the answer cache",
+}
+
+class ShardedStudentHubBot(StudentHubBot, commands.AutoShardedBot):
+    """StudentHubBot running several gateway shards in one process."""
+
+def shard_ranges(shard_count: int, processes: int) -> List[List[int]]:
+    """
+    Split shard IDs into contiguous ranges, one per worker process.
+
+    Args:
+        shard_count: Total number of shards
+        processes: Number of worker processes
+
+    Returns:
+        List[List[int]]: Shard IDs owned by each worker (no empty ranges)
+    """
+    processes = max(1, min(processes, shard_count))
+    base, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for i in range(processes):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+def _run_worker(token: str, shard_ids: List[int], shard_count: int, worker: int):
+    """Worker process entry point: run the bot for a range of shards."""
+    # Each worker rotates its own log file (bot.worker0.log, ...) so rotations do not race
+    log_file = os.getenv("LOG_FILE", DEFAULT_LOG_FILE)
+    if log_file:
+        root, ext = os.path.splitext(log_file)
+        log_file = f"{root}.worker{worker}{ext}"
+    configure_logging(log_file=log_file)
+    # Each worker serves its metrics on its own port: METRICS_PORT + worker index
+    if discord_client.METRICS_PORT:
+        discord_client.METRICS_PORT += worker
+    # Let the supervisor handle Ctrl+C for the whole group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    primary = worker == 0
+    if not primary:
+        from knowledge import gdocs_client
+        gdocs_client.SNAPSHOT_WRITES = False
+    bot = ShardedStudentHubBot(shard_ids=shard_ids, shard_count=shard_count, primary=primary)
+    bot.run(token, log_handler=None)
+
+def _worker_env(processes: int) -> Dict[str, str]:
+    """Environment overrides giving each worker its share of the OpenAI budgets."""
+    env = {}
+    for name, default in _SPLIT_BUDGETS.items():
+        total = float(os.getenv(name, str(default)))
+        share = max(1.0, total / processes)
+        env[name] = str(int(share)) if name == "OPENAI_MAX_CONCURRENCY" else str(share)
+    return env
+
+def run_supervisor(token: str, shard_count: int, processes: Optional[int] = None):
+    """
+    Run the bot as worker processes that each own a range of shards, restarting dead workers.
+
+    Args:
+        token: The Discord bot token
+        shard_count: Total number of shards
+        processes: Number of worker processes (defaults to the CPU count)
+    """
+    ranges = shard_ranges(shard_count, processes or os.cpu_count() or 1)
+    # Spawned workers inherit the environment, and read their budgets from it on import
+    os.environ.update(_worker_env(len(ranges)))
+    for name, what in _SHARED_STATE_SETTINGS.items():
+        if not os.getenv(name) and not (name == "TOKEN_STORE_PATH" and os.getenv("LINK_TOKEN_SECRET")):
+            logger.warning(f"{name} is not set; {what} will not be shared between shard workers")
+
+    context = multiprocessing.get_context("spawn")
+    workers: Dict[int, multiprocessing.Process] = {}
+    started_at: Dict[int, float] = {}
+    failures: Dict[int, int] = {i: 0 for i in range(len(ranges))}
+    restart_at: Dict[int, float] = {}
+
+    def start(i: int):
+        process = context.Process(target=_run_worker, args=(token, ranges[i], shard_count, i),
+                                  name=f"shards-{ranges[i][0]}-{ranges[i][-1]}", daemon=False)
+        process.start()
+        workers[i] = process
+        started_at[i] = time.monotonic()
+        logger.info(f"Started worker {i} (pid {process.pid}) for shards {ranges[i][0]}-{ranges[i][-1]} of {shard_count}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for i in range(len(ranges)):
+        start(i)
+
+    try:
+        while not stopping:
+            now = time.monotonic()
+            for i in [i for i, when in restart_at.items() if when <= now]:
+                del restart_at[i]
+                start(i)
+
+            sentinels = {process.sentinel: i for i, process in workers.items()}
+            timeout = min([when - now for when in restart_at.values()] + [1.0])
+            for sentinel in multiprocessing.connection.wait(list(sentinels), timeout=max(0.0, timeout)):
+                i = sentinels[sentinel]
+                process = workers.pop(i)
+                process.join()
+                uptime = time.monotonic() - started_at[i]
+                failures[i] = 0 if uptime >= HEALTHY_UPTIME else failures[i] + 1
+                delay = min(MAX_RESTART_DELAY, 2 ** failures[i]) if failures[i] else 1.0
+                logger.error(f"Worker {i} exited with code {process.exitcode} after {uptime:.0f}s, "
+                             f"restarting in {delay:.0f}s")
+                restart_at[i] = time.monotonic() + delay
+    finally:
+        logger.info("Stopping shard workers")
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join(timeout=10)
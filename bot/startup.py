@@ -0,0 +1,128 @@
+"""
+Startup timing and slash command sync fingerprints.
+
+`StartupTimer` measures boot-to-ready time: sequential phases (imports,
+login, setup, gateway) and the warm-up steps that run concurrently during
+setup. The timings are logged once the bot is ready and exported as the
+`startup_seconds` gauge.
+
+Syncing the command tree is slow and rate limited, especially for global
+commands, so the bot only syncs when a fingerprint of the tree differs from
+the one recorded after the last successful sync.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Process start, approximately: main.py imports this module before anything else
+BOOT_TIME = time.perf_counter()
+
+# Where the fingerprint of the last synced command tree is kept
+COMMAND_SYNC_STATE_PATH = os.getenv("COMMAND_SYNC_STATE_PATH", "command_sync.json")
+
+STARTUP_SECONDS = REGISTRY.gauge("startup_seconds", "Seconds spent in each startup phase and warm-up step")
+
+class StartupTimer:
+    """Startup phases (one after another) and warm-up steps (concurrent) with their durations."""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = BOOT_TIME if started is None else started
+        self.phases: Dict[str, float] = {}
+        self.steps: Dict[str, float] = {}
+        self.notes: Dict[str, str] = {}
+        self.finished = False
+        self._last = self.started
+
+    def phase(self, name: str):
+        """End a phase: record the time since the previous phase ended."""
+        now = time.perf_counter()
+        self.phases[name] = now - self._last
+        self._last = now
+        STARTUP_SECONDS.set(self.phases[name], stage=name)
+
+    async def step(self, name: str, awaitable: Awaitable) -> Any:
+        """
+        Await a warm-up step and record how long it took, even if it fails.
+
+        Args:
+            name: Step name
+            awaitable: The step
+
+        Returns:
+            The step's result
+        """
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.steps[name] = time.perf_counter() - start
+            STARTUP_SECONDS.set(self.steps[name], stage=name)
+
+    def finish(self) -> str:
+        """Mark the bot ready and return the timing breakdown."""
+        self.finished = True
+        total = time.perf_counter() - self.started
+        STARTUP_SECONDS.set(total, stage="total")
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        steps = ", ".join(
+            f"{name} {seconds:.2f}s" + (f" ({self.notes[name]})" if name in self.notes else "")
+            for name, seconds in self.steps.items()
+        )
+        return f"Ready {total:.2f}s after boot: {phases}" + (f"; warm-up: {steps}" if steps else "")
+
+def command_fingerprint(tree, guild=None) -> str:
+    """
+    Hash the payload Discord would receive for a command tree scope.
+
+    Args:
+        tree: The bot's app_commands.CommandTree
+        guild: The guild scope, or None for global commands
+
+    Returns:
+        str: A hex digest that changes whenever a command, option or description does
+    """
+    payload = sorted((command.to_dict() for command in tree.get_commands(guild=guild)),
+                     key=lambda command: (command.get("type", 1), command["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def load_sync_state(path: Optional[str] = None) -> Dict[str, str]:
+    """Fingerprints of the last synced command trees, keyed by application and scope."""
+    path = path or COMMAND_SYNC_STATE_PATH
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring command sync state {path}: {e}")
+        return {}
+
+def save_sync_state(key: str, fingerprint: str, path: Optional[str] = None):
+    """
+    Record the fingerprint of a command tree that was just synced.
+
+    Args:
+        key: Application and scope, e.g. "1234:global"
+        fingerprint: The command_fingerprint that was synced
+        path: State file path (defaults to COMMAND_SYNC_STATE_PATH)
+    """
+    path = path or COMMAND_SYNC_STATE_PATH
+    state = load_sync_state(path)
+    state[key] = fingerprint
+    # Write then rename, so shard workers syncing at once never read a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Error writing command sync state {path}: {e}")
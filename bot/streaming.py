@@ -0,0 +1,111 @@
+"""
+Progressive Discord replies for streamed responses.
+
+The first piece of text is posted as a reply straight away. Later text is
+shown by editing that message, at most once per `edit_interval` seconds
+to stay within Discord's edit rate limits. Text beyond Discord's message
+length limit spills into follow-up messages.
+"""
+
+import logging
+import time
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Discord's maximum message length, in characters
+DISCORD_MESSAGE_LIMIT = 2000
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> List[str]:
+    """
+    Split text into pieces that each fit in one Discord message.
+    Splits happen at the last newline (or space) before the limit when possible.
+
+    Args:
+        text: The text to split
+        limit: Maximum characters per piece
+
+    Returns:
+        The pieces, in order (empty list for empty text)
+    """
+    pieces = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = text.rfind(' ', 0, limit)
+        if cut <= 0:
+            cut = limit
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip('\n ')
+    if text:
+        pieces.append(text)
+    return pieces
+
+async def send_long_reply(ctx, text: str):
+    """
+    Reply with text that may exceed Discord's message limit.
+
+    Args:
+        ctx: The command context
+        text: The reply text
+    """
+    pieces = split_message(text) or ["..."]
+    await ctx.reply(pieces[0])
+    for piece in pieces[1:]:
+        await ctx.send(piece)
+
+class StreamingReply:
+    """A reply that grows as text arrives, using coalesced message edits."""
+
+    def __init__(self, ctx, edit_interval: float = 1.0):
+        self.ctx = ctx
+        self.edit_interval = edit_interval
+        self._parts: List[str] = []
+        self._messages = []
+        self._shown: List[str] = []
+        self._last_edit = 0.0
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._parts)
+
+    async def append(self, piece: str):
+        """
+        Add text to the reply, updating Discord if the edit interval has passed.
+
+        Args:
+            piece: The new text
+        """
+        if not piece:
+            return
+        self._parts.append(piece)
+
+        # Post the first text immediately; after that, coalesce edits
+        if not self._messages or time.monotonic() - self._last_edit >= self.edit_interval:
+            await self._flush()
+
+    async def finish(self) -> str:
+        """
+        Show any text not yet displayed.
+
+        Returns:
+            str: The full reply text
+        """
+        await self._flush()
+        if not self._messages:
+            await self.ctx.reply("I'm sorry, I couldn't come up with an answer. Please try again later.")
+        return self.text
+
+    async def _flush(self):
+        """Bring the Discord messages in line with the text received so far."""
+        pages = split_message(self.text)
+        for i, page in enumerate(pages):
+            if i < len(self._messages):
+                if self._shown[i] != page:
+                    await self._messages[i].edit(content=page)
+                    self._shown[i] = page
+            else:
+                send = self.ctx.reply if i == 0 else self.ctx.send
+                self._messages.append(await send(page))
+                self._shown.append(page)
+        self._last_edit = time.monotonic()
@@ -0,0 +1,370 @@
+"""
+Storage for one-time account-linking tokens.
+
+The bot issues tokens and the StudentHub web app consumes them, usually
+from a different process. `MemoryTokenStore` is enough when both run in
+one process; `SQLiteTokenStore` keeps tokens in a WAL-mode SQLite file
+that every process can open. Consuming a token checks and deletes it in
+one atomic step, so a token can never be used twice. Expired tokens are
+dropped via an expiry heap (memory) or an index on the expiry column
+(SQLite) rather than by scanning every token.
+
+`SignedTokenStore` keeps no per-token state at all: the user ID and expiry
+are HMAC-signed into the token, so any web worker holding the secret can
+verify it. Single use is enforced by a replay guard that only remembers
+tokens consumed within the expiry window, grouped into time buckets that
+are dropped whole once they expire.
+"""
+
+import base64
+import hashlib
+import hmac
+import heapq
+import logging
+import os
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TokenStore(ABC):
+    """Interface for token stores. Tokens map to (user_id, expires_at)."""
+
+    @abstractmethod
+    def issue(self, user_id: int, ttl: float) -> Tuple[str, float]:
+        """
+        Create a new token for a user.
+
+        Args:
+            user_id: The Discord user ID the token links
+            ttl: Seconds until the token expires
+
+        Returns:
+            Tuple[str, float]: The token and its expiration timestamp
+        """
+
+    @abstractmethod
+    def consume(self, token: str) -> int:
+        """
+        Verify a token and remove it, as one atomic step.
+
+        Args:
+            token: The token to consume
+
+        Returns:
+            int: The Discord user ID the token was issued for
+
+        Raises:
+            ValueError: If the token is invalid or expired
+        """
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Remove expired tokens and return how many were removed."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """The number of tokens (or replay records) held."""
+
+    def close(self):
+        """Release any resources held by the store."""
+
+class StoredTokenStore(TokenStore):
+    """Base for stores that keep every issued token, keyed by a random token string."""
+
+    def issue(self, user_id: int, ttl: float) -> Tuple[str, float]:
+        token = secrets.token_urlsafe(16)
+        expires_at = time.time() + ttl
+        self._put(token, user_id, expires_at)
+        return token, expires_at
+
+    def consume(self, token: str) -> int:
+        # _pop removes the token atomically, so it is checked and deleted in one step
+        entry = self._pop(token)
+        if entry is None:
+            raise ValueError("Invalid token")
+        user_id, expires_at = entry
+        if time.time() > expires_at:
+            raise ValueError("Token has expired")
+        return user_id
+
+    @abstractmethod
+    def _put(self, token: str, user_id: int, expires_at: float):
+        """Store a token."""
+
+    @abstractmethod
+    def _pop(self, token: str) -> Optional[Tuple[int, float]]:
+        """Remove a token and return its (user_id, expires_at), or None if it is unknown."""
+
+class MemoryTokenStore(StoredTokenStore):
+    """Process-local store: a dict of tokens plus a min-heap ordered by expiry."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, Tuple[int, float]] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+
+    def _put(self, token: str, user_id: int, expires_at: float):
+        with self._lock:
+            self._tokens[token] = (user_id, expires_at)
+            heapq.heappush(self._expiry_heap, (expires_at, token))
+
+    def _pop(self, token: str) -> Optional[Tuple[int, float]]:
+        with self._lock:
+            # The heap entry goes stale and is skipped when it reaches the top
+            return self._tokens.pop(token, None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, token = heapq.heappop(self._expiry_heap)
+                entry = self._tokens.get(token)
+                if entry is not None and entry[1] == expires_at:
+                    del self._tokens[token]
+                    removed += 1
+            # Consumed tokens leave stale heap entries; rebuild if they dominate
+            if len(self._expiry_heap) > 2 * len(self._tokens) + 64:
+                self._expiry_heap = [(expires_at, token) for token, (_, expires_at) in self._tokens.items()]
+                heapq.heapify(self._expiry_heap)
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+class SQLiteTokenStore(StoredTokenStore):
+    """Store shared between processes through a SQLite file in WAL mode."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS link_tokens ("
+            " token TEXT PRIMARY KEY, user_id INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS link_tokens_expires_at ON link_tokens (expires_at)")
+
+    def _put(self, token: str, user_id: int, expires_at: float):
+        with self._lock:
+            self._conn.execute("INSERT INTO link_tokens VALUES (?, ?, ?)", (token, user_id, expires_at))
+
+    def _pop(self, token: str) -> Optional[Tuple[int, float]]:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock first, so two processes cannot both read the row
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT user_id, expires_at FROM link_tokens WHERE token = ?", (token,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute("DELETE FROM link_tokens WHERE token = ?", (token,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM link_tokens WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM link_tokens").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ReplayGuard:
+    """
+    In-memory set of consumed token IDs, bucketed by token expiry.
+
+    A token ID only needs remembering until its token expires, so IDs are
+    filed under their expiry bucket and whole buckets are dropped once
+    every token in them has expired.
+    """
+
+    def __init__(self, bucket_seconds: float = 60):
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        self._buckets: Dict[int, Set[bytes]] = {}
+
+    def _bucket(self, expires_at: float) -> int:
+        return int(expires_at // self.bucket_seconds)
+
+    def claim(self, token_id: bytes, expires_at: float) -> bool:
+        """
+        Record a token as consumed.
+
+        Args:
+            token_id: The token's unique ID
+            expires_at: When the token expires
+
+        Returns:
+            bool: True on first use, False if the token was already consumed
+        """
+        bucket = self._bucket(expires_at)
+        with self._lock:
+            consumed = self._buckets.get(bucket)
+            if consumed is None:
+                # Opening a new bucket is a cheap moment to drop expired ones
+                self._drop_expired()
+                consumed = self._buckets[bucket] = set()
+            elif token_id in consumed:
+                return False
+            consumed.add(token_id)
+            return True
+
+    def _drop_expired(self) -> int:
+        current = self._bucket(time.time())
+        removed = 0
+        for bucket in [b for b in self._buckets if b < current]:
+            removed += len(self._buckets.pop(bucket))
+        return removed
+
+    def purge_expired(self) -> int:
+        """Drop buckets whose tokens have all expired; returns how many IDs were dropped."""
+        with self._lock:
+            return self._drop_expired()
+
+    def __len__(self) -> int:
+        return sum(len(consumed) for consumed in self._buckets.values())
+
+    def close(self):
+        """Nothing to release for the in-memory guard."""
+
+class SQLiteReplayGuard(ReplayGuard):
+    """Replay guard shared between processes through a SQLite file in WAL mode."""
+
+    def __init__(self, path: str, bucket_seconds: float = 60):
+        super().__init__(bucket_seconds)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS consumed_tokens (token_id BLOB PRIMARY KEY, bucket INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS consumed_tokens_bucket ON consumed_tokens (bucket)")
+        self._claims = 0
+
+    def claim(self, token_id: bytes, expires_at: float) -> bool:
+        with self._lock:
+            # The primary key makes the insert the atomic first-use check
+            claimed = self._conn.execute(
+                "INSERT OR IGNORE INTO consumed_tokens VALUES (?, ?)", (token_id, self._bucket(expires_at))
+            ).rowcount == 1
+            self._claims += 1
+            if self._claims % 100 == 0:
+                self._drop_expired()
+            return claimed
+
+    def _drop_expired(self) -> int:
+        return self._conn.execute(
+            "DELETE FROM consumed_tokens WHERE bucket < ?", (self._bucket(time.time()),)
+        ).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM consumed_tokens").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class SignedTokenStore(TokenStore):
+    """
+    Stateless tokens: user ID, expiry and a random ID signed with HMAC-SHA256.
+
+    Issuing writes nothing, and verifying needs only the shared secret plus
+    the replay guard, so verification scales across web workers. Use a
+    SQLiteReplayGuard when several processes verify tokens.
+    """
+
+    # user_id (u64), expires_at (u32 seconds), token ID (8 random bytes)
+    _PAYLOAD = struct.Struct(">QI8s")
+    _SIGNATURE_BYTES = 16
+
+    def __init__(self, secret: bytes, replay_guard: Optional[ReplayGuard] = None):
+        if not secret:
+            raise ValueError("A secret is required to sign tokens")
+        self._secret = secret
+        self.replay_guard = replay_guard or ReplayGuard()
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._secret, payload, hashlib.sha256).digest()[:self._SIGNATURE_BYTES]
+
+    def issue(self, user_id: int, ttl: float) -> Tuple[str, float]:
+        expires_at = int(time.time() + ttl)
+        payload = self._PAYLOAD.pack(user_id, expires_at, secrets.token_bytes(8))
+        token = base64.urlsafe_b64encode(payload + self._sign(payload)).rstrip(b"=").decode("ascii")
+        return token, float(expires_at)
+
+    def consume(self, token: str) -> int:
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid token")
+        if len(raw) != self._PAYLOAD.size + self._SIGNATURE_BYTES:
+            raise ValueError("Invalid token")
+
+        payload, signature = raw[:self._PAYLOAD.size], raw[self._PAYLOAD.size:]
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise ValueError("Invalid token")
+
+        user_id, expires_at, token_id = self._PAYLOAD.unpack(payload)
+        if time.time() > expires_at:
+            raise ValueError("Token has expired")
+        if not self.replay_guard.claim(token_id, expires_at):
+            raise ValueError("Token has already been used")
+        return user_id
+
+    def purge_expired(self) -> int:
+        return self.replay_guard.purge_expired()
+
+    def __len__(self) -> int:
+        """Number of consumed tokens still remembered by the replay guard."""
+        return len(self.replay_guard)
+
+    def close(self):
+        self.replay_guard.close()
+
+_token_store: Optional[TokenStore] = None
+_token_store_lock = threading.Lock()
+
+def get_token_store() -> TokenStore:
+    """
+    Get the process-wide token store, creating it on first use.
+
+    With LINK_TOKEN_SECRET set, tokens are signed and stateless. Otherwise
+    the SQLite file named by TOKEN_STORE_PATH is shared by the bot and web
+    processes, and without it tokens are kept in this process's memory. In
+    signed mode TOKEN_STORE_PATH holds only the shared replay guard.
+
+    Returns:
+        TokenStore: The token store
+    """
+    global _token_store
+    with _token_store_lock:
+        if _token_store is None:
+            path = os.getenv("TOKEN_STORE_PATH")
+            secret = os.getenv("LINK_TOKEN_SECRET")
+            if secret:
+                guard = SQLiteReplayGuard(path) if path else ReplayGuard()
+                _token_store = SignedTokenStore(secret.encode("utf-8"), guard)
+                logger.info("Using signed link tokens")
+            elif path:
+                _token_store = SQLiteTokenStore(path)
+                logger.info(f"Using shared token store at {path}")
+            else:
+                _token_store = MemoryTokenStore()
+        return _token_store
@@ -0,0 +1,289 @@
+"""
+Vectorized semantic search over knowledge base paragraphs.
+
+Paragraphs are embedded once at ingest into a contiguous float32 matrix
+with unit-length rows. A query is then scored with a single matrix-vector
+product and the top results are picked with argpartition.
+
+Embedders are pluggable. The default `hashing` embedder needs no network
+or model download: it hashes word and character n-gram features into a
+fixed number of dimensions, so related word forms ("assignment",
+"assignments", "assign") land close together.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+from knowledge.search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+class Embedder(ABC):
+    """
+    Base class for text embedders.
+
+    Subclasses set `name` and `dim` and implement `embed`.
+    """
+    name = "base"
+    dim = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts into unit-length vectors.
+
+        Args:
+            texts: The texts to embed
+
+        Returns:
+            A (len(texts), dim) float32 array with L2-normalized rows
+        """
+
+    @property
+    def signature(self) -> str:
+        """Identifies the embedding space; matrices from another signature are not reused."""
+        return f"{self.name}:{self.dim}"
+
+class HashingEmbedder(Embedder):
+    """Fully local embedder using signed feature hashing of words and character n-grams."""
+    name = "hashing"
+
+    def __init__(self, dim: int = 1024, ngram_range: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}:{self.dim}:{self.ngram_range[0]}-{self.ngram_range[1]}"
+
+    def _features(self, text: str):
+        """Yield the word and character n-gram features of a text."""
+        low, high = self.ngram_range
+        for token in tokenize(text):
+            yield "w:" + token
+            padded = f"<{token}>"
+            for n in range(low, high + 1):
+                for i in range(len(padded) - n + 1):
+                    yield padded[i:i + n]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                matrix[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+
+        # Sublinear term frequency, then unit length so dot product is cosine similarity
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        return matrix
+
+class OpenAIEmbedder(Embedder):
+    """Embedder backed by the OpenAI embeddings API (needs network access)."""
+    name = "openai"
+
+    def __init__(self, model: str = "text-embedding-3-small", dim: int = 1536):
+        self.model = model
+        self.dim = dim
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}:{self.model}:{self.dim}"
+
+    def _get_client(self):
+        """The embedder's client, created on first use and reused (from any thread) after that."""
+        with self._client_lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            return self._client
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        # Blocking HTTP calls: run from a worker thread, never on the event loop
+        client = self._get_client()
+        vectors = []
+        for start in range(0, len(texts), 256):
+            response = client.embeddings.create(model=self.model, input=texts[start:start + 256])
+            vectors.extend(item.embedding for item in response.data)
+
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+# Registered embedders, selectable with KNOWLEDGE_EMBEDDER
+EMBEDDERS: Dict[str, Type[Embedder]] = {
+    HashingEmbedder.name: HashingEmbedder,
+    OpenAIEmbedder.name: OpenAIEmbedder,
+}
+
+def get_embedder(name: Optional[str] = None) -> Embedder:
+    """
+    Create an embedder by name.
+
+    Args:
+        name: A key of EMBEDDERS (defaults to KNOWLEDGE_EMBEDDER or 'hashing')
+
+    Returns:
+        Embedder: The embedder
+
+    Raises:
+        ValueError: If the name is not registered
+    """
+    name = name or os.getenv("KNOWLEDGE_EMBEDDER", HashingEmbedder.name)
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder '{name}'. Available: {', '.join(EMBEDDERS)}")
+    return EMBEDDERS[name]()
+
+def corpus_fingerprint(paragraphs: List[str]) -> str:
+    """Hash of the paragraph list, used to check a saved matrix still matches the corpus."""
+    digest = hashlib.sha1()
+    for paragraph in paragraphs:
+        digest.update(paragraph.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class EmbeddingIndex:
+    """Paragraph embeddings stored as one contiguous float32 matrix."""
+
+    def __init__(self, embedder: Embedder, paragraphs: List[str], matrix: np.ndarray):
+        self.embedder = embedder
+        self.paragraphs = paragraphs
+        self.matrix = matrix
+
+    @classmethod
+    def build(cls, paragraphs: List[str], embedder: Embedder) -> "EmbeddingIndex":
+        """
+        Embed every paragraph.
+
+        Args:
+            paragraphs: The paragraphs to index
+            embedder: The embedder to use
+
+        Returns:
+            EmbeddingIndex: The populated index
+        """
+        if paragraphs:
+            matrix = np.ascontiguousarray(embedder.embed(paragraphs), dtype=np.float32)
+        else:
+            matrix = np.zeros((0, embedder.dim), dtype=np.float32)
+        return cls(embedder, paragraphs, matrix)
+
+    def __len__(self) -> int:
+        return len(self.paragraphs)
+
+    @property
+    def memory_mapped(self) -> bool:
+        """True if the matrix was memory-mapped from a saved file (so it is already on disk)."""
+        return isinstance(self.matrix, np.memmap)
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.0) -> List[Tuple[float, str]]:
+        """
+        Rank paragraphs by cosine similarity to the query.
+
+        Args:
+            query: The user's question
+            k: Maximum number of results to return
+            min_score: Results scoring at or below this are dropped
+
+        Returns:
+            List of (score, paragraph) pairs, best match first
+        """
+        if not self.paragraphs:
+            return []
+
+        scores = self.matrix @ self.embedder.embed([query])[0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.paragraphs[i]) for i in top if scores[i] > min_score]
+
+    def save(self, path: str):
+        """
+        Write the matrix as a .npy file named after its corpus and embedder,
+        then publish it by replacing the JSON manifest at `path` + ".json",
+        which names that file. One replace switches readers to the new
+        matrix and its metadata together; older matrix files are removed.
+
+        Args:
+            path: Destination .npy path; the matrix is saved next to it
+        """
+        fingerprint = corpus_fingerprint(self.paragraphs)
+        root, ext = os.path.splitext(path)
+        ext = ext or ".npy"
+        version = hashlib.sha256(f"{self.embedder.signature}\0{fingerprint}".encode()).hexdigest()[:16]
+        matrix_path = f"{root}.{version}{ext}"
+        tmp_path = f"{matrix_path}.{os.getpid()}.tmp{ext}"
+        tmp_meta_path = f"{path}.json.{os.getpid()}.tmp"
+        try:
+            np.save(tmp_path, self.matrix)
+            os.replace(tmp_path, matrix_path)
+            with open(tmp_meta_path, "w") as f:
+                json.dump({
+                    "matrix": os.path.basename(matrix_path),
+                    "embedder": self.embedder.signature,
+                    "fingerprint": fingerprint,
+                    "rows": int(self.matrix.shape[0]),
+                }, f)
+            os.replace(tmp_meta_path, f"{path}.json")
+        finally:
+            for leftover in (tmp_path, tmp_meta_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        _remove_old_matrices(path, root, ext, matrix_path)
+
+    @classmethod
+    def load(cls, path: str, paragraphs: List[str], embedder: Embedder) -> Optional["EmbeddingIndex"]:
+        """
+        Memory-map a saved matrix if it was built for this corpus and embedder.
+
+        Args:
+            path: The path passed to save
+            paragraphs: The current corpus paragraphs
+            embedder: The embedder queries will use
+
+        Returns:
+            The index, or None if the file is missing or stale
+        """
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            if meta["embedder"] != embedder.signature or meta["fingerprint"] != corpus_fingerprint(paragraphs):
+                return None
+            matrix_path = os.path.join(os.path.dirname(path), os.path.basename(meta["matrix"]))
+            matrix = np.load(matrix_path, mmap_mode="r")
+            if matrix.shape[0] != meta["rows"] or matrix.shape[0] != len(paragraphs):
+                raise ValueError(f"matrix has {matrix.shape[0]} rows, expected {len(paragraphs)}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"Not reusing embeddings from {path}: {e}")
+            return None
+        return cls(embedder, paragraphs, matrix)
+
+def _remove_old_matrices(path: str, root: str, ext: str, keep: str):
+    """Delete matrix files from earlier saves (and the unversioned file older versions wrote)."""
+    directory = os.path.dirname(path) or "."
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"\.[0-9a-f]{16}" + re.escape(ext))
+    stale = [os.path.join(directory, name) for name in os.listdir(directory) if pattern.fullmatch(name)]
+    if os.path.exists(path):
+        stale.append(path)
+    for old in stale:
+        if os.path.abspath(old) == os.path.abspath(keep):
+            continue
+        try:
+            # A reader that already mapped the old file keeps its data until it is unmapped
+            os.remove(old)
+        except OSError as e:
+            logger.debug(f"Could not remove old embeddings {old}: {e}")
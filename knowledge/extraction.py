@@ -0,0 +1,211 @@
+"""
+Structure-aware text extraction and chunking for Google Docs.
+
+`iter_blocks` walks the Docs API JSON once and yields text blocks for
+headings, paragraphs, list items and table rows, each tagged with the
+heading path it sits under. `chunk_document` packs those blocks into
+bounded-size chunks that never straddle a heading, so every chunk is a
+self-contained unit for search and for the prompt.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Target maximum size of a chunk, in characters
+CHUNK_CHARS = int(os.getenv("KNOWLEDGE_CHUNK_CHARS", "800"))
+
+# Heading styles and their nesting depth (TITLE sits above HEADING_1)
+_HEADING_LEVELS = {
+    'TITLE': 0,
+    'HEADING_1': 1,
+    'HEADING_2': 2,
+    'HEADING_3': 3,
+    'HEADING_4': 4,
+    'HEADING_5': 5,
+    'HEADING_6': 6,
+}
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+@dataclass(frozen=True)
+class Block:
+    """A unit of document text: 'heading', 'paragraph', 'list_item' or 'table_row'."""
+    kind: str
+    text: str
+    heading_path: Tuple[str, ...]
+
+@dataclass(frozen=True)
+class Chunk:
+    """A bounded-size piece of a document under a single heading path."""
+    doc_id: str
+    heading_path: Tuple[str, ...]
+    text: str
+
+    def render(self) -> str:
+        """Text with its heading path as a first line, as used for search and prompts."""
+        if self.heading_path:
+            return f"{' > '.join(self.heading_path)}\n{self.text}"
+        return self.text
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to JSON-compatible data."""
+        return {"doc_id": self.doc_id, "heading_path": list(self.heading_path), "text": self.text}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Chunk":
+        """Restore a chunk serialized with to_dict."""
+        return cls(data["doc_id"], tuple(data["heading_path"]), data["text"])
+
+def _paragraph_text(paragraph: Dict[str, Any]) -> str:
+    """Join the text runs (and smart chip titles) of a paragraph."""
+    parts = []
+    for element in paragraph.get('elements', []):
+        if 'textRun' in element:
+            parts.append(element['textRun'].get('content', ''))
+        elif 'richLink' in element:
+            parts.append(element['richLink'].get('richLinkProperties', {}).get('title', ''))
+        elif 'person' in element:
+            parts.append(element['person'].get('personProperties', {}).get('name', ''))
+    # Vertical tabs are soft line breaks inside a paragraph
+    return ''.join(parts).replace('\x0b', '\n').strip()
+
+def _is_ordered(document: Dict[str, Any], list_id: str, level: int) -> bool:
+    """Whether a list level is numbered rather than bulleted."""
+    try:
+        nesting = document['lists'][list_id]['listProperties']['nestingLevels'][level]
+    except (KeyError, IndexError):
+        return False
+    glyph_type = nesting.get('glyphType', 'GLYPH_TYPE_UNSPECIFIED')
+    return glyph_type not in ('GLYPH_TYPE_UNSPECIFIED', 'NONE') and 'glyphSymbol' not in nesting
+
+def _cell_text(cell: Dict[str, Any]) -> str:
+    """Flatten the content of a table cell into one line."""
+    texts = []
+    for element in cell.get('content', []):
+        if 'paragraph' in element:
+            text = _paragraph_text(element['paragraph'])
+            if text:
+                texts.append(text)
+    return ' '.join(texts).replace('\n', ' ')
+
+def iter_blocks(document: Dict[str, Any]) -> Iterator[Block]:
+    """
+    Walk a Docs API document once, yielding its text blocks in order.
+
+    Args:
+        document: The document resource returned by the Docs API
+
+    Yields:
+        Block: Headings, paragraphs, list items and table rows
+    """
+    headings: List[Tuple[int, str]] = []
+    list_counters: Dict[Tuple[str, int], int] = {}
+
+    def path() -> Tuple[str, ...]:
+        return tuple(text for _, text in headings)
+
+    def walk(elements: List[Dict[str, Any]]) -> Iterator[Block]:
+        for element in elements:
+            if 'paragraph' in element:
+                paragraph = element['paragraph']
+                text = _paragraph_text(paragraph)
+                if not text:
+                    continue
+
+                style = paragraph.get('paragraphStyle', {}).get('namedStyleType', 'NORMAL_TEXT')
+                level = _HEADING_LEVELS.get(style)
+                if level is not None:
+                    while headings and headings[-1][0] >= level:
+                        headings.pop()
+                    headings.append((level, text))
+                    yield Block('heading', text, path())
+                    continue
+
+                bullet = paragraph.get('bullet')
+                if bullet is not None:
+                    list_id = bullet.get('listId', '')
+                    nesting = bullet.get('nestingLevel', 0)
+                    indent = '  ' * nesting
+                    # A new item ends any deeper sub-list, so the next one starts again at 1
+                    for key in [key for key in list_counters if key[0] == list_id and key[1] > nesting]:
+                        del list_counters[key]
+                    if _is_ordered(document, list_id, nesting):
+                        key = (list_id, nesting)
+                        list_counters[key] = list_counters.get(key, 0) + 1
+                        marker = f"{list_counters[key]}."
+                    else:
+                        marker = '-'
+                    yield Block('list_item', f"{indent}{marker} {text}", path())
+                else:
+                    yield Block('paragraph', text, path())
+
+            elif 'table' in element:
+                for row in element['table'].get('tableRows', []):
+                    cells = [_cell_text(cell) for cell in row.get('tableCells', [])]
+                    if any(cells):
+                        yield Block('table_row', ' | '.join(cells), path())
+
+    yield from walk(document.get('body', {}).get('content', []))
+
+def _split_long(text: str, max_chars: int) -> Iterator[str]:
+    """Split an oversized block at sentence boundaries (or hard-wrap as a last resort)."""
+    if len(text) <= max_chars:
+        yield text
+        return
+
+    current: List[str] = []
+    size = 0
+    for sentence in _SENTENCE_END_RE.split(text):
+        while len(sentence) > max_chars:
+            if current:
+                yield ' '.join(current)
+                current, size = [], 0
+            yield sentence[:max_chars]
+            sentence = sentence[max_chars:]
+        if current and size + len(sentence) + 1 > max_chars:
+            yield ' '.join(current)
+            current, size = [], 0
+        current.append(sentence)
+        size += len(sentence) + 1
+    if current:
+        yield ' '.join(current)
+
+def chunk_document(document: Dict[str, Any], doc_id: str, max_chars: Optional[int] = None) -> Iterator[Chunk]:
+    """
+    Split a document into chunks of at most `max_chars` characters.
+
+    A chunk only holds blocks from one section; a new heading always starts
+    a new chunk.
+
+    Args:
+        document: The document resource returned by the Docs API
+        doc_id: The Google Doc ID, recorded on every chunk
+        max_chars: Chunk size limit (defaults to KNOWLEDGE_CHUNK_CHARS)
+
+    Yields:
+        Chunk: The document's chunks in reading order
+    """
+    max_chars = max_chars or CHUNK_CHARS
+    buffer: List[str] = []
+    size = 0
+    heading_path: Tuple[str, ...] = ()
+
+    for block in iter_blocks(document):
+        if block.kind == 'heading':
+            if buffer:
+                yield Chunk(doc_id, heading_path, '\n'.join(buffer))
+                buffer, size = [], 0
+            heading_path = block.heading_path
+            continue
+
+        for piece in _split_long(block.text, max_chars):
+            if buffer and size + len(piece) + 1 > max_chars:
+                yield Chunk(doc_id, heading_path, '\n'.join(buffer))
+                buffer, size = [], 0
+            buffer.append(piece)
+            size += len(piece) + 1
+
+    if buffer:
+        yield Chunk(doc_id, heading_path, '\n'.join(buffer))
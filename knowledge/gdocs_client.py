@@ -1,25 +1,74 @@
 import os
 import logging
 import asyncio
-from typing import Optional, List, Dict, Any
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Set, Tuple
 from dotenv import load_dotenv
 
+from knowledge.extraction import Chunk, chunk_document
+from knowledge.google_services import CredentialsError, batch_get_documents, drive_service
+from knowledge.search_index import SearchIndex
+from knowledge.snapshot import Snapshot, SnapshotError, load_snapshot, save_snapshot
+from utils.metrics import span
+from utils.singleflight import SingleFlight
+
+# numpy and the embedders are only imported in semantic and hybrid search modes
+if TYPE_CHECKING:
+    from knowledge.embeddings import EmbeddingIndex
+
 # Load environment variables
 load_dotenv()
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Configuration
-SCOPES = ['https://www.googleapis.com/auth/documents.readonly', 
-          'https://www.googleapis.com/auth/drive.readonly']
+# Maximum number of paragraphs returned for a single question
+MAX_RESULTS = 5
+
+# How often the background refresher checks Google for edited documents (seconds, 0 disables)
+REFRESH_INTERVAL = int(os.getenv("KNOWLEDGE_REFRESH_INTERVAL", "300"))
+
+# On-disk snapshot used to start answering without calling Google
+SNAPSHOT_PATH = os.getenv("KNOWLEDGE_SNAPSHOT_PATH", "knowledge_snapshot.bin")
+
+# Retrieval mode: "bm25" (keywords), "semantic" (embeddings) or "hybrid" (both, rank-fused)
+SEARCH_MODE = os.getenv("KNOWLEDGE_SEARCH_MODE", "bm25").lower()
+
+# Minimum cosine similarity for a semantic match to be returned
+SEMANTIC_MIN_SCORE = float(os.getenv("KNOWLEDGE_SEMANTIC_MIN_SCORE", "0.1"))
+
+# Paragraph embedding matrix, stored next to the snapshot so it is not recomputed at startup
+EMBEDDINGS_PATH = os.getenv("KNOWLEDGE_EMBEDDINGS_PATH", f"{SNAPSHOT_PATH}.embeddings.npy")
+
+# Cache of each document's chunks to minimize API calls
+_document_cache: Dict[str, List[Chunk]] = {}
+
+# Revision ID of each cached document, used to skip unchanged documents on refresh
+_document_revisions: Dict[str, str] = {}
+
+# Drive changes feed position; None until the first refresh asks for a start token
+_changes_page_token: Optional[str] = None
+
+# Whether load_knowledge_snapshot has already run in this process
+_snapshot_loaded = False
 
-# Cache for document content to minimize API calls
-_document_cache = {}
+# Whether this process writes the snapshot; shard workers other than the first only read it
+SNAPSHOT_WRITES = True
+
+# Modification time of the snapshot file this process last loaded
+_snapshot_mtime: Optional[float] = None
+
+# BM25 index over the cached documents, rebuilt whenever the cache changes
+_search_index = SearchIndex()
+
+# Embeddings of the same paragraphs, only kept when SEARCH_MODE uses them
+_embedding_index: Optional["EmbeddingIndex"] = None
+
+# Coalesces concurrent cache-miss fetches so each document is downloaded once
+_document_flight = SingleFlight("documents")
+
+# Serializes "copy the cache, build the indexes, swap them in", so a load and a
+# refresh finishing together cannot drop each other's documents
+_index_lock = asyncio.Lock()
 
 async def fetch_knowledge(query: str) -> Optional[str]:
     """
@@ -32,29 +81,77 @@ async def fetch_knowledge(query: str) -> Optional[str]:
         A string containing relevant information or None if no relevant info is found
     """
     try:
-        # Get the document IDs from environment variables
-        doc_ids_str = os.getenv("GOOGLE_DOC_IDS")
-        if not doc_ids_str:
-            logger.warning("GOOGLE_DOC_IDS not found in environment variables.")
-            return None
-            
-        doc_ids = [doc_id.strip() for doc_id in doc_ids_str.split(',')]
+        with span("documents"):
+            if not await _ensure_documents():
+                return None
         
-        # Prepare the documents (fetch them from Google Docs)
-        docs_content = await asyncio.gather(*[
-            _get_document_content(doc_id) for doc_id in doc_ids
-        ])
-        
-        # For now, implement a simple keyword-based search
-        # In a more advanced implementation, you could use embeddings or a better search algorithm
-        relevant_content = _simple_search(query, docs_content)
-        
-        return relevant_content
+        with span("search"):
+            return _format_results(await _rank_off_loop(query, MAX_RESULTS))
     except Exception as e:
         logger.error(f"Error fetching knowledge: {e}")
         return None
 
-async def _get_document_content(doc_id: str) -> str:
+async def fetch_knowledge_passages(query: str, k: int = 10) -> List[str]:
+    """
+    Fetch the knowledge passages most relevant to the query, without truncation.
+    
+    Args:
+        query: The user's question
+        k: Maximum number of passages
+    
+    Returns:
+        The passages, best match first (empty if nothing relevant is found)
+    """
+    try:
+        with span("documents"):
+            if not await _ensure_documents():
+                return []
+        
+        with span("search"):
+            return [passage for _, passage in await _rank_off_loop(query, k)]
+    except Exception as e:
+        logger.error(f"Error fetching knowledge: {e}")
+        return []
+
+async def _ensure_documents() -> bool:
+    """
+    Make sure every configured document is loaded and indexed.
+    
+    Returns:
+        bool: False if no documents are configured
+    """
+    doc_ids = _get_doc_ids()
+    if not doc_ids:
+        return False
+    
+    # Serve from the on-disk snapshot if we have not loaded anything yet
+    if not _snapshot_loaded:
+        await _document_flight.do("snapshot", lambda: asyncio.to_thread(load_knowledge_snapshot))
+    
+    # Fetch and index any documents that are not cached yet
+    await _get_documents_content(doc_ids)
+    return True
+
+async def warm_up() -> int:
+    """
+    Load the snapshot and fetch any missing documents ahead of the first question.
+    
+    Returns:
+        int: The number of indexed passages
+    """
+    with span("documents"):
+        await _ensure_documents()
+    return len(_search_index)
+
+def _get_doc_ids() -> List[str]:
+    """Get the knowledge base document IDs from environment variables."""
+    doc_ids_str = os.getenv("GOOGLE_DOC_IDS")
+    if not doc_ids_str:
+        logger.warning("GOOGLE_DOC_IDS not found in environment variables.")
+        return []
+    return [doc_id.strip() for doc_id in doc_ids_str.split(',') if doc_id.strip()]
+
+async def _get_document_content(doc_id: str) -> List[Chunk]:
     """
     Get content from a Google Doc by its ID.
     Uses caching to minimize API calls.
@@ -63,25 +160,82 @@ async def _get_document_content(doc_id: str) -> str:
         doc_id: The Google Doc ID
     
     Returns:
-        The document content as a string
+        The document's chunks
+    """
+    contents = await _get_documents_content([doc_id])
+    return contents[doc_id]
+
+async def _get_documents_content(doc_ids: List[str]) -> Dict[str, List[Chunk]]:
+    """
+    Get content from several Google Docs, fetching the uncached ones in one batch.
+    Documents already being fetched by a concurrent call are waited on, not refetched.
+    
+    Args:
+        doc_ids: The Google Doc IDs
+    
+    Returns:
+        Mapping of document ID to chunks (empty for documents that could not be read)
+    """
+    missing = [doc_id for doc_id in doc_ids if doc_id not in _document_cache]
+    if missing:
+        await _document_flight.do_batch(missing, _load_documents)
+    
+    return {doc_id: _document_cache.get(doc_id, []) for doc_id in doc_ids}
+
+async def _load_documents(doc_ids: List[str]):
+    """
+    Download documents into the cache, then reindex and save the snapshot.
+    
+    Args:
+        doc_ids: The Google Doc IDs to download
     """
-    # Check if document is in cache
-    if doc_id in _document_cache:
-        return _document_cache[doc_id]
-        
     try:
         # Run the API call in a thread to avoid blocking
-        content = await asyncio.to_thread(_fetch_gdoc_content, doc_id)
+        fetched = await asyncio.to_thread(_fetch_gdoc_contents, doc_ids)
+    except Exception as e:
+        logger.error(f"Error retrieving documents {doc_ids}: {e}")
+        fetched = {}
         
-        # Cache the result
-        _document_cache[doc_id] = content
+    async with _index_lock:
+        # Add the results to the latest cache and build the new indexes off the event loop
+        new_cache = dict(_document_cache)
+        new_revisions = dict(_document_revisions)
+        for doc_id in doc_ids:
+            chunks, revision_id = fetched.get(doc_id, ([], None))
+            new_cache[doc_id] = chunks
+            if revision_id:
+                new_revisions[doc_id] = revision_id
+        await _rebuild_index(new_cache, new_revisions)
+        snapshot = current_snapshot()
+    await asyncio.to_thread(save_knowledge_snapshot, snapshot)
+
+def _fetch_gdoc_contents(doc_ids: List[str]) -> Dict[str, Tuple[List[Chunk], Optional[str]]]:
+    """
+    Synchronous function to fetch several Google Docs in a single batch request.
+    
+    Args:
+        doc_ids: The Google Doc IDs
+    
+    Returns:
+        Mapping of document ID to (chunks, revision ID) for the documents that could be read
+    """
+    from googleapiclient.errors import HttpError
+    
+    try:
+        documents = batch_get_documents(doc_ids)
+    except CredentialsError as e:
+        logger.error(str(e))
+        return {}
+    except HttpError as e:
+        logger.error(f"HttpError while retrieving documents {doc_ids}: {e}")
+        return {}
         
-        return content
-    except Exception as e:
-        logger.error(f"Error retrieving document {doc_id}: {e}")
-        return ""
+    return {
+        doc_id: (list(chunk_document(document, doc_id)), document.get('revisionId'))
+        for doc_id, document in documents.items()
+    }
 
-def _fetch_gdoc_content(doc_id: str) -> str:
+def _fetch_gdoc_content(doc_id: str) -> Tuple[List[Chunk], Optional[str]]:
     """
     Synchronous function to fetch Google Doc content.
     
@@ -89,74 +243,382 @@ def _fetch_gdoc_content(doc_id: str) -> str:
         doc_id: The Google Doc ID
     
     Returns:
-        The document content as a string
+        The document's chunks and its revision ID
+    """
+    return _fetch_gdoc_contents([doc_id]).get(doc_id, ([], None))
+
+def _fetch_revision_ids(doc_ids: List[str]) -> Dict[str, str]:
+    """
+    Synchronous function to fetch the current revision ID of each document.
+    Only the revisionId field is requested, so this is much cheaper than a full fetch.
+    
+    Args:
+        doc_ids: The Google Doc IDs
+    
+    Returns:
+        Mapping of document ID to revision ID for the documents that could be read
     """
+    from googleapiclient.errors import HttpError
+    
     try:
-        # Get credentials from the credentials file
-        creds_path = os.getenv("GOOGLE_API_CREDENTIALS")
-        if not creds_path:
-            logger.error("GOOGLE_API_CREDENTIALS not found in environment variables.")
-            return ""
+        documents = batch_get_documents(doc_ids, fields='revisionId')
+    except (CredentialsError, HttpError) as e:
+        logger.error(f"Error checking document revisions: {e}")
+        return {}
+        
+    return {doc_id: document.get('revisionId') for doc_id, document in documents.items()}
+
+def _list_changed_files(page_token: Optional[str]) -> Tuple[Optional[Set[str]], str]:
+    """
+    Synchronous function to read the Drive changes feed.
+    
+    Args:
+        page_token: The saved feed position, or None to start a new feed
+    
+    Returns:
+        The IDs of files changed since page_token (None when starting a new feed)
+        and the page token to use for the next poll
+    """
+    with drive_service() as drive:
+        changes = drive.changes()
+        if page_token is None:
+            start = changes.getStartPageToken(supportsAllDrives=True).execute()
+            return None, start['startPageToken']
             
-        credentials = service_account.Credentials.from_service_account_file(
-            creds_path, scopes=SCOPES)
+        changed: Set[str] = set()
+        while True:
+            response = changes.list(
+                pageToken=page_token,
+                fields='nextPageToken,newStartPageToken,changes(fileId)',
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                pageSize=1000
+            ).execute()
+            changed.update(change['fileId'] for change in response.get('changes', []))
             
-        # Build the Docs API client without proxies to avoid compatibility issues
-        docs_service = build('docs', 'v1', credentials=credentials, cache_discovery=False)
-        
-        # Get the document
-        document = docs_service.documents().get(documentId=doc_id).execute()
-        
-        # Extract text content
-        content = ""
-        if 'body' in document and 'content' in document['body']:
-            for element in document['body']['content']:
-                if 'paragraph' in element:
-                    for paragraph_element in element['paragraph']['elements']:
-                        if 'textRun' in paragraph_element:
-                            content += paragraph_element['textRun']['content']
-                            
-        return content
-    except HttpError as e:
-        logger.error(f"HttpError while retrieving document {doc_id}: {e}")
-        return ""
-    except Exception as e:
-        logger.error(f"Error retrieving document {doc_id}: {e}")
-        return ""
+            if 'newStartPageToken' in response:
+                return changed, response['newStartPageToken']
+            page_token = response['nextPageToken']
 
-def _simple_search(query: str, documents: List[str]) -> Optional[str]:
+async def refresh_knowledge(save: bool = True) -> int:
     """
-    Simple keyword-based search to find relevant info in documents.
+    Re-download the knowledge base documents that changed since the last check.
+    
+    The Drive changes feed narrows the check to edited files. If the feed is
+    unavailable (or on the first run), each document's revisionId is compared
+    with the cached one instead. Old content keeps being served until the new
+    index has been built.
     
     Args:
-        query: The user's question
-        documents: List of document content strings
+        save: Whether to write the updated snapshot to disk
+    
+    Returns:
+        int: The number of documents that were updated
+    """
+    doc_ids = _get_doc_ids()
+    if not doc_ids:
+        return 0
+        
+    previous_token = _changes_page_token
+    updated = await _refresh_documents(doc_ids)
+    
+    # Persist new content and the new feed position so a restart resumes from here
+    if save and _document_cache and (updated or _changes_page_token != previous_token):
+        await asyncio.to_thread(save_knowledge_snapshot, current_snapshot())
+    return updated
+
+async def _refresh_documents(doc_ids: List[str]) -> int:
+    """
+    Find changed documents, download them and swap in a new index.
+    
+    Args:
+        doc_ids: The configured Google Doc IDs
     
     Returns:
-        Relevant content if found, None otherwise
+        int: The number of documents that were updated
     """
-    # Convert query to lowercase for case-insensitive matching
-    query_terms = query.lower().split()
+    global _changes_page_token
     
-    relevant_paragraphs = []
+    candidates = list(doc_ids)
+    try:
+        changed, _changes_page_token = await asyncio.to_thread(_list_changed_files, _changes_page_token)
+        if changed is not None:
+            candidates = [doc_id for doc_id in doc_ids if doc_id in changed or doc_id not in _document_cache]
+    except Exception as e:
+        logger.warning(f"Drive changes feed unavailable, falling back to revision checks: {e}")
+        _changes_page_token = None
+        
+    if not candidates:
+        return 0
+        
+    # Only download documents whose revision actually moved
+    revisions = await asyncio.to_thread(_fetch_revision_ids, candidates)
+    stale = [
+        doc_id for doc_id in candidates
+        if doc_id not in _document_cache
+        or (revisions.get(doc_id) and revisions[doc_id] != _document_revisions.get(doc_id))
+    ]
+    if not stale:
+        return 0
+        
+    # Download every stale document in one batch request
+    fetched = await asyncio.to_thread(_fetch_gdoc_contents, stale)
     
-    for doc in documents:
-        if not doc:
-            continue
+    async with _index_lock:
+        # Start from the latest cache: documents may have been loaded during the download
+        new_cache = dict(_document_cache)
+        new_revisions = dict(_document_revisions)
+        updated = 0
+        for doc_id in stale:
+            chunks, revision_id = fetched.get(doc_id, ([], None))
+            # Keep serving the previous version if the download failed
+            if not revision_id and doc_id in new_cache:
+                continue
+            new_cache[doc_id] = chunks
+            if revision_id:
+                new_revisions[doc_id] = revision_id
+            updated += 1
+            
+        if not updated:
+            return 0
             
-        # Split document into paragraphs
-        paragraphs = [p for p in doc.split('\n\n') if p.strip()]
+        await _rebuild_index(new_cache, new_revisions)
+    logger.info(f"Refreshed {updated} knowledge document(s)")
+    return updated
+
+async def run_knowledge_refresher(interval: Optional[int] = None):
+    """
+    Background task that keeps the document cache in sync with Google Docs.
+    
+    Args:
+        interval: Seconds between checks (defaults to KNOWLEDGE_REFRESH_INTERVAL)
+    """
+    interval = REFRESH_INTERVAL if interval is None else interval
+    if interval <= 0:
+        logger.info("Knowledge refresh disabled")
+        return
         
-        for paragraph in paragraphs:
-            paragraph_lower = paragraph.lower()
+    # Reconcile the snapshot we started from with Google right away
+    if not _snapshot_loaded:
+        await asyncio.to_thread(load_knowledge_snapshot)
+    
+    logger.info(f"Starting knowledge refresh task (every {interval}s)")
+    while True:
+        try:
+            await refresh_knowledge()
+        except Exception as e:
+            logger.error(f"Error refreshing knowledge: {e}")
+        await asyncio.sleep(interval)
+
+async def _rebuild_index(cache: Dict[str, List[Chunk]], revisions: Dict[str, str]):
+    """
+    Build the search indexes for a new document cache off the event loop, then swap everything in at once.
+    Callers hold _index_lock and pass a copy of the latest cache with their changes applied.
+    """
+    index = await asyncio.to_thread(_build_index, cache)
+    embeddings = await asyncio.to_thread(_build_embeddings, index)
+    _swap_index(cache, revisions, index, embeddings)
+    logger.info(f"Indexed {len(index)} chunks from {len(cache)} document(s)")
+
+def _build_index(cache: Dict[str, List[Chunk]]) -> SearchIndex:
+    """Build a BM25 index over every chunk in a document cache."""
+    return SearchIndex.build(chunk for chunks in cache.values() for chunk in chunks)
+
+def _build_embeddings(index: SearchIndex, saved_path: Optional[str] = None) -> Optional["EmbeddingIndex"]:
+    """
+    Embed the paragraphs of a search index if the search mode needs embeddings.
+    
+    Args:
+        index: The BM25 index whose paragraphs should be embedded
+        saved_path: A saved matrix to reuse if it matches these paragraphs
+    
+    Returns:
+        The embedding index, or None in bm25 mode
+    """
+    if SEARCH_MODE not in ("semantic", "hybrid"):
+        return None
+        
+    from knowledge.embeddings import EmbeddingIndex, get_embedder
+    embedder = get_embedder()
+    if saved_path:
+        embeddings = EmbeddingIndex.load(saved_path, index.paragraphs, embedder)
+        if embeddings is not None:
+            return embeddings
             
-            # Check if any query terms are in the paragraph
-            if any(term in paragraph_lower for term in query_terms):
-                relevant_paragraphs.append(paragraph.strip())
-                
-    if relevant_paragraphs:
-        # Join the relevant paragraphs, limited to a reasonable length
-        result = "\n\n".join(relevant_paragraphs[:5])  # Limit to 5 paragraphs
+    return EmbeddingIndex.build(index.paragraphs, embedder)
+
+def _swap_index(cache: Dict[str, List[Chunk]], revisions: Dict[str, str], index: SearchIndex,
+                embeddings: Optional["EmbeddingIndex"] = None):
+    """Replace the cache, revisions and indexes together so searches never see a mix."""
+    global _document_cache, _document_revisions, _search_index, _embedding_index
+    _document_cache = cache
+    _document_revisions = revisions
+    _search_index = index
+    _embedding_index = embeddings
+
+def current_index() -> SearchIndex:
+    """The search index currently serving queries (replaced, never mutated, when documents change)."""
+    return _search_index
+
+def current_snapshot() -> Snapshot:
+    """Capture the current cache, revisions, index and feed position as a snapshot."""
+    return Snapshot(
+        documents=dict(_document_cache),
+        revisions=dict(_document_revisions),
+        index=_search_index,
+        page_token=_changes_page_token
+    )
+
+def load_knowledge_snapshot(path: Optional[str] = None) -> bool:
+    """
+    Load the on-disk snapshot into the cache if nothing has been fetched yet.
+    
+    Args:
+        path: Snapshot file path (defaults to KNOWLEDGE_SNAPSHOT_PATH)
+    
+    Returns:
+        bool: True if a snapshot was loaded
+    """
+    global _snapshot_loaded, _changes_page_token, _snapshot_mtime
+    _snapshot_loaded = True
+    path = path or SNAPSHOT_PATH
+    
+    if _document_cache or not os.path.exists(path):
+        return False
+        
+    try:
+        mtime = os.path.getmtime(path)
+        snapshot = load_snapshot(path)
+    except SnapshotError as e:
+        logger.warning(f"Ignoring knowledge snapshot {path}: {e}")
+        return False
+        
+    embeddings = _build_embeddings(snapshot.index, saved_path=EMBEDDINGS_PATH)
+    _swap_index(snapshot.documents, snapshot.revisions, snapshot.index, embeddings)
+    _changes_page_token = snapshot.page_token
+    _snapshot_mtime = mtime
+    logger.info(f"Loaded knowledge snapshot with {len(snapshot.documents)} document(s) from {path}")
+    return True
+
+async def reload_knowledge_snapshot(path: Optional[str] = None) -> bool:
+    """
+    Swap in the on-disk snapshot if it changed since this process last loaded it.
+    
+    Args:
+        path: Snapshot file path (defaults to KNOWLEDGE_SNAPSHOT_PATH)
+    
+    Returns:
+        bool: True if a newer snapshot was loaded
+    """
+    global _snapshot_mtime, _changes_page_token
+    path = path or SNAPSHOT_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return False
+    if mtime == _snapshot_mtime:
+        return False
+        
+    try:
+        snapshot = await asyncio.to_thread(load_snapshot, path)
+    except SnapshotError as e:
+        logger.warning(f"Ignoring knowledge snapshot {path}: {e}")
+        return False
+        
+    async with _index_lock:
+        embeddings = await asyncio.to_thread(_build_embeddings, snapshot.index, EMBEDDINGS_PATH)
+        _swap_index(snapshot.documents, snapshot.revisions, snapshot.index, embeddings)
+        _changes_page_token = snapshot.page_token
+        _snapshot_mtime = mtime
+    logger.info(f"Reloaded knowledge snapshot with {len(snapshot.documents)} document(s) from {path}")
+    return True
+
+async def run_snapshot_follower(interval: Optional[int] = None):
+    """
+    Background task for processes that do not refresh from Google themselves:
+    pick up the snapshot written by the process that does.
+    
+    Args:
+        interval: Seconds between checks (defaults to KNOWLEDGE_REFRESH_INTERVAL)
+    """
+    interval = REFRESH_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return
+        
+    logger.info(f"Following the knowledge snapshot {SNAPSHOT_PATH} (every {interval}s)")
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reload_knowledge_snapshot()
+        except Exception as e:
+            logger.error(f"Error reloading knowledge snapshot: {e}")
+
+def save_knowledge_snapshot(snapshot: Optional[Snapshot] = None, path: Optional[str] = None):
+    """
+    Write the knowledge base to the on-disk snapshot.
+    
+    Args:
+        snapshot: The snapshot to write (defaults to the current knowledge base)
+        path: Snapshot file path (defaults to KNOWLEDGE_SNAPSHOT_PATH)
+    """
+    if not SNAPSHOT_WRITES:
+        return
+    path = path or SNAPSHOT_PATH
+    try:
+        save_snapshot(path, snapshot or current_snapshot())
+    except OSError as e:
+        logger.error(f"Error writing knowledge snapshot {path}: {e}")
+        
+    # A memory-mapped matrix was loaded from disk and is already saved
+    embeddings = _embedding_index
+    if embeddings is not None and not embeddings.memory_mapped:
+        try:
+            embeddings.save(EMBEDDINGS_PATH)
+        except OSError as e:
+            logger.error(f"Error writing knowledge embeddings {EMBEDDINGS_PATH}: {e}")
+
+def _rank(query: str, k: int) -> List[Tuple[float, str]]:
+    """
+    Rank paragraphs for a query according to SEARCH_MODE.
+    
+    Args:
+        query: The user's question
+        k: Maximum number of results
+    
+    Returns:
+        List of (score, paragraph) pairs, best match first
+    """
+    # Read both once: the ranking may run in a thread while a refresh swaps in new indexes
+    index, embeddings = _search_index, _embedding_index
+    if embeddings is None:
+        return index.search(query, k=k)
+    if SEARCH_MODE == "semantic":
+        return embeddings.search(query, k=k, min_score=SEMANTIC_MIN_SCORE)
+        
+    # Hybrid: reciprocal rank fusion of the keyword and semantic rankings
+    fused: Dict[str, float] = {}
+    for ranking in (index.search(query, k=k * 2), embeddings.search(query, k=k * 2, min_score=SEMANTIC_MIN_SCORE)):
+        for rank, (_, paragraph) in enumerate(ranking):
+            fused[paragraph] = fused.get(paragraph, 0.0) + 1.0 / (60 + rank)
+    best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(score, paragraph) for paragraph, score in best]
+
+async def _rank_off_loop(query: str, k: int) -> List[Tuple[float, str]]:
+    """
+    Rank paragraphs for a query without blocking the event loop.
+    
+    BM25 lookups are fast and run inline. Embedding the query (an HTTP call
+    with the openai embedder) runs in a worker thread.
+    """
+    if _embedding_index is None:
+        return _rank(query, k)
+    return await asyncio.to_thread(_rank, query, k)
+
+def _format_results(results: List[Tuple[float, str]]) -> Optional[str]:
+    """Join ranked paragraphs into one knowledge string, or None if there are none."""
+    if results:
+        # Join the relevant paragraphs, best match first
+        result = "\n\n".join(paragraph for _, paragraph in results)
         
         # If the result is too long, truncate it
         if len(result) > 2000:
@@ -164,4 +626,4 @@ def _simple_search(query: str, documents: List[str]) -> Optional[str]:
             
         return result
     
-    return None 
\ No newline at end of file
+    return None
@@ -0,0 +1,219 @@
+"""
+Shared Google API credentials and pooled service clients.
+
+Credentials are loaded from the service account file once per process and
+refreshed in place when the access token expires. Docs and Drive clients
+are built once and reused, each with its own keep-alive HTTP connection
+(httplib2 connections are not thread-safe, so clients are lent out to one
+thread at a time). Several document reads are sent as one batch request.
+The Google client libraries are imported on first use, not at startup.
+"""
+
+import os
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ['https://www.googleapis.com/auth/documents.readonly',
+          'https://www.googleapis.com/auth/drive.readonly']
+
+# Maximum clients kept per API; more concurrent borrowers wait for one to be returned
+POOL_SIZE = int(os.getenv("GOOGLE_API_POOL_SIZE", "4"))
+
+# Socket timeout for Google API calls, in seconds
+HTTP_TIMEOUT = 30
+
+# Google accepts at most 100 calls per batch request
+BATCH_LIMIT = 100
+
+_credentials = None
+_credentials_lock = threading.Lock()
+_pools: Dict[str, "ServicePool"] = {}
+_pools_lock = threading.Lock()
+
+class CredentialsError(Exception):
+    """Raised when the Google service account credentials are not configured."""
+
+def get_credentials():
+    """
+    Get the shared service account credentials, loading them on first use.
+
+    The access token is refreshed under a lock so concurrent threads do not
+    each perform their own OAuth token exchange.
+
+    Returns:
+        The shared credentials object
+
+    Raises:
+        CredentialsError: If GOOGLE_API_CREDENTIALS is not set
+    """
+    global _credentials
+    from google.auth.transport.requests import Request
+    from google.oauth2 import service_account
+
+    with _credentials_lock:
+        if _credentials is None:
+            creds_path = os.getenv("GOOGLE_API_CREDENTIALS")
+            if not creds_path:
+                raise CredentialsError("GOOGLE_API_CREDENTIALS not found in environment variables.")
+            _credentials = service_account.Credentials.from_service_account_file(
+                creds_path, scopes=SCOPES)
+
+        if not _credentials.valid:
+            _credentials.refresh(Request())
+            logger.info("Refreshed Google API access token")
+
+        return _credentials
+
+class ServicePool:
+    """
+    Thread-safe pool of clients for one Google API.
+
+    Clients are created lazily up to `size` and handed out by `borrow()`.
+    """
+
+    def __init__(self, name: str, version: str, size: int = POOL_SIZE):
+        self.name = name
+        self.version = version
+        self.size = size
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create(self):
+        """Build a new client with its own authorized keep-alive connection."""
+        import google_auth_httplib2
+        import httplib2
+        from googleapiclient.discovery import build
+
+        http = google_auth_httplib2.AuthorizedHttp(
+            get_credentials(), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        # Static discovery documents ship with the library, so this makes no network call
+        return build(self.name, self.version, http=http, cache_discovery=False, static_discovery=True)
+
+    @contextmanager
+    def borrow(self) -> Iterator:
+        """
+        Borrow a client for the duration of a `with` block.
+
+        Yields:
+            A googleapiclient service object
+        """
+        try:
+            service = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    service = self._create()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                service = self._idle.get()
+
+        try:
+            # Make sure the shared token is fresh before the client uses it
+            get_credentials()
+            yield service
+        finally:
+            self._idle.put(service)
+
+def get_pool(name: str, version: str) -> ServicePool:
+    """
+    Get the process-wide client pool for a Google API.
+
+    Args:
+        name: The API name, e.g. 'docs' or 'drive'
+        version: The API version
+
+    Returns:
+        ServicePool: The shared pool
+    """
+    key = f"{name}/{version}"
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ServicePool(name, version)
+        return _pools[key]
+
+def docs_service():
+    """Borrow a pooled Google Docs v1 client (use as a context manager)."""
+    return get_pool('docs', 'v1').borrow()
+
+def drive_service():
+    """Borrow a pooled Google Drive v3 client (use as a context manager)."""
+    return get_pool('drive', 'v3').borrow()
+
+def warm_up() -> bool:
+    """
+    Load the credentials and build one Docs and one Drive client ahead of the first request.
+
+    Returns:
+        bool: False if the credentials are not configured
+    """
+    try:
+        with docs_service(), drive_service():
+            return True
+    except CredentialsError as e:
+        logger.warning(f"Skipping Google API warm-up: {e}")
+        return False
+
+def batch_get_documents(doc_ids: List[str], fields: Optional[str] = None,
+                        on_error: Optional[Callable[[str, Exception], None]] = None) -> Dict[str, dict]:
+    """
+    Fetch several Google Docs with as few HTTP round-trips as possible.
+
+    Args:
+        doc_ids: The Google Doc IDs
+        fields: Optional partial-response field mask, e.g. 'revisionId'
+        on_error: Called with (doc_id, exception) for each document that failed
+
+    Returns:
+        Mapping of document ID to the document resource for successful reads
+    """
+    from googleapiclient.errors import HttpError
+
+    documents: Dict[str, dict] = {}
+    if not doc_ids:
+        return documents
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            if on_error:
+                on_error(request_id, exception)
+            else:
+                logger.error(f"Error retrieving document {request_id}: {exception}")
+        else:
+            documents[request_id] = response
+
+    unique_ids = list(dict.fromkeys(doc_ids))
+    with docs_service() as service:
+        # A single document does not need the multipart batch envelope
+        if len(unique_ids) == 1:
+            kwargs = {'documentId': unique_ids[0]}
+            if fields:
+                kwargs['fields'] = fields
+            try:
+                callback(unique_ids[0], service.documents().get(**kwargs).execute(), None)
+            except HttpError as e:
+                callback(unique_ids[0], None, e)
+            return documents
+
+        for start in range(0, len(unique_ids), BATCH_LIMIT):
+            batch = service.new_batch_http_request(callback=callback)
+            for doc_id in unique_ids[start:start + BATCH_LIMIT]:
+                kwargs = {'documentId': doc_id}
+                if fields:
+                    kwargs['fields'] = fields
+                batch.add(service.documents().get(**kwargs), request_id=doc_id)
+            batch.execute()
+
+    return documents
@@ -0,0 +1,149 @@
+"""
+BM25 retrieval over knowledge base chunks.
+
+The index is built once when documents are ingested and then queried for
+every `!ask`. Query cost depends on the posting lists of the query terms,
+not on the size of the corpus.
+"""
+
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+from knowledge.extraction import Chunk
+
+# Words that appear in nearly every paragraph and carry no ranking signal
+STOPWORDS = frozenset("""
+a about an and are as at be but by can could do does for from how i if in
+into is it its me my of on or our should so that the their them then there
+these they this to was we were what when where which who why will with would
+you your s t
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def _stem(token: str) -> str:
+    """Strip the plural suffix so "internships" matches "internship"."""
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase search terms, dropping stopwords.
+
+    Args:
+        text: The text to tokenize
+
+    Returns:
+        The list of terms in the order they appear
+    """
+    return [_stem(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+class SearchIndex:
+    """
+    Inverted index with Okapi BM25 scoring.
+
+    Postings map each term to a list of (paragraph_id, term_frequency) pairs.
+    An index is never mutated after it is built, so a new one can be swapped
+    in while the old one keeps serving queries.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.paragraphs: List[str] = []
+        self.doc_ids: List[str] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        self.avg_length = 0.0
+
+    @classmethod
+    def build(cls, chunks: Iterable[Chunk], **kwargs) -> "SearchIndex":
+        """
+        Build an index from document chunks.
+
+        Args:
+            chunks: The chunks to index; each becomes one searchable paragraph
+
+        Returns:
+            SearchIndex: The populated index
+        """
+        index = cls(**kwargs)
+        postings = defaultdict(list)
+
+        for chunk in chunks:
+            paragraph = chunk.render()
+            paragraph_id = len(index.paragraphs)
+            terms = Counter(tokenize(paragraph))
+            for term, frequency in terms.items():
+                postings[term].append((paragraph_id, frequency))
+
+            index.paragraphs.append(paragraph)
+            index.doc_ids.append(chunk.doc_id)
+            index.lengths.append(sum(terms.values()))
+
+        index.postings = dict(postings)
+        if index.lengths:
+            index.avg_length = sum(index.lengths) / len(index.lengths)
+        return index
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the index to plain JSON-compatible data."""
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "paragraphs": self.paragraphs,
+            "doc_ids": self.doc_ids,
+            "lengths": self.lengths,
+            "postings": self.postings,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SearchIndex":
+        """Restore an index serialized with to_dict without re-tokenizing."""
+        index = cls(k1=data["k1"], b=data["b"])
+        index.paragraphs = data["paragraphs"]
+        index.doc_ids = data["doc_ids"]
+        index.lengths = data["lengths"]
+        index.postings = {term: [tuple(p) for p in postings] for term, postings in data["postings"].items()}
+        if index.lengths:
+            index.avg_length = sum(index.lengths) / len(index.lengths)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.paragraphs)
+
+    def idf(self, term: str) -> float:
+        """Inverse document frequency of a term (BM25+ style, never negative)."""
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.paragraphs) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, str]]:
+        """
+        Rank paragraphs against a query.
+
+        Args:
+            query: The user's question
+            k: Maximum number of results to return
+
+        Returns:
+            List of (score, paragraph) pairs, best match first
+        """
+        if not self.paragraphs:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for paragraph_id, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[paragraph_id] / self.avg_length)
+                scores[paragraph_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self.paragraphs[paragraph_id]) for paragraph_id, score in best]
@@ -0,0 +1,183 @@
+"""
+Versioned on-disk snapshot of the knowledge base.
+
+A snapshot holds the extracted document chunks, revision IDs, the Drive
+changes feed position and the prebuilt search index, so the bot can start
+answering questions without calling Google. The file is a small binary
+header followed by a JSON payload and is read through a memory map.
+
+Usage:
+    python -m knowledge.snapshot [--path PATH] build
+    python -m knowledge.snapshot [--path PATH] inspect
+    python -m knowledge.snapshot [--path PATH] search "question"
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from knowledge.extraction import Chunk
+from knowledge.search_index import SearchIndex
+from utils.logging_config import configure_logging
+
+SNAPSHOT_MAGIC = b"SHKS"
+# Bump whenever the payload layout changes; older snapshots are then ignored
+SNAPSHOT_VERSION = 2
+
+# magic, format version, payload length
+_HEADER = struct.Struct("<4sIQ")
+
+@dataclass
+class Snapshot:
+    """In-memory form of a knowledge snapshot."""
+    documents: Dict[str, List[Chunk]]
+    revisions: Dict[str, str]
+    index: SearchIndex
+    page_token: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, corrupt or from another version."""
+
+def save_snapshot(path: str, snapshot: Snapshot):
+    """
+    Write a snapshot atomically (readers never see a partial file).
+
+    Args:
+        path: Destination file path
+        snapshot: The snapshot to write
+    """
+    payload = json.dumps({
+        "created_at": snapshot.created_at,
+        "page_token": snapshot.page_token,
+        "documents": {
+            doc_id: [chunk.to_dict() for chunk in chunks]
+            for doc_id, chunks in snapshot.documents.items()
+        },
+        "revisions": snapshot.revisions,
+        "index": snapshot.index.to_dict(),
+    }, separators=(",", ":")).encode("utf-8")
+
+    # Unique per process so shard workers saving at the same time do not clobber each other
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(payload)))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def load_snapshot(path: str) -> Snapshot:
+    """
+    Read a snapshot from disk.
+
+    Args:
+        path: The snapshot file path
+
+    Returns:
+        Snapshot: The loaded snapshot
+
+    Raises:
+        SnapshotError: If the file is missing, corrupt or has a different version
+    """
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) < _HEADER.size:
+                raise SnapshotError("Snapshot file is truncated")
+            magic, version, length = _HEADER.unpack_from(mm)
+            if magic != SNAPSHOT_MAGIC:
+                raise SnapshotError("Not a knowledge snapshot")
+            if version != SNAPSHOT_VERSION:
+                raise SnapshotError(f"Snapshot version {version} does not match {SNAPSHOT_VERSION}")
+            if len(mm) < _HEADER.size + length:
+                raise SnapshotError("Snapshot file is truncated")
+            data = json.loads(mm[_HEADER.size:_HEADER.size + length])
+    except (OSError, ValueError) as e:
+        raise SnapshotError(str(e)) from e
+
+    return Snapshot(
+        documents={
+            doc_id: [Chunk.from_dict(chunk) for chunk in chunks]
+            for doc_id, chunks in data["documents"].items()
+        },
+        revisions=data["revisions"],
+        index=SearchIndex.from_dict(data["index"]),
+        page_token=data.get("page_token"),
+        created_at=data["created_at"],
+    )
+
+def _build(args):
+    """Fetch every configured document from Google and write a fresh snapshot."""
+    import asyncio
+    from knowledge import gdocs_client
+
+    asyncio.run(gdocs_client.refresh_knowledge(save=False))
+    snapshot = gdocs_client.current_snapshot()
+    # Failed fetches are cached as empty documents without a revision, so check what actually arrived
+    failed = [doc_id for doc_id in snapshot.documents if doc_id not in snapshot.revisions]
+    if not snapshot.revisions or not len(snapshot.index):
+        print("No documents could be fetched; snapshot not written", file=sys.stderr)
+        return 1
+    if failed:
+        print(f"Warning: could not fetch {len(failed)} document(s): {', '.join(failed)}", file=sys.stderr)
+    save_snapshot(args.path, snapshot)
+    print(f"Wrote {args.path}: {len(snapshot.documents)} document(s), {len(snapshot.index)} chunks")
+    return 0
+
+def _inspect(args):
+    """Print a summary of a snapshot file."""
+    start = time.perf_counter()
+    snapshot = load_snapshot(args.path)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    print(f"Snapshot:    {args.path} ({os.path.getsize(args.path)} bytes, version {SNAPSHOT_VERSION})")
+    print(f"Created:     {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.created_at))}")
+    print(f"Load time:   {elapsed:.1f} ms")
+    print(f"Page token:  {snapshot.page_token or '-'}")
+    print(f"Chunks:      {len(snapshot.index)}")
+    print(f"Terms:       {len(snapshot.index.postings)}")
+    print("Documents:")
+    for doc_id, chunks in snapshot.documents.items():
+        chars = sum(len(chunk.text) for chunk in chunks)
+        print(f"  {doc_id}  revision={snapshot.revisions.get(doc_id, '-')}  chunks={len(chunks)}  chars={chars}")
+    return 0
+
+def _search(args):
+    """Run a query against a snapshot's index."""
+    snapshot = load_snapshot(args.path)
+    for score, paragraph in snapshot.index.search(args.query, k=args.k):
+        print(f"[{score:.2f}] {paragraph}\n")
+    return 0
+
+def main(argv=None) -> int:
+    """Command-line entry point for building and inspecting snapshots."""
+    load_dotenv()
+    configure_logging(log_file="")
+    parser = argparse.ArgumentParser(prog="python -m knowledge.snapshot", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--path", default=os.getenv("KNOWLEDGE_SNAPSHOT_PATH", "knowledge_snapshot.bin"),
+                        help="Snapshot file (default: KNOWLEDGE_SNAPSHOT_PATH or knowledge_snapshot.bin)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="Fetch documents from Google and write a snapshot").set_defaults(func=_build)
+    subparsers.add_parser("inspect", help="Show what a snapshot contains").set_defaults(func=_inspect)
+    search_parser = subparsers.add_parser("search", help="Query a snapshot's search index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-k", type=int, default=5, help="Number of results")
+    search_parser.set_defaults(func=_search)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except SnapshotError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,11 @@
+from bot import startup  # First, so the boot-to-ready clock includes every other import
 import os
 import logging
 from dotenv import load_dotenv
 from bot.discord_client import run_bot
+from utils.logging_config import configure_logging
 import sys
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("bot.log")
-    ]
-)
 logger = logging.getLogger(__name__)
 
 def main():
@@ -23,6 +16,9 @@ def main():
     # Load environment variables from .env file
     load_dotenv()
     
+    # Console and bot.log, written by a background thread (see utils/logging_config.py)
+    configure_logging()
+    
     logger.info("Starting StudentHub Discord Bot")
     
     # Print environment variables for debugging (without showing actual values)
@@ -0,0 +1,30 @@
+from knowledge.extraction import iter_blocks
+
+def _item(text, nesting=0, list_id="list-1"):
+    return {"paragraph": {"elements": [{"textRun": {"content": text + "\n"}}],
+                          "bullet": {"listId": list_id, "nestingLevel": nesting}}}
+
+def _document(*content):
+    ordered = {"glyphType": "DECIMAL"}
+    return {"body": {"content": list(content)},
+            "lists": {"list-1": {"listProperties": {"nestingLevels": [ordered, ordered]}}}}
+
+def test_nested_list_numbering_restarts_under_each_item():
+    document = _document(
+        _item("first"),
+        _item("sub a", 1),
+        _item("sub b", 1),
+        _item("second"),
+        _item("sub c", 1),
+        _item("sub d", 1),
+        _item("third"),
+    )
+    assert [block.text for block in iter_blocks(document)] == [
+        "1. first",
+        "  1. sub a",
+        "  2. sub b",
+        "2. second",
+        "  1. sub c",
+        "  2. sub d",
+        "3. third",
+    ]
@@ -0,0 +1,42 @@
+import logging
+
+import pytest
+
+from web.linked_accounts import MemoryLinkedAccounts, SQLiteLinkedAccounts
+
+@pytest.fixture(params=["memory", "sqlite"])
+def accounts(request, tmp_path):
+    repository = MemoryLinkedAccounts() if request.param == "memory" else SQLiteLinkedAccounts(str(tmp_path / "links.db"))
+    yield repository
+    repository.close()
+
+def test_linking_a_studenthub_account_again_replaces_and_logs_the_old_link(accounts, caplog):
+    accounts.link(1, "student-a")
+    with caplog.at_level(logging.WARNING, logger="web.linked_accounts"):
+        accounts.link(2, "student-a")
+
+    assert accounts.get_discord_user_id("student-a") == 2
+    assert accounts.get_studenthub_user_id(1) is None
+    assert len(accounts) == 1
+    assert [record.getMessage() for record in caplog.records] == [
+        "StudentHub user student-a was linked to Discord user 1; that link was replaced by Discord user 2"
+    ]
+
+def test_relinking_a_discord_account_is_not_logged(accounts, caplog):
+    accounts.link(1, "student-a")
+    with caplog.at_level(logging.WARNING, logger="web.linked_accounts"):
+        accounts.link(1, "student-a")
+        accounts.link(1, "student-b")
+
+    assert accounts.get_studenthub_user_id(1) == "student-b"
+    assert accounts.get_discord_user_id("student-a") is None
+    assert caplog.records == []
+
+def test_replacements_within_one_import_are_logged(accounts, caplog):
+    with caplog.at_level(logging.WARNING, logger="web.linked_accounts"):
+        accounts.import_links([(1, "student-a"), (1, "student-b"), (2, "student-a"), (3, "student-b")])
+
+    assert dict(accounts.export_links()) == {2: "student-a", 3: "student-b"}
+    assert [record.getMessage() for record in caplog.records] == [
+        "StudentHub user student-b was linked to Discord user 1; that link was replaced by Discord user 3"
+    ]
@@ -0,0 +1,49 @@
+import asyncio
+
+from ai.openai_client import _close_stream
+from ai.scheduler import OpenAIScheduler
+
+class _FakeResponse:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+class _FakeStream:
+    """Like openai's AsyncStream: iterable, with an httpx response but no close()."""
+
+    def __init__(self, chunks):
+        self.response = _FakeResponse()
+        self._chunks = list(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        return self._chunks.pop(0)
+
+def test_abandoned_scheduled_stream_closes_response_and_frees_slot():
+    async def scenario():
+        scheduler = OpenAIScheduler(max_concurrency=1)
+        upstream = _FakeStream(["a", "b", "c"])
+
+        async def factory():
+            return upstream
+
+        stream = await scheduler.submit("guild", 10, factory, stream=True)
+        assert await stream.__anext__() == "a"
+        assert scheduler.stats()["in_flight"] == 1
+        await _close_stream(stream)
+        return upstream, scheduler.stats()["in_flight"]
+
+    upstream, in_flight = asyncio.run(scenario())
+    assert upstream.response.closed
+    assert in_flight == 0
+
+def test_bare_stream_response_is_closed():
+    upstream = _FakeStream(["a"])
+    asyncio.run(_close_stream(upstream))
+    assert upstream.response.closed
@@ -0,0 +1,91 @@
+"""
+A persistent asyncio event loop running in a background thread.
+
+Synchronous code such as Flask views can hand coroutines to it from any
+thread and wait for the result, instead of creating and closing an event
+loop for every call. Everything scheduled on it shares one loop, so
+loop-bound resources (clients, locks, connection pools) can be reused
+across requests.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Coroutine, Optional
+
+logger = logging.getLogger(__name__)
+
+class BackgroundLoop:
+    """An event loop started on first use in a daemon thread."""
+
+    def __init__(self, name: str = "background-loop"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, starting it if needed."""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                ready = threading.Event()
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._run, args=(self._loop, ready),
+                                                name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                logger.info(f"Started event loop thread {self.name}")
+            return self._loop
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine on the loop without waiting for it.
+
+        Args:
+            coro: The coroutine to run
+
+        Returns:
+            concurrent.futures.Future: The coroutine's eventual result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the loop and block until it finishes.
+
+        Args:
+            coro: The coroutine to run
+            timeout: Seconds to wait before cancelling it (None waits forever)
+
+        Returns:
+            The coroutine's result
+
+        Raises:
+            concurrent.futures.TimeoutError: If the timeout passes first
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self):
+        """Stop the loop and wait for its thread to exit."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
@@ -0,0 +1,236 @@
+"""
+Non-blocking logging with rotation, JSON records and sampling.
+
+`configure_logging` installs a single queue handler on the root logger.
+Records are put on a bounded in-memory queue, and a background listener
+thread formats and writes them to the console and the log file. A slow
+disk or terminal therefore never stalls the event loop. When the queue is
+full, records are dropped and counted instead of waiting.
+
+The log file rotates when it reaches LOG_MAX_BYTES and at every
+LOG_ROTATE_INTERVAL boundary, keeping LOG_BACKUP_COUNT numbered backups.
+
+High-volume messages opt into sampling with a key:
+
+    logger.info("Received question ...", extra={"sample": "ask"})
+
+With LOG_SAMPLING="ask=0.1", about one in ten of those records is kept.
+Warnings and errors are never sampled.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from utils.metrics import REGISTRY
+
+DEFAULT_LOG_FILE = "bot.log"
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_records_dropped = REGISTRY.counter("log_records_dropped_total",
+                                    "Log records not written: sampled out or the log queue was full")
+
+_lock = threading.Lock()
+_listeners: List[logging.handlers.QueueListener] = []
+_root_handler: Optional[logging.Handler] = None
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES and key != "sample":
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of INFO and DEBUG records tagged with a sample key."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None or record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(key, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        _records_dropped.inc(reason="sampled")
+        return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks: records that do not fit in the queue are dropped."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments and render any traceback now, while they are still valid,
+        # but leave the formatting to the listener's handlers
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _records_dropped.inc(reason="queue_full")
+
+class RotatingLogFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotates when the file would exceed `max_bytes` or when an `interval`
+    boundary (in UTC seconds since the epoch) has passed since the last write.
+    Backups are numbered: bot.log.1 is the most recent.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 0, interval: float = 0, backup_count: int = 5):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.interval = interval
+        # A file last written before the current interval is rotated on the first record
+        last_write = os.path.getmtime(self.baseFilename) if os.path.exists(self.baseFilename) else time.time()
+        self.rollover_at = self._next_boundary(last_write)
+
+    def _next_boundary(self, t: float) -> float:
+        return (t // self.interval + 1) * self.interval if self.interval > 0 else float("inf")
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self._next_boundary(time.time())
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """
+    Parse LOG_SAMPLING, e.g. "ask=0.1,token_purge=0".
+
+    Args:
+        spec: Comma-separated key=rate pairs, rates between 0 and 1
+
+    Returns:
+        Dict[str, float]: Sample rate per key
+    """
+    rates = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        key, rate = part.split("=", 1)
+        try:
+            rates[key.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            print(f"Ignoring invalid LOG_SAMPLING entry: {part.strip()}", file=sys.stderr)
+    return rates
+
+def rotating_file_handler(path: str) -> RotatingLogFileHandler:
+    """A file handler using the LOG_MAX_BYTES, LOG_ROTATE_INTERVAL and LOG_BACKUP_COUNT settings."""
+    return RotatingLogFileHandler(
+        path,
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        interval=float(os.getenv("LOG_ROTATE_INTERVAL", "86400")),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", "7")),
+    )
+
+def _formatter(kind: str) -> logging.Formatter:
+    return JsonFormatter() if kind == "json" else logging.Formatter(TEXT_FORMAT)
+
+def queued_handler(*handlers: logging.Handler, queue_size: Optional[int] = None) -> DroppingQueueHandler:
+    """
+    Wrap handlers so records are written by a background thread.
+
+    Args:
+        *handlers: The handlers that do the actual writing
+        queue_size: Maximum queued records (default LOG_QUEUE_SIZE)
+
+    Returns:
+        DroppingQueueHandler: The handler to attach to a logger
+    """
+    if queue_size is None:
+        queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    records: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    with _lock:
+        if not _listeners:
+            atexit.register(shutdown_logging)
+        _listeners.append(listener)
+    return DroppingQueueHandler(records)
+
+def configure_logging(level: Optional[str] = None, log_file: Optional[str] = None) -> logging.Handler:
+    """
+    Route the root logger through a background writer. Later calls return the existing handler.
+
+    Args:
+        level: Root log level (default LOG_LEVEL or INFO)
+        log_file: Log file path (default LOG_FILE or bot.log; empty for console only)
+
+    Returns:
+        logging.Handler: The queue handler installed on the root logger
+    """
+    global _root_handler
+    with _lock:
+        if _root_handler is not None:
+            return _root_handler
+
+    console = logging.StreamHandler()
+    console.setFormatter(_formatter(os.getenv("LOG_FORMAT", "text").lower()))
+    handlers: List[logging.Handler] = [console]
+
+    log_file = os.getenv("LOG_FILE", DEFAULT_LOG_FILE) if log_file is None else log_file
+    if log_file:
+        file_handler = rotating_file_handler(log_file)
+        file_handler.setFormatter(_formatter(os.getenv("LOG_FILE_FORMAT", "json").lower()))
+        handlers.append(file_handler)
+
+    handler = queued_handler(*handlers)
+    handler.addFilter(SamplingFilter(parse_sampling(os.getenv("LOG_SAMPLING", ""))))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    with _lock:
+        _root_handler = handler
+    return handler
+
+def shutdown_logging():
+    """Write out queued records and stop the background writers."""
+    with _lock:
+        listeners = list(_listeners)
+        _listeners.clear()
+    for listener in listeners:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
@@ -0,0 +1,299 @@
+"""
+In-process metrics: counters, gauges and latency histograms.
+
+Metrics live in a process-wide registry and are served in the Prometheus
+text format by `start_metrics_server`. Histograms keep cumulative buckets
+for Prometheus and a window of recent observations, from which p50, p95
+and p99 are reported as a companion summary (`<name>_recent`).
+
+`span(stage)` times one stage of a request into the `ask_stage_seconds`
+histogram. Inside `request_trace(...)` the spans are also collected and,
+when a trace log is configured, written as one JSON line per request.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("studenthub.trace")
+
+# Bucket upper bounds in seconds, from cache hits to slow completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, fn: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help = help
+        self._fn = fn
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+
+    def value(self, **labels) -> float:
+        """The current value for a label set (0 if never set)."""
+        if self._fn is not None:
+            return float(self._fn())
+        return self._values.get(_label_key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        if self._fn is not None:
+            try:
+                return [f"{self.name} {_format_value(self._fn())}"]
+            except Exception as e:
+                logger.error(f"Error collecting metric {self.name}: {e}")
+                return []
+        with self._lock:
+            items = list(self._values.items()) or [((), 0.0)]
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+class Counter(_Metric):
+    """A monotonically increasing count, optionally read from a callback."""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    """A value that can go up and down, optionally read from a callback."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+class Histogram(_Metric):
+    """Latency distribution with Prometheus buckets and recent-window quantiles."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS, window: int = 1024):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        # label key -> (bucket counts, sum, count, recent observations)
+        self._series: Dict[LabelKey, Tuple[List[int], List[float], Deque[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0.0], deque(maxlen=self.window))
+            counts, totals, recent = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            totals[0] += value
+            totals[1] += 1
+            recent.append(value)
+
+    def quantiles(self, **labels) -> Dict[float, float]:
+        """p50/p95/p99 over the recent window for a label set."""
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            recent = sorted(series[2]) if series else []
+        if not recent:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: recent[min(len(recent) - 1, int(q * len(recent)))] for q in QUANTILES}
+
+    def reset(self):
+        """Forget every observation (used between benchmark runs)."""
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), list(totals), sorted(recent))
+                      for key, (counts, totals, recent) in self._series.items()]
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts, totals, _ in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(totals[0])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {int(totals[1])}")
+
+        recent_name = f"{self.name}_recent"
+        lines += [f"# HELP {recent_name} {self.help} (last {self.window} observations)",
+                  f"# TYPE {recent_name} summary"]
+        for key, _, _, recent in series:
+            for q in QUANTILES:
+                value = recent[min(len(recent) - 1, int(q * len(recent)))] if recent else 0.0
+                lines.append(f"{recent_name}{_format_labels(key, [('quantile', str(q))])} {_format_value(value)}")
+            lines.append(f"{recent_name}_sum{_format_labels(key)} {_format_value(sum(recent))}")
+            lines.append(f"{recent_name}_count{_format_labels(key)} {len(recent)}")
+        return lines
+
+class Registry:
+    """Named metrics, created on first use and rendered together."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get(self, cls, name: str, help: str, **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, fn: Optional[Callable[[], float]] = None) -> Counter:
+        return self._get(Counter, name, help, fn=fn)
+
+    def gauge(self, name: str, help: str, fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._get(Gauge, name, help, fn=fn)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("ask_stage_seconds", "Time spent in each stage of answering a question")
+LOOP_LAG = REGISTRY.gauge("event_loop_lag_seconds", "How late the event loop ran a scheduled wake-up")
+
+# Stages recorded for the request being handled, if it is traced
+_current_trace: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("trace", default=None)
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time a stage of the current request.
+
+    Args:
+        stage: Stage name, used as the `stage` label
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace["stages"][stage] = round(trace["stages"].get(stage, 0.0) + elapsed, 6)
+
+@contextmanager
+def request_trace(kind: str, **fields) -> Iterator[Dict[str, Any]]:
+    """
+    Collect the spans of one request and time it as stage `kind`.
+
+    Args:
+        kind: Request type, e.g. "ask"
+        **fields: Extra fields for the trace log line
+
+    Yields:
+        Dict[str, Any]: The trace; callers may add fields such as an outcome
+    """
+    trace = {"kind": kind, "start": time.time(), "stages": {}, **fields}
+    token = _current_trace.set(trace)
+    try:
+        with span(kind):
+            yield trace
+    finally:
+        _current_trace.reset(token)
+        if trace_logger.handlers:
+            trace_logger.info(json.dumps(trace, default=str))
+
+def configure_trace_log(path: Optional[str]):
+    """
+    Write one JSON line per traced request to a file, from a background thread.
+    The file rotates like the main log (LOG_MAX_BYTES, LOG_ROTATE_INTERVAL, LOG_BACKUP_COUNT).
+
+    Args:
+        path: The trace log file; None or empty leaves tracing off
+    """
+    if not path or trace_logger.handlers:
+        return
+    from utils.logging_config import queued_handler, rotating_file_handler
+
+    file_handler = rotating_file_handler(path)
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(queued_handler(file_handler))
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+async def monitor_loop_lag(interval: float = 0.5):
+    """
+    Background task measuring event loop lag: how much later than requested a sleep wakes up.
+
+    Args:
+        interval: Seconds between measurements
+    """
+    lag_seconds = REGISTRY.histogram("event_loop_lag_observed_seconds", "Observed event loop lag",
+                                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        LOOP_LAG.set(lag)
+        lag_seconds.observe(lag)
+
+async def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """
+    Serve the registry at http://host:port/metrics.
+
+    Args:
+        port: Port to listen on
+        host: Interface to bind (local only by default)
+
+    Returns:
+        aiohttp.web.AppRunner: Call `cleanup()` on it to stop the server
+    """
+    from aiohttp import web
+
+    async def metrics(request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,87 @@
+"""
+Single-flight coalescing of concurrent identical async calls.
+
+While a call for a key is in flight, later callers with the same key wait
+for that call's result instead of starting their own. The shared work runs
+as its own task, so one waiter being cancelled does not cancel it for the
+others.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one in-flight task."""
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def _start(self, keys: List[Hashable], factory: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Run factory() as a task registered under every key until it finishes."""
+        task = asyncio.ensure_future(factory())
+        for key in keys:
+            self._inflight[key] = task
+
+        def done(finished: asyncio.Task):
+            for key in keys:
+                if self._inflight.get(key) is finished:
+                    del self._inflight[key]
+            # Mark the exception as retrieved even if every waiter went away
+            if not finished.cancelled():
+                finished.exception()
+
+        task.add_done_callback(done)
+        return task
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run factory() unless a call for the same key is already in flight.
+
+        Args:
+            key: Identifies identical calls
+            factory: Zero-argument callable returning the awaitable to run
+
+        Returns:
+            The result of the (possibly shared) call; its exception is raised to every waiter
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._start([key], factory)
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    async def do_batch(self, keys: Iterable[Hashable], factory: Callable[[List[Hashable]], Awaitable[Any]]):
+        """
+        Run one factory(new_keys) call for the keys that are not already in flight,
+        then wait until every requested key has finished.
+
+        Args:
+            keys: The keys needed by this caller
+            factory: Callable taking the list of keys to do work for
+
+        Raises:
+            Exception: The first exception raised by any of the calls waited on
+        """
+        keys = list(dict.fromkeys(keys))
+        self.calls += 1
+        new_keys = [key for key in keys if key not in self._inflight]
+        if len(new_keys) < len(keys):
+            self.shared += 1
+        if new_keys:
+            self._start(new_keys, lambda: factory(new_keys))
+
+        tasks = {id(task): task for task in (self._inflight.get(key) for key in keys) if task is not None}
+        if tasks:
+            await asyncio.gather(*(asyncio.shield(task) for task in tasks.values()))
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running."""
+        return len({id(task) for task in self._inflight.values()})
@@ -0,0 +1,355 @@
+"""
+Repository of linked Discord and StudentHub accounts.
+
+Each Discord account links to at most one StudentHub account and vice
+versa, and both directions are indexed, so lookups either way are O(1)
+(a hash lookup in memory, a primary-key or unique-index probe in SQLite).
+Batched lookups resolve many IDs at once, e.g. a whole guild's membership
+for role sync, and links can be bulk imported and exported as CSV.
+
+Usage:
+    python -m web.linked_accounts [--path FILE] export links.csv
+    python -m web.linked_accounts [--path FILE] import links.csv
+"""
+
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# Maximum IDs bound into one SQLite IN (...) query (older SQLite builds allow 999 variables)
+LOOKUP_BATCH_SIZE = 500
+
+T = TypeVar("T")
+
+def _batches(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _log_replaced_link(studenthub_user_id: str, old_discord_user_id: int, new_discord_user_id: int):
+    # Linking a StudentHub account to a new Discord account unlinks the old one, so leave a trace
+    logger.warning(f"StudentHub user {studenthub_user_id} was linked to Discord user {old_discord_user_id}; "
+                   f"that link was replaced by Discord user {new_discord_user_id}")
+
+class LinkedAccounts(ABC):
+    """Interface for linked-account repositories. Links are (discord_user_id, studenthub_user_id) pairs."""
+
+    def link(self, discord_user_id: int, studenthub_user_id: str):
+        """
+        Link two accounts, replacing any previous link of either one.
+        A StudentHub account's previous Discord link is logged as a warning when it is replaced.
+
+        Args:
+            discord_user_id: The Discord user ID
+            studenthub_user_id: The StudentHub user ID
+        """
+        self.import_links([(discord_user_id, studenthub_user_id)])
+
+    @abstractmethod
+    def unlink(self, discord_user_id: int) -> bool:
+        """
+        Remove the link of a Discord account.
+
+        Args:
+            discord_user_id: The Discord user ID
+
+        Returns:
+            bool: Whether a link was removed
+        """
+
+    def get_studenthub_user_id(self, discord_user_id: int) -> Optional[str]:
+        """The StudentHub user ID linked to a Discord user ID, if any."""
+        return self.get_studenthub_user_ids([discord_user_id]).get(discord_user_id)
+
+    def get_discord_user_id(self, studenthub_user_id: str) -> Optional[int]:
+        """The Discord user ID linked to a StudentHub user ID, if any."""
+        return self.get_discord_user_ids([studenthub_user_id]).get(studenthub_user_id)
+
+    @abstractmethod
+    def get_studenthub_user_ids(self, discord_user_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Resolve many Discord user IDs at once.
+
+        Args:
+            discord_user_ids: The Discord user IDs to look up
+
+        Returns:
+            Dict[int, str]: StudentHub user IDs for the Discord IDs that are linked
+        """
+
+    @abstractmethod
+    def get_discord_user_ids(self, studenthub_user_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        Resolve many StudentHub user IDs at once.
+
+        Args:
+            studenthub_user_ids: The StudentHub user IDs to look up
+
+        Returns:
+            Dict[str, int]: Discord user IDs for the StudentHub IDs that are linked
+        """
+
+    @abstractmethod
+    def import_links(self, links: Iterable[Tuple[int, str]]) -> int:
+        """
+        Add many links at once; later pairs replace earlier links of either account.
+        Each replaced Discord link of a StudentHub account is logged as a warning.
+
+        Args:
+            links: (discord_user_id, studenthub_user_id) pairs
+
+        Returns:
+            int: Number of pairs imported
+        """
+
+    @abstractmethod
+    def export_links(self) -> Iterator[Tuple[int, str]]:
+        """Iterate over all (discord_user_id, studenthub_user_id) links."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """The number of links."""
+
+    def close(self):
+        """Release any resources held by the repository."""
+
+class MemoryLinkedAccounts(LinkedAccounts):
+    """Process-local repository backed by a forward and a reverse dict."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_discord: Dict[int, str] = {}
+        self._by_studenthub: Dict[str, int] = {}
+
+    def unlink(self, discord_user_id: int) -> bool:
+        with self._lock:
+            studenthub_user_id = self._by_discord.pop(discord_user_id, None)
+            if studenthub_user_id is None:
+                return False
+            del self._by_studenthub[studenthub_user_id]
+            return True
+
+    def get_studenthub_user_ids(self, discord_user_ids: Iterable[int]) -> Dict[int, str]:
+        found = {}
+        for discord_user_id in discord_user_ids:
+            studenthub_user_id = self._by_discord.get(discord_user_id)
+            if studenthub_user_id is not None:
+                found[discord_user_id] = studenthub_user_id
+        return found
+
+    def get_discord_user_ids(self, studenthub_user_ids: Iterable[str]) -> Dict[str, int]:
+        found = {}
+        for studenthub_user_id in studenthub_user_ids:
+            discord_user_id = self._by_studenthub.get(studenthub_user_id)
+            if discord_user_id is not None:
+                found[studenthub_user_id] = discord_user_id
+        return found
+
+    def import_links(self, links: Iterable[Tuple[int, str]]) -> int:
+        count = 0
+        with self._lock:
+            for discord_user_id, studenthub_user_id in links:
+                # Drop the previous links of both accounts so the indexes stay one-to-one
+                old_studenthub = self._by_discord.pop(discord_user_id, None)
+                if old_studenthub is not None:
+                    del self._by_studenthub[old_studenthub]
+                old_discord = self._by_studenthub.pop(studenthub_user_id, None)
+                if old_discord is not None:
+                    del self._by_discord[old_discord]
+                    _log_replaced_link(studenthub_user_id, old_discord, discord_user_id)
+
+                self._by_discord[discord_user_id] = studenthub_user_id
+                self._by_studenthub[studenthub_user_id] = discord_user_id
+                count += 1
+        return count
+
+    def export_links(self) -> Iterator[Tuple[int, str]]:
+        with self._lock:
+            links = list(self._by_discord.items())
+        return iter(links)
+
+    def __len__(self) -> int:
+        return len(self._by_discord)
+
+class SQLiteLinkedAccounts(LinkedAccounts):
+    """Durable repository in a SQLite file (WAL mode, safe across processes)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # The primary key indexes Discord IDs and the unique constraint indexes StudentHub IDs
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS linked_accounts ("
+            " discord_user_id INTEGER PRIMARY KEY, studenthub_user_id TEXT NOT NULL UNIQUE,"
+            " linked_at REAL NOT NULL DEFAULT (strftime('%s', 'now')))"
+        )
+
+    def unlink(self, discord_user_id: int) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM linked_accounts WHERE discord_user_id = ?", (discord_user_id,)
+            ).rowcount > 0
+
+    def _lookup(self, query: str, ids: Sequence) -> List[Tuple]:
+        rows = []
+        with self._lock:
+            for batch in _batches(ids, LOOKUP_BATCH_SIZE):
+                placeholders = ", ".join("?" * len(batch))
+                rows.extend(self._conn.execute(query.format(placeholders), tuple(batch)).fetchall())
+        return rows
+
+    def get_studenthub_user_ids(self, discord_user_ids: Iterable[int]) -> Dict[int, str]:
+        ids = list(dict.fromkeys(discord_user_ids))
+        rows = self._lookup(
+            "SELECT discord_user_id, studenthub_user_id FROM linked_accounts WHERE discord_user_id IN ({})", ids
+        )
+        return dict(rows)
+
+    def get_discord_user_ids(self, studenthub_user_ids: Iterable[str]) -> Dict[str, int]:
+        ids = list(dict.fromkeys(studenthub_user_ids))
+        rows = self._lookup(
+            "SELECT studenthub_user_id, discord_user_id FROM linked_accounts WHERE studenthub_user_id IN ({})", ids
+        )
+        return dict(rows)
+
+    def import_links(self, links: Iterable[Tuple[int, str]]) -> int:
+        rows = [(int(discord_user_id), str(studenthub_user_id)) for discord_user_id, studenthub_user_id in links]
+        with self._lock:
+            # One transaction for the whole batch; OR REPLACE drops rows conflicting on either column
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._log_replaced_links(rows)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO linked_accounts (discord_user_id, studenthub_user_id) VALUES (?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def _log_replaced_links(self, rows: List[Tuple[int, str]]):
+        """Log the Discord links that importing `rows` will replace; runs inside the import transaction."""
+        studenthub_ids = list(dict.fromkeys(studenthub_user_id for _, studenthub_user_id in rows))
+        by_studenthub: Dict[str, int] = {}
+        for batch in _batches(studenthub_ids, LOOKUP_BATCH_SIZE):
+            placeholders = ", ".join("?" * len(batch))
+            by_studenthub.update(self._conn.execute(
+                "SELECT studenthub_user_id, discord_user_id FROM linked_accounts"
+                f" WHERE studenthub_user_id IN ({placeholders})", tuple(batch)
+            ).fetchall())
+        # Replay the batch so pairs that replace each other within it are logged as well
+        by_discord = {discord_user_id: studenthub_user_id for studenthub_user_id, discord_user_id in by_studenthub.items()}
+        for discord_user_id, studenthub_user_id in rows:
+            by_studenthub.pop(by_discord.pop(discord_user_id, None), None)
+            old_discord = by_studenthub.get(studenthub_user_id)
+            if old_discord is not None:
+                _log_replaced_link(studenthub_user_id, old_discord, discord_user_id)
+                del by_discord[old_discord]
+            by_studenthub[studenthub_user_id] = discord_user_id
+            by_discord[discord_user_id] = studenthub_user_id
+
+    def export_links(self) -> Iterator[Tuple[int, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT discord_user_id, studenthub_user_id FROM linked_accounts ORDER BY discord_user_id"
+            ).fetchall()
+        return iter(rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM linked_accounts").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_linked_accounts: Optional[LinkedAccounts] = None
+_linked_accounts_lock = threading.Lock()
+
+def open_linked_accounts(path: Optional[str] = None) -> LinkedAccounts:
+    """
+    Open a linked-account repository.
+
+    Args:
+        path: SQLite file to use; an in-memory repository is returned without one
+
+    Returns:
+        LinkedAccounts: The repository
+    """
+    return SQLiteLinkedAccounts(path) if path else MemoryLinkedAccounts()
+
+def get_linked_accounts() -> LinkedAccounts:
+    """
+    Get the process-wide linked-account repository, creating it on first use.
+
+    Links are stored in the SQLite file named by LINKED_ACCOUNTS_PATH, or
+    only in memory if it is not set.
+
+    Returns:
+        LinkedAccounts: The repository
+    """
+    global _linked_accounts
+    with _linked_accounts_lock:
+        if _linked_accounts is None:
+            _linked_accounts = open_linked_accounts(os.getenv("LINKED_ACCOUNTS_PATH"))
+        return _linked_accounts
+
+def _export(args, accounts: LinkedAccounts) -> int:
+    """Write all links to a CSV file."""
+    count = 0
+    with open(args.file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["discord_user_id", "studenthub_user_id"])
+        for link in accounts.export_links():
+            writer.writerow(link)
+            count += 1
+    print(f"Exported {count} link(s) to {args.file}")
+    return 0
+
+def _import(args, accounts: LinkedAccounts) -> int:
+    """Read links from a CSV file with discord_user_id and studenthub_user_id columns."""
+    with open(args.file, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        count = accounts.import_links(
+            (int(row["discord_user_id"]), row["studenthub_user_id"]) for row in reader
+        )
+    print(f"Imported {count} link(s) from {args.file}")
+    return 0
+
+def main(argv=None) -> int:
+    """Command-line entry point for bulk import and export of links."""
+    parser = argparse.ArgumentParser(prog="python -m web.linked_accounts",
+                                     description="Bulk import and export of linked accounts.")
+    parser.add_argument("--path", default=os.getenv("LINKED_ACCOUNTS_PATH", "linked_accounts.db"),
+                        help="SQLite file (default: LINKED_ACCOUNTS_PATH or linked_accounts.db)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Write all links to a CSV file")
+    export_parser.add_argument("file")
+    export_parser.set_defaults(func=_export)
+    import_parser = subparsers.add_parser("import", help="Add links from a CSV file")
+    import_parser.add_argument("file")
+    import_parser.set_defaults(func=_import)
+
+    args = parser.parse_args(argv)
+    accounts = SQLiteLinkedAccounts(args.path)
+    try:
+        return args.func(args, accounts)
+    except (OSError, KeyError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        accounts.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Load test for the /link-discord verification endpoint.
+
+Starts the Flask app on a local threaded server, issues a fresh link token
+for every request and fires them from concurrent clients. Each run reports
+requests/sec, latency percentiles and how many links succeeded. The
+`per-request-loop` runtime reproduces the previous design, which created
+and closed an event loop inside every request, for comparison with the
+shared background loop.
+
+Usage:
+    python -m web.loadtest --requests 2000 --concurrency 32
+    python -m web.loadtest --runtime shared
+"""
+
+import argparse
+import asyncio
+import http.client
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from werkzeug.serving import make_server
+
+from bot.token_store import get_token_store
+from web import verification_endpoint
+
+class _LoopPerRequest:
+    """The previous design: a new event loop created, installed and closed for every request."""
+
+    def run(self, coro, timeout=None):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+_shared_runtime = verification_endpoint.async_runtime
+
+RUNTIMES = {
+    "shared": lambda: _shared_runtime,
+    "per-request-loop": _LoopPerRequest,
+}
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def _login_cookie(port: int) -> str:
+    """Log in through the mock login route and return the session cookie."""
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("GET", "/login?next=/dashboard")
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.getheader("Set-Cookie").split(";", 1)[0]
+
+def run_load(runtime: str, requests: int, concurrency: int, port: int) -> Dict[str, float]:
+    """
+    Run one load test against a fresh server.
+
+    Args:
+        runtime: A key of RUNTIMES
+        requests: Total requests to send
+        concurrency: Number of concurrent clients
+        port: Local port for the server
+
+    Returns:
+        Dict[str, float]: Throughput, latency percentiles (ms) and outcome counts
+    """
+    verification_endpoint.async_runtime = RUNTIMES[runtime]()
+    server = make_server("127.0.0.1", port, verification_endpoint.app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    try:
+        cookie = _login_cookie(port)
+        store = get_token_store()
+        tokens = [store.issue(100000 + i, 600)[0] for i in range(requests)]
+        local = threading.local()
+
+        def send(token: str):
+            if not hasattr(local, "conn"):
+                local.conn = http.client.HTTPConnection("127.0.0.1", port)
+            start = time.perf_counter()
+            try:
+                local.conn.request("GET", f"/link-discord?token={token}", headers={"Cookie": cookie})
+                response = local.conn.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                local.conn.close()
+                del local.conn
+                return time.perf_counter() - start, False, True
+            return time.perf_counter() - start, b"Account Linked" in body, response.status != 200
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(send, tokens))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        server_thread.join()
+
+    latencies = sorted(latency * 1000 for latency, _, _ in results)
+    return {
+        "requests": requests,
+        "rps": requests / elapsed,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p99_ms": _percentile(latencies, 0.99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+        "linked": sum(1 for _, linked, _ in results if linked),
+        "errors": sum(1 for _, _, error in results if error),
+    }
+
+def main(argv=None) -> int:
+    """Command-line entry point for the load test."""
+    parser = argparse.ArgumentParser(prog="python -m web.loadtest", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runtime", choices=[*RUNTIMES, "both"], default="both",
+                        help="Async runtime used by the endpoint (default: compare both)")
+    parser.add_argument("--requests", type=int, default=1000, help="Total requests per run")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--port", type=int, default=5055, help="Local port for the test server")
+    args = parser.parse_args(argv)
+
+    # Per-request logging would dominate the measurement
+    logging.disable(logging.INFO)
+    runtimes = list(RUNTIMES) if args.runtime == "both" else [args.runtime]
+
+    print(f"{'runtime':<18} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'linked':>7} {'errors':>7}")
+    for runtime in runtimes:
+        result = run_load(runtime, args.requests, args.concurrency, args.port)
+        print(f"{runtime:<18} {result['rps']:>9.1f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+              f"{result['max_ms']:>8.2f} {result['linked']:>7} {result['errors']:>7}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,22 +8,31 @@ from flask import Flask, request, redirect, render_template, url_for, flash, ses
 import logging
 import os
 import sys
-import asyncio
 
 # Add the root directory to the Python path so we can import from bot
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from utils.background_loop import BackgroundLoop
+from utils.logging_config import configure_logging
 from web.verification_handler import verify_discord_link
 
-# Set up logging
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Set up logging: this module is the web app's entry point, and it logs to its own file
+configure_logging(log_file=os.getenv("WEB_LOG_FILE", "web.log"))
 logger = logging.getLogger(__name__)
 
+# The bot runs in another process, so confirmations can only reach it through the shared outbox file
+if not os.getenv("LINK_EVENTS_PATH"):
+    logger.warning("LINK_EVENTS_PATH is not set: accounts will be linked, but the bot will not send confirmation DMs")
+
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret-key")  # Change in production
 
+# One event loop shared by every request thread for the async verification code
+async_runtime = BackgroundLoop("verification-loop")
+# Seconds a request waits for verification before giving up
+VERIFY_TIMEOUT = float(os.getenv("VERIFY_TIMEOUT", "10"))
+
 @app.route('/link-discord')
 def link_discord():
     """
@@ -43,23 +52,21 @@ def link_discord():
     if not is_logged_in():
         # Store the token in the session and redirect to login
         session['pending_discord_token'] = token
-        logger.info("User not logged in, redirecting to login page")
+        logger.info("User not logged in, redirecting to login page", extra={"sample": "link_web"})
         return redirect(url_for('login', next=url_for('link_discord')))
     
     # Get the user's StudentHub ID from the session
     studenthub_user_id = get_user_id_from_session()
     
     try:
-        # Run the async verification function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        discord_user_id = loop.run_until_complete(
-            verify_discord_link(token, studenthub_user_id)
+        # Run the async verification function on the shared event loop
+        discord_user_id = async_runtime.run(
+            verify_discord_link(token, studenthub_user_id), timeout=VERIFY_TIMEOUT
         )
-        loop.close()
         
         if discord_user_id:
-            logger.info(f"Successfully linked Discord user {discord_user_id} to StudentHub user {studenthub_user_id}")
+            logger.info(f"Successfully linked Discord user {discord_user_id} to StudentHub user {studenthub_user_id}",
+                        extra={"sample": "link_web"})
             flash("Your Discord account has been successfully linked!", "success")
             return render_template('verification_success.html')
         else:
@@ -5,17 +5,18 @@ This is a mockup of what would be implemented on the StudentHub web server
 to handle the Discord account verification flow.
 """
 
+import asyncio
 import logging
-from typing import Optional, Dict
+from typing import Dict, Iterable, Optional
+
+from bot.link_events import publish_link_event
+from bot.token_store import get_token_store
+from web.linked_accounts import get_linked_accounts
 
-# Set up logging
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# In-memory storage for linked accounts: discord_id -> studenthub_user_id
-# In a real implementation, this would be stored in a database
-linked_accounts: Dict[int, str] = {}
+# Linked accounts, indexed both ways (stored in LINKED_ACCOUNTS_PATH when set)
+linked_accounts = get_linked_accounts()
 
 async def verify_discord_link(token: str, studenthub_user_id: str) -> Optional[int]:
     """
@@ -28,17 +29,19 @@ async def verify_discord_link(token: str, studenthub_user_id: str) -> Optional[i
     Returns:
         Optional[int]: The Discord user ID if verification was successful, None otherwise
     """
-    # Import the verification function here to avoid circular imports
-    from bot.discord_client import StudentHubBot
-    
     try:
-        # Verify the token and get the Discord user ID
-        discord_user_id = StudentHubBot.verify_token(token)
+        # Verify and consume the token; with TOKEN_STORE_PATH set this sees tokens issued by the bot process.
+        # A shared store takes a SQLite write lock, so keep it off the shared background loop
+        discord_user_id = await asyncio.to_thread(get_token_store().consume, token)
         
         # Link the Discord user ID to the StudentHub user ID
-        linked_accounts[discord_user_id] = studenthub_user_id
+        await asyncio.to_thread(linked_accounts.link, discord_user_id, studenthub_user_id)
+        
+        logger.info(f"Linked Discord user {discord_user_id} to StudentHub user {studenthub_user_id}",
+                    extra={"sample": "link_web"})
         
-        logger.info(f"Linked Discord user {discord_user_id} to StudentHub user {studenthub_user_id}")
+        # Ask the bot to send the confirmation DM (LINK_EVENTS_PATH connects the two processes)
+        await asyncio.to_thread(publish_link_event, discord_user_id, studenthub_user_id)
         
         return discord_user_id
     except ValueError as e:
@@ -55,7 +58,7 @@ def get_studenthub_user_id(discord_user_id: int) -> Optional[str]:
     Returns:
         Optional[str]: The StudentHub user ID if linked, None otherwise
     """
-    return linked_accounts.get(discord_user_id)
+    return linked_accounts.get_studenthub_user_id(discord_user_id)
 
 def get_discord_user_id(studenthub_user_id: str) -> Optional[int]:
     """
@@ -67,7 +70,16 @@ def get_discord_user_id(studenthub_user_id: str) -> Optional[int]:
     Returns:
         Optional[int]: The Discord user ID if linked, None otherwise
     """
-    for discord_id, sh_user_id in linked_accounts.items():
-        if sh_user_id == studenthub_user_id:
-            return discord_id
-    return None 
\ No newline at end of file
+    return linked_accounts.get_discord_user_id(studenthub_user_id)
+
+def get_studenthub_user_ids(discord_user_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Resolve many Discord user IDs at once, e.g. a guild's whole membership.
+    
+    Args:
+        discord_user_ids: The Discord user IDs to look up
+        
+    Returns:
+        Dict[int, str]: StudentHub user IDs for the Discord users that are linked
+    """
+    return linked_accounts.get_studenthub_user_ids(discord_user_ids)